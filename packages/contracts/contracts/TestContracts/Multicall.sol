@@ -0,0 +1,25 @@
+// SPDX-License-Identifier: MIT
+
+pragma solidity 0.6.11;
+pragma experimental ABIEncoderV2;
+
+/* Batches several read-only calls into one, so that off-chain tools (e.g. the simulation
+in tests/) can read the state of the system in a single round-trip.
+Not part of the Liquity application. */
+contract Multicall {
+    struct Call {
+        address target;
+        bytes callData;
+    }
+
+    function aggregate(Call[] memory _calls) external view returns (uint blockNumber, bytes[] memory returnData) {
+        blockNumber = block.number;
+        returnData = new bytes[](_calls.length);
+
+        for (uint i = 0; i < _calls.length; i++) {
+            (bool success, bytes memory data) = _calls[i].target.staticcall(_calls[i].callData);
+            require(success, "Multicall: call failed");
+            returnData[i] = data;
+        }
+    }
+}
@@ -0,0 +1,104 @@
+"""Interval index over the troves' inattention bands.
+
+A trove is left alone while its collateral ratio stays within its
+inattention band, which for a trove with ether quantity q and supply s is
+an ether price interval [low, high] proportional to s / q. The index keeps
+the lower and the upper bounds in two sorted arrays, so the troves a price
+leaves outside their band are found by binary search in O(log n + k)
+instead of checking every trove. Troves are identified by integer ids.
+Bands that change are merged into the arrays in one vectorised insertion
+per query. The old entries are left in place and skipped, until they
+outnumber the live ones and the arrays are rebuilt.
+"""
+
+import numpy as np
+
+
+class BandIndex:
+    def __init__(self):
+        self._lows = np.empty(0)  # ascending
+        self._low_ids = np.empty(0, dtype=np.int64)
+        self._highs = np.empty(0)  # ascending
+        self._high_ids = np.empty(0, dtype=np.int64)
+        # trove id -> its current band, NaN if not indexed
+        self._band_lows = np.full(1024, np.nan)
+        self._band_highs = np.full(1024, np.nan)
+        self._pending = []  # (ids, lows, highs) not merged yet
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def _reserve(self, max_id):
+        if max_id < self._band_lows.size:
+            return
+        size = self._band_lows.size
+        while size <= max_id:
+            size *= 2
+        for name in ("_band_lows", "_band_highs"):
+            grown = np.full(size, np.nan)
+            grown[:getattr(self, name).size] = getattr(self, name)
+            setattr(self, name, grown)
+
+    def set(self, ids, lows, highs):
+        """Index the troves `ids` with the price bands [`lows`, `highs`], replacing their previous bands."""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if ids.size == 0:
+            return
+        lows = np.broadcast_to(np.asarray(lows, dtype=float), ids.shape)
+        highs = np.broadcast_to(np.asarray(highs, dtype=float), ids.shape)
+        self._reserve(int(ids.max()))
+        self._live += int(np.count_nonzero(np.isnan(self._band_lows[ids])))
+        self._band_lows[ids] = lows
+        self._band_highs[ids] = highs
+        self._pending.append((ids, lows, highs))
+
+    def remove(self, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[ids < self._band_lows.size]
+        self._live -= int(np.count_nonzero(~np.isnan(self._band_lows[ids])))
+        self._band_lows[ids] = np.nan
+        self._band_highs[ids] = np.nan
+
+    def clear(self):
+        self.__init__()
+
+    def _merge(self):
+        if not self._pending:
+            return
+        ids = np.concatenate([batch[0] for batch in self._pending])
+        lows = np.concatenate([batch[1] for batch in self._pending])
+        highs = np.concatenate([batch[2] for batch in self._pending])
+        self._pending = []
+        if self._lows.size + ids.size > 2 * self._live + 64:
+            # mostly stale entries: keep only the current band of each trove
+            ids = np.flatnonzero(~np.isnan(self._band_lows))
+            lows, highs = self._band_lows[ids], self._band_highs[ids]
+            self._lows, self._low_ids = self._lows[:0], self._low_ids[:0]
+            self._highs, self._high_ids = self._highs[:0], self._high_ids[:0]
+        self._lows, self._low_ids = self._insert(self._lows, self._low_ids, lows, ids)
+        self._highs, self._high_ids = self._insert(self._highs, self._high_ids, highs, ids)
+
+    @staticmethod
+    def _insert(bounds, bound_ids, new_bounds, new_ids):
+        order = np.argsort(new_bounds, kind="stable")
+        new_bounds, new_ids = new_bounds[order], new_ids[order]
+        at = np.searchsorted(bounds, new_bounds, side="right")
+        return np.insert(bounds, at, new_bounds), np.insert(bound_ids, at, new_ids)
+
+    def exits(self, price, margin=1e-9):
+        """Ids of the troves whose band `price` is outside of, or within `margin` (relative) of its bounds.
+
+        The caller decides on the troves near a bound with its own test.
+        """
+        self._merge()
+        below = np.searchsorted(self._lows, price * (1 - margin), side="right")
+        ids = self._low_ids[below:]
+        lows = self._lows[below:]
+        above = np.searchsorted(self._highs, price * (1 + margin), side="left")
+        high_ids = self._high_ids[:above]
+        highs = self._highs[:above]
+        # skip the entries of bands that were replaced or removed since
+        ids = ids[self._band_lows[ids] == lows]
+        high_ids = high_ids[self._band_highs[high_ids] == highs]
+        return np.union1d(ids, high_ids)
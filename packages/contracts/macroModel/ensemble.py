@@ -0,0 +1,82 @@
+"""Monte Carlo ensembles of the macro model.
+
+One run of `macro_model.simulate` is one path. Tail events (a ZSUSD depeg,
+an exhausted stability pool, the liquidity pool going negative) need many
+paths, so `run_ensemble` runs the hourly loop for many seeds in a process
+pool:
+
+    table = run_ensemble(1000, "policy", workers=8)
+
+Each path gets its own seed, spawned from the base seed, so an ensemble is
+reproducible regardless of the number of workers or the order in which paths
+finish. Workers only send back a small dict of summary statistics per path,
+never the step frames, so throughput scales with the number of cores.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import macro_model
+from sim_random import SimRandom
+
+# scenario name -> `policy` argument of macro_model.simulate
+SCENARIOS = {"baseline": False, "policy": True}
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+def summarise_path(data):
+    """Summary statistics of one run from its per-step data."""
+    price = data["Price_ZSUSD"]
+    return {
+        "steps": len(data),
+        "price_final": price.iloc[-1],
+        "price_min": price.min(),
+        "price_max": price.max(),
+        "price_max_deviation": (price - 1).abs().max(),
+        "supply_final": data["supply_ZSUSD"].iloc[-1],
+        "supply_max": data["supply_ZSUSD"].max(),
+        "n_troves_final": data["n_troves"].iloc[-1],
+        "n_troves_max": data["n_troves"].max(),
+        "issuance_fees": data["issuance_fee"].sum(),
+        "redemption_fees": data["redemption_fee"].sum(),
+        "stability_min": data["stability"].min(),
+        "liquidity_min": data["liquidity"].min(),
+    }
+
+
+def run_path(scenario, seed, n_steps=None):
+    """Run one path of `scenario` with `seed` and return its summary."""
+    macro_model.reseed(seed)
+    data, _ = macro_model.simulate(SCENARIOS[scenario], n_steps)
+    return summarise_path(data)
+
+
+def path_seeds(n_paths, seed=None):
+    """Seeds of the first `n_paths` paths spawned from `seed` (the model seed by default)."""
+    if seed is None:
+        seed = macro_model.seed
+    return [child.seed for child in SimRandom(seed).spawn(n_paths)]
+
+
+def iter_ensemble(n_paths, scenario="baseline", workers=None, seed=None, n_steps=None):
+    """Yield the summary of each path as soon as it finishes, tagged with its path number and seed."""
+    if scenario not in SCENARIOS:
+        raise ValueError(f"unknown scenario {scenario!r}, expected one of {sorted(SCENARIOS)}")
+    seeds = path_seeds(n_paths, seed)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(run_path, scenario, path_seed, n_steps): path for path, path_seed in enumerate(seeds)}
+        for future in as_completed(futures):
+            path = futures[future]
+            yield {"path": path, "seed": seeds[path], **future.result()}
+
+
+def run_ensemble(n_paths, scenario="baseline", workers=None, seed=None, n_steps=None, quantiles=QUANTILES):
+    """Run `n_paths` paths of `scenario` and return the quantiles of every summary statistic.
+
+    The table has one row per statistic and one column per quantile.
+    """
+    summaries = pd.DataFrame(iter_ensemble(n_paths, scenario, workers, seed, n_steps))
+    summaries = summaries.sort_values("path").set_index("path").drop(columns="seed")
+    return summaries.quantile(list(quantiles)).T
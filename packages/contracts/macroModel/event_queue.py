@@ -0,0 +1,130 @@
+"""Scheduled trove events over a precomputed ether price path.
+
+With the ether price known in advance for every step, the step at which a
+trove next needs looking at, because the price falls to its liquidation
+price or leaves its inattention band, can be found when the trove changes
+rather than by checking it every step. `PricePath` finds that step, the
+first one at which the price leaves a given interval, in O(log n) from
+sparse tables of the path's running minima and maxima. `EventQueue` keeps
+the troves in a priority queue on that step, so each step only pops the
+troves due at it. Troves are identified by integer ids; a trove scheduled
+again keeps its old entry in the queue, which is skipped when popped.
+"""
+
+import heapq
+
+import numpy as np
+
+
+class PricePath:
+    def __init__(self, prices):
+        self.prices = np.asarray(prices, dtype=float)
+        n = self.prices.size
+        # level k holds the minimum (maximum) of the 2**k prices from each step on
+        self._mins = [self.prices]
+        self._maxs = [self.prices]
+        for k in range(1, max(n.bit_length(), 1)):
+            half = 1 << (k - 1)
+            previous_min, previous_max = self._mins[-1], self._maxs[-1]
+            self._mins.append(np.minimum(previous_min[:-half], previous_min[half:]))
+            self._maxs.append(np.maximum(previous_max[:-half], previous_max[half:]))
+        # the same as lists, for the few troves at a time most steps schedule
+        self._min_lists = [level.tolist() for level in self._mins]
+        self._max_lists = [level.tolist() for level in self._maxs]
+
+    def __len__(self):
+        return self.prices.size
+
+    def first_exit(self, start, lows, highs):
+        """First step from `start` on whose price is below `lows` or above `highs`, per trove; len(self) if none."""
+        n = self.prices.size
+        lows, highs = np.broadcast_arrays(np.asarray(lows, dtype=float), np.asarray(highs, dtype=float))
+        steps = np.full(lows.shape, min(max(int(start), 0), n), dtype=np.int64)
+        if n == 0:
+            return steps
+        if steps.size <= 16:
+            return np.array([self._first_exit(int(steps.flat[0]), low, high)
+                             for low, high in zip(lows.ravel().tolist(), highs.ravel().tolist())],
+                            dtype=np.int64).reshape(steps.shape)
+        # the longest stretch within [low, high], taken in blocks of decreasing powers of two
+        for k in reversed(range(len(self._mins))):
+            width = 1 << k
+            fits = steps + width <= n
+            at = np.minimum(steps, n - width)
+            inside = fits & (self._mins[k][at] >= lows) & (self._maxs[k][at] <= highs)
+            steps = np.where(inside, steps + width, steps)
+        return steps
+
+    def _first_exit(self, step, low, high):
+        n = self.prices.size
+        for k in reversed(range(len(self._min_lists))):
+            width = 1 << k
+            if step + width <= n and self._min_lists[k][step] >= low and self._max_lists[k][step] <= high:
+                step += width
+        return step
+
+
+class EventQueue:
+    def __init__(self, prices):
+        self.path = PricePath(prices)
+        self._heap = []
+        # trove id -> step it is due at, -1 if not scheduled
+        self._steps = np.full(1024, -1, dtype=np.int64)
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def _reserve(self, max_id):
+        if max_id < self._steps.size:
+            return
+        size = self._steps.size
+        while size <= max_id:
+            size *= 2
+        steps = np.full(size, -1, dtype=np.int64)
+        steps[:self._steps.size] = self._steps
+        self._steps = steps
+
+    def schedule(self, ids, lows, highs, start):
+        """Schedule the troves `ids` at the first step from `start` on whose price is outside [`lows`, `highs`]."""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        if ids.size == 0:
+            return
+        lows = np.broadcast_to(np.asarray(lows, dtype=float), ids.shape)
+        highs = np.broadcast_to(np.asarray(highs, dtype=float), ids.shape)
+        self._reserve(int(ids.max()))
+        steps = self.path.first_exit(start, lows, highs)
+        self.remove(ids)
+        # a trove the path never takes out of its interval is not due at all
+        due = steps < len(self.path)
+        ids, steps = ids[due], steps[due]
+        self._steps[ids] = steps
+        self._live += ids.size
+        for trove_id, step in zip(ids.tolist(), steps.tolist()):
+            heapq.heappush(self._heap, (step, trove_id))
+        if len(self._heap) > 2 * self._live + 64:
+            self._rebuild()
+
+    def remove(self, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[ids < self._steps.size]
+        self._live -= int(np.count_nonzero(self._steps[ids] >= 0))
+        self._steps[ids] = -1
+
+    def pop_due(self, step):
+        """Remove and return the ids of the troves due at `step` or before."""
+        ids = []
+        while self._heap and self._heap[0][0] <= step:
+            due, trove_id = heapq.heappop(self._heap)
+            if self._steps[trove_id] != due:
+                # stale: removed, or scheduled again
+                continue
+            self._steps[trove_id] = -1
+            self._live -= 1
+            ids.append(trove_id)
+        return np.array(ids, dtype=np.int64)
+
+    def _rebuild(self):
+        ids = np.flatnonzero(self._steps >= 0)
+        self._heap = list(zip(self._steps[ids].tolist(), ids.tolist()))
+        heapq.heapify(self._heap)
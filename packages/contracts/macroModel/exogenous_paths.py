@@ -0,0 +1,89 @@
+"""Pregenerated exogenous series: ether price, natural rate and first-month ZERO price.
+
+All three series are multiplicative random walks,
+
+    x[0] = initial,    x[i] = x[i-1] * (1 + shock[i]) * (1 + drift[i]),
+
+where the drift follows a piecewise-constant regime schedule. A whole path
+is built at once from one bulk draw of normal shocks and a single
+cumulative product, and `n_paths` independent paths come back as a
+(n_paths, n_steps) array for Monte Carlo use.
+
+The cumulative product runs over the interleaved factors
+[x0, 1+shock[1], 1+drift[1], 1+shock[2], ...], which multiplies in exactly
+the order of the step-by-step loop, so `legacy=True` reproduces the values
+of the original per-step `random.seed(...)` / `random.normalvariate`
+construction bit for bit.
+"""
+
+import random
+
+import numpy as np
+
+from sim_random import SimRandom
+
+# seed(i) of the original per-step construction, per series
+LEGACY_SEEDS = {
+    "ether_price": lambda i: 2019375 + 10000 * i,
+    "natural_rate": lambda i: 201597 + 10 * i,
+    "price_ZERO": lambda i: 2 + 13 * i,
+}
+
+
+def regime_drifts(regimes, n_steps):
+    """Per-step drift vector for a schedule of (end_step, drift) regimes.
+
+    Step i gets the drift of the first regime with i < end_step; steps past
+    the last regime keep its drift.
+    """
+    drifts = np.zeros(n_steps)
+    start = 0
+    drift = 0
+    for end, drift in regimes:
+        drifts[start:end] = drift
+        start = end
+    drifts[start:] = drift
+    return drifts
+
+
+def random_walk(initial, shocks, drifts=0):
+    """Multiplicative random walk over the last axis of `shocks` (shocks[..., 0] is unused)."""
+    shocks = np.asarray(shocks, dtype=np.float64)
+    n_steps = shocks.shape[-1]
+    factors = np.empty(shocks.shape[:-1] + (2 * n_steps - 1,))
+    factors[..., 0] = initial
+    factors[..., 1::2] = 1 + shocks[..., 1:]
+    factors[..., 2::2] = 1 + np.broadcast_to(drifts, (n_steps,))[1:]
+    return np.multiply.accumulate(factors, axis=-1)[..., ::2]
+
+
+class ExogenousPaths:
+    def __init__(self, rng=None, legacy=False):
+        self.rng = rng if rng is not None else SimRandom()
+        self.legacy = legacy
+
+    def shocks(self, name, sd, n_steps, n_paths=None):
+        """Normal shocks of the series `name`, one row per path when `n_paths` is given."""
+        if self.legacy:
+            if n_paths is not None:
+                raise ValueError("legacy mode only reproduces the single original path")
+            seed = LEGACY_SEEDS[name]
+            generator = random.Random()
+            shocks = np.zeros(n_steps)
+            for i in range(1, n_steps):
+                generator.seed(seed(i))
+                shocks[i] = generator.normalvariate(0, sd)
+            return shocks
+        if n_paths is None:
+            return self.rng.stream(name).normal(0, sd, n_steps)
+        return np.stack([self.rng.stream(name, path).normal(0, sd, n_steps) for path in range(n_paths)])
+
+    def ether_price(self, initial, sd, regimes, n_steps, n_paths=None):
+        drifts = regime_drifts(regimes, n_steps)
+        return random_walk(initial, self.shocks("ether_price", sd, n_steps, n_paths), drifts)
+
+    def natural_rate(self, initial, sd, n_steps, n_paths=None):
+        return random_walk(initial, self.shocks("natural_rate", sd, n_steps, n_paths))
+
+    def price_ZERO(self, initial, sd, drift, n_steps, n_paths=None):
+        return random_walk(initial, self.shocks("price_ZERO", sd, n_steps, n_paths), drift)
@@ -0,0 +1,76 @@
+"""Liquidation-price index for the macro model's troves.
+
+A trove with ether quantity q and supply s falls below the liquidation ratio
+r once the ether price drops to r * s / q, its liquidation price. The index
+keeps the troves in a max-heap on that price, so the troves a price move
+liquidates are popped from the top in O(k log n), without computing every
+trove's collateral ratio. Troves are identified by ids that do not change
+when the book is compacted or reordered. A trove whose price changes is
+pushed again and its old entry is skipped when it reaches the top; the heap
+is rebuilt once stale entries outnumber the live ones.
+"""
+
+import heapq
+
+import numpy as np
+
+
+class LiquidationIndex:
+    def __init__(self):
+        self._heap = []
+        # trove id -> its current liquidation price, NaN if not indexed
+        self._prices = np.full(1024, np.nan)
+        self._live = 0
+
+    def __len__(self):
+        return self._live
+
+    def _reserve(self, max_id):
+        if max_id < self._prices.size:
+            return
+        size = self._prices.size
+        while size <= max_id:
+            size *= 2
+        prices = np.full(size, np.nan)
+        prices[:self._prices.size] = self._prices
+        self._prices = prices
+
+    def set(self, ids, prices):
+        """Index the troves `ids` at their liquidation `prices`, replacing any previous price."""
+        ids = np.atleast_1d(np.asarray(ids, dtype=np.int64))
+        prices = np.broadcast_to(np.asarray(prices, dtype=float), ids.shape)
+        if ids.size == 0:
+            return
+        self._reserve(int(ids.max()))
+        self._live += int(np.count_nonzero(np.isnan(self._prices[ids])))
+        self._prices[ids] = prices
+        for trove_id, price in zip(ids.tolist(), prices.tolist()):
+            heapq.heappush(self._heap, (-price, trove_id))
+        if len(self._heap) > 2 * self._live + 64:
+            self._rebuild()
+
+    def remove(self, ids):
+        ids = np.unique(np.asarray(ids, dtype=np.int64))
+        ids = ids[ids < self._prices.size]
+        self._live -= int(np.count_nonzero(~np.isnan(self._prices[ids])))
+        self._prices[ids] = np.nan
+
+    def pop_above(self, ether_price):
+        """Remove and return the ids and prices of the troves whose liquidation price is at least `ether_price`."""
+        ids, prices = [], []
+        while self._heap and -self._heap[0][0] >= ether_price:
+            price, trove_id = heapq.heappop(self._heap)
+            price = -price
+            if self._prices[trove_id] != price:
+                # stale: removed, or indexed again at another price
+                continue
+            self._prices[trove_id] = np.nan
+            self._live -= 1
+            ids.append(trove_id)
+            prices.append(price)
+        return np.array(ids, dtype=np.int64), np.array(prices, dtype=float)
+
+    def _rebuild(self):
+        ids = np.flatnonzero(~np.isnan(self._prices))
+        self._heap = list(zip((-self._prices[ids]).tolist(), ids.tolist()))
+        heapq.heapify(self._heap)
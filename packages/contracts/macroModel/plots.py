@@ -0,0 +1,464 @@
+"""Figures of the macro model, drawn from saved simulation results.
+
+Plotting is a separate stage, so simulation runs never build figures:
+
+    python macro_model.py --save results --no-plot
+    python plots.py results
+
+`results` is the directory the simulation wrote its frames to (see
+`macro_model.save_results`).
+"""
+
+import argparse
+
+import matplotlib.pyplot as plt
+import plotly.express as px
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+from macro_model import load_results
+
+TROVE_MEASURES = ("Ether_Quantity", "CR_initial", "Supply", "Rational_inattention", "CR_current")
+
+
+def linevis(data, measure):
+    fig = px.line(data, x=data.index/720, y=measure, title= measure+' dynamics')
+    fig.show()
+
+
+def trove_histogram(troves, measure):
+    fig = px.histogram(troves, x=measure, title='Distribution of '+measure, nbins=25)
+    fig.show()
+
+
+def plot_run(data, troves):
+    """Figures of one run: its step data and the troves left at the end."""
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['Price_ZSUSD'], name="ZSUSD Price"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['Price_Ether'], name="Ether Price"),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Price Dynamics of ZSUSD and Ether"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="ZSUSD Price", secondary_y=False)
+    fig.update_yaxes(title_text="Ether Price", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_troves'], name="Number of Troves"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['supply_ZSUSD'], name="ZSUSD Supply"),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Trove Numbers and ZSUSD Supply"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Number of Troves", secondary_y=False)
+    fig.update_yaxes(title_text="ZSUSD Supply", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(rows=2, cols=1)
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_open'], name="Number of Troves Opened", mode='markers'),
+        row=1, col=1, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_close'], name="Number of Troves Closed", mode='markers'),
+        row=2, col=1, secondary_y=False
+    )
+    fig.update_layout(
+        title_text="Dynamics of Number of Troves Opened and Closed"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Troves Opened", row=1, col=1)
+    fig.update_yaxes(title_text="Troves Closed", row=2, col=1)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_liquidate'], name="Number of Liquidated Troves", mode='markers'),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_redempt'], name="Number of Redempted Troves", mode='markers'),
+        secondary_y=False,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Number of Liquidated and Redempted Troves"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Number of Liquidated Troves", secondary_y=False)
+    fig.update_yaxes(title_text="Number of Redempted Troves", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['liquidity'], name="Liquidity Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['stability'], name="Stability Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=100*data['redemption_pool'], name="100*Redemption Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['return_stability'], name="Return of Stability Pool"),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Liquidity, Stability, Redemption Pools and Return of Stability Pool"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Size of Pools", secondary_y=False)
+    fig.update_yaxes(title_text="Return", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['airdrop_gain'], name="Airdrop Gain"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['liquidation_gain'], name="Liquidation Gain"),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Airdrop and Liquidation Gain"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Airdrop Gain", secondary_y=False)
+    fig.update_yaxes(title_text="Liquidation Gain", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['issuance_fee'], name="Issuance Fee"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['redemption_fee'], name="Redemption Fee"),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Issuance Fee and Redemption Fee"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Issuance Fee", secondary_y=False)
+    fig.update_yaxes(title_text="Redemption Fee", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['price_ZERO'], name="ZERO Price"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['MC_ZERO'], name="ZERO Market Cap"),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of the Price and Market Cap of ZERO"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="ZERO Price", secondary_y=False)
+    fig.update_yaxes(title_text="ZERO Market Cap", secondary_y=True)
+    fig.show()
+
+    for measure in TROVE_MEASURES:
+        trove_histogram(troves, measure)
+
+    plt.plot(troves["Ether_Quantity"])
+    plt.show()
+
+    plt.plot(troves["CR_initial"])
+    plt.show()
+
+    plt.plot(troves["Supply"])
+    plt.show()
+
+    plt.plot(troves["CR_current"])
+    plt.show()
+
+
+def plot_comparison(data, data2, troves2):
+    """Figures comparing a baseline run (`data`) with a policy function run (`data2`, `troves2`)."""
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['Price_ZSUSD'], name="ZSUSD Price"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['Price_Ether'], name="Ether Price"),
+        secondary_y=True,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['Price_ZSUSD'], name="ZSUSD Price New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.update_layout(
+        title_text="Price Dynamics of ZSUSD and Ether"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="ZSUSD Price", secondary_y=False)
+    fig.update_yaxes(title_text="Ether Price", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_troves'], name="Number of Troves"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['supply_ZSUSD'], name="ZSUSD Supply"),
+        secondary_y=True,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['n_troves'], name="Number of Troves New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['supply_ZSUSD'], name="ZSUSD Supply New", line = dict(dash='dot')),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Trove Numbers and ZSUSD Supply"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Number of Troves", secondary_y=False)
+    fig.update_yaxes(title_text="ZSUSD Supply", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(rows=2, cols=2)
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_open'], name="Number of Troves Opened", mode='markers'),
+        row=1, col=1, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_close'], name="Number of Troves Closed", mode='markers'),
+        row=2, col=1, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['n_open'], name="Number of Troves Opened New", mode='markers'),
+        row=1, col=2, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['n_close'], name="Number of Troves Closed New", mode='markers'),
+        row=2, col=2, secondary_y=False
+    )
+    fig.update_layout(
+        title_text="Dynamics of Number of Troves Opened and Closed"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Troves Opened", row=1, col=1)
+    fig.update_yaxes(title_text="Troves Closed", row=2, col=1)
+    fig.show()
+
+    fig = make_subplots(rows=2, cols=1)
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_liquidate'], name="Number of Liquidated Troves"),
+        row=1, col=1, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['n_redempt'], name="Number of Redempted Troves"),
+        row=2, col=1, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['n_liquidate'], name="Number of Liquidated Troves New", line = dict(dash='dot')),
+        row=1, col=1, secondary_y=False
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['n_redempt'], name="Number of Redempted Troves New", line = dict(dash='dot')),
+        row=2, col=1, secondary_y=False
+    )
+    fig.update_layout(
+        title_text="Dynamics of Number of Liquidated and Redempted Troves"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Troves Liquidated", row=1, col=1)
+    fig.update_yaxes(title_text="Troves Redempted", row=2, col=1)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['liquidity'], name="Liquidity Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['stability'], name="Stability Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=100*data['redemption_pool'], name="100*Redemption Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['liquidity'], name="Liquidity Pool New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['stability'], name="Stability Pool New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=100*data2['redemption_pool'], name="100*Redemption Pool New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Liquidity, Stability, Redemption Pools and Return of Stability Pool"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Size of Pools", secondary_y=False)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['return_stability'], name="Return of Stability Pool"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['return_stability'], name="Return of Stability Pool New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Liquidity, Stability, Redemption Pools and Return of Stability Pool"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Return", secondary_y=False)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['airdrop_gain'], name="Airdrop Gain"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['liquidation_gain'], name="Liquidation Gain"),
+        secondary_y=True,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['airdrop_gain'], name="Airdrop Gain New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['liquidation_gain'], name="Liquidation Gain New", line = dict(dash='dot')),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Airdrop and Liquidation Gain"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Airdrop Gain", secondary_y=False)
+    fig.update_yaxes(title_text="Liquidation Gain", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(rows=2, cols=1)
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['issuance_fee'], name="Issuance Fee"),
+        row=1, col=1
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['redemption_fee'], name="Redemption Fee"),
+        row=2, col=1
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['issuance_fee'], name="Issuance Fee New", line = dict(dash='dot')),
+        row=1, col=1
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['redemption_fee'], name="Redemption Fee New", line = dict(dash='dot')),
+        row=2, col=1
+    )
+    fig.update_layout(
+        title_text="Dynamics of Issuance Fee and Redemption Fee"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Issuance Fee", secondary_y=False, row=1, col=1)
+    fig.update_yaxes(title_text="Redemption Fee", secondary_y=False, row=2, col=1)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['annualized_earning'], name="Annualized Earning"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['annualized_earning'], name="Annualized Earning New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Annualized Earning"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Annualized Earning", secondary_y=False)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['price_ZERO'], name="ZERO Price"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=data['MC_ZERO'], name="ZERO Market Cap"),
+        secondary_y=True,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['price_ZERO'], name="ZERO Price New", line = dict(dash='dot')),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['MC_ZERO'], name="ZERO Market Cap New", line = dict(dash='dot')),
+        secondary_y=True,
+    )
+    fig.update_layout(
+        title_text="Dynamics of the Price and Market Cap of ZERO"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="ZERO Price", secondary_y=False)
+    fig.update_yaxes(title_text="ZERO Market Cap", secondary_y=True)
+    fig.show()
+
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Scatter(x=data.index/720, y=[0.01] * len(data), name="Base Rate"),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(x=data2.index/720, y=data2['base_rate'], name="Base Rate New"),
+        secondary_y=False,
+    )
+    fig.update_layout(
+        title_text="Dynamics of Issuance Fee and Redemption Fee"
+    )
+    fig.update_xaxes(tick0=0, dtick=1, title_text="Month")
+    fig.update_yaxes(title_text="Issuance Fee", secondary_y=False)
+    fig.update_yaxes(title_text="Redemption Fee", secondary_y=True)
+    fig.show()
+
+    for measure in TROVE_MEASURES:
+        trove_histogram(troves2, measure)
+
+
+def plot_results(results):
+    """All figures of the macro model script from its results (see `macro_model.save_results`)."""
+    plot_run(results["data"], results["troves"])
+    plot_comparison(results["data"], results["data2"], results["troves2"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Draw the macro model figures from saved results.")
+    parser.add_argument("results", help="directory the simulation results were saved to")
+    args = parser.parse_args()
+    plot_results(load_results(args.results))
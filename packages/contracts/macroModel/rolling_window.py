@@ -0,0 +1,64 @@
+"""O(1) trailing-window sums.
+
+The simulations read trailing day and month sums (issuance fees, liquidation
+and airdrop gains) every hour. Re-summing the window costs O(window) per
+step, while `RollingSum` keeps the last `window` values in a ring buffer and
+updates a running sum as values enter and leave it. The running sum is
+compensated (Kahan-Babuska/Neumaier), so adding and removing values over a
+year-long run does not accumulate rounding drift. NaNs and infinities are
+counted apart instead of entering the running sum, so the sum is finite
+again once they have left the window.
+"""
+
+import math
+
+
+class RollingSum:
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError(f"window must be at least 1, got {window}")
+        self.window = window
+        self._values = [0.0] * window
+        self._position = 0
+        self._count = 0
+        self._sum = 0.0
+        self._compensation = 0.0
+        # numbers of NaNs, infinities and negative infinities in the window
+        self._nonfinite = {"nan": 0, "inf": 0, "-inf": 0}
+
+    def __len__(self):
+        """Number of values currently in the window."""
+        return self._count
+
+    @property
+    def sum(self):
+        nonfinite = self._nonfinite
+        if nonfinite["nan"] or (nonfinite["inf"] and nonfinite["-inf"]):
+            return math.nan
+        if nonfinite["inf"]:
+            return math.inf
+        if nonfinite["-inf"]:
+            return -math.inf
+        return self._sum + self._compensation
+
+    def _add(self, value):
+        total = self._sum + value
+        if abs(self._sum) >= abs(value):
+            self._compensation += (self._sum - total) + value
+        else:
+            self._compensation += (value - total) + self._sum
+        self._sum = total
+
+    def push(self, value):
+        """Add `value` to the window, dropping the oldest value once the window is full."""
+        value = float(value)
+        oldest = self._values[self._position]
+        self._values[self._position] = value
+        self._position = (self._position + 1) % self.window
+        self._count = min(self._count + 1, self.window)
+        for entry, change in ((value, 1), (oldest, -1)):
+            if math.isfinite(entry):
+                self._add(change * entry)
+            else:
+                # str gives "nan", "inf" or "-inf"
+                self._nonfinite[str(entry)] += change
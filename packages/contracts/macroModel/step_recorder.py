@@ -0,0 +1,74 @@
+"""Preallocated per-step result store for the macro model.
+
+Appending a row to a DataFrame copies the whole frame, which makes a run
+quadratic in its number of steps. The recorder writes each step into a
+structured NumPy array sized for the whole run, reads history back in O(1)
+and only builds a DataFrame once, when the run is over. Fields that are
+summed over a trailing window every step can be tracked by `RollingSum`
+accumulators, which are fed as steps are recorded.
+"""
+
+import numpy as np
+import pandas as pd
+
+from rolling_window import RollingSum
+
+
+class StepRecorder:
+    def __init__(self, fields, n_steps, windows=None, dtype=np.float64):
+        """`windows` maps a field to the trailing window sizes to keep a running sum for."""
+        self.fields = tuple(fields)
+        self._rows = np.zeros(n_steps, dtype=[(field, dtype) for field in self.fields])
+        self._size = 0
+        self._windows = {}
+        for field, sizes in (windows or {}).items():
+            self._windows[field] = {size: RollingSum(size) for size in sizes}
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, key):
+        """`recorder[index, field]` is one value, `recorder[field]` the column recorded so far."""
+        if isinstance(key, tuple):
+            index, field = key
+            return self._rows[field][self._check(index)]
+        return self._rows[key][:self._size]
+
+    def __setitem__(self, key, value):
+        index, field = key
+        if field in self._windows:
+            raise ValueError(f"'{field}' feeds trailing windows and can only be written by record()")
+        self._rows[field][self._check(index)] = value
+
+    def _check(self, index):
+        if not 0 <= index < self._size:
+            raise IndexError(f"step {index} has not been recorded (recorded steps: {self._size})")
+        return index
+
+    def record(self, index, row):
+        """Store the values of `row` (a field -> value mapping) as step `index`.
+
+        Steps are recorded in order, one after the other.
+        """
+        if index != self._size:
+            raise IndexError(f"expected step {self._size}, got {index}")
+        if index == len(self._rows):
+            raise IndexError(f"recorder is full ({len(self._rows)} steps)")
+        values = self._rows[index]
+        for field, value in row.items():
+            values[field] = value
+        for field, windows in self._windows.items():
+            for window in windows.values():
+                window.push(values[field])
+        self._size = index + 1
+
+    def trailing_sum(self, field, window):
+        """Sum of `field` over the last `window` recorded steps, in O(1)."""
+        return self._windows[field][window].sum
+
+    def previous(self, field):
+        """Value of `field` at the last recorded step."""
+        return self._rows[field][self._size - 1]
+
+    def to_frame(self):
+        return pd.DataFrame(self._rows[:self._size])
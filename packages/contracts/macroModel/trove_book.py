@@ -0,0 +1,457 @@
+"""Columnar trove store for the macro model.
+
+Each trove is one row spread over preallocated NumPy columns, so opening a
+trove is an amortised O(1) append instead of a full DataFrame copy. Removed
+troves are tombstoned and squeezed out by a single bulk compaction, which
+keeps the surviving troves in their original order (the model seeds its
+random draws by trove position, so the order matters).
+
+Every trove also has an id that survives compaction and reordering. With
+`indexed`, the book keeps its troves by that id in a `LiquidationIndex` and
+a `BandIndex` of their inattention bands, so that `liquidatable` and
+`band_exits` only look at the troves whose liquidation price the ether
+price crossed or whose band it left; without it, they check the CR of
+every trove, which for the few thousand troves the model holds is quicker
+than keeping the indexes up to date. Code that changes Supply or
+Ether_Quantity through a column view must `touch` the troves it changed.
+When the ether price of every step is known in advance (`schedule_events`),
+an `EventQueue` takes the place of both indexes: each trove is scheduled at
+the step the price next crosses its liquidation price or leaves its band,
+and each step (`advance`) only the troves due at it are looked at.
+
+With `running_totals`, the book keeps running sums of Supply and
+Ether_Quantity, updated as troves are added, re-indexed and removed, so
+`total` is O(1). A running float drifts from the sum of the column as it is
+added to and taken from, so it is summed again from the column every
+`RESYNC_EVERY` changed values, and whenever it is not finite (a nan or an
+infinity taken out of a running sum does not leave it). Without them,
+`total` sums the column. With `check_totals`, for debugging, every read is
+checked against the full sum.
+
+`CR_current` is computed lazily: after `invalidate_CR` each trove's value
+is Ether_Price * Ether_Quantity / Supply as of the first time it is read,
+unless it is set before that.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from band_index import BandIndex
+from event_queue import EventQueue
+from liquidation_index import LiquidationIndex
+
+COLUMNS = ("Ether_Price", "Ether_Quantity", "CR_initial", "Supply", "Rational_inattention", "CR_current")
+TOTALS = ("Supply", "Ether_Quantity")
+# changed values after which the running totals are summed again from the columns
+RESYNC_EVERY = 4096
+
+
+class TroveBook:
+    def __init__(self, capacity=1024, liquidation_ratio=1.1, inattention_band=(-1, 2), indexed=False,
+                 running_totals=False, check_totals=False):
+        self._capacity = max(int(capacity), 1)
+        self._columns = {name: np.empty(self._capacity) for name in COLUMNS}
+        self._ids = np.empty(self._capacity, dtype=np.int64)
+        # CR_current is up to date where its epoch is the book's
+        self._cr_epochs = np.empty(self._capacity, dtype=np.int64)
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        # number of slots in use, tombstones included
+        self._size = 0
+        self._dead = 0
+        self._epoch = 0
+        self._next_id = 0
+        # trove id -> storage slot, only up to date for live troves
+        self._slot_of = np.empty(self._capacity, dtype=np.int64)
+        self.liquidation_ratio = liquidation_ratio
+        self._liquidations = LiquidationIndex() if indexed else None
+        # bounds of (CR_current - CR_initial) / (CR_initial * Rational_inattention) within which a trove is left alone
+        self.inattention_band = inattention_band
+        self._bands = BandIndex() if indexed else None
+        self._events = None
+        self._step = 0
+        # ids of the troves due at the current step, once popped from the event queue
+        self._due = None
+        # with running totals, the values each trove adds to them, the totals themselves, and the
+        # number of values changed since they were last summed from the columns
+        self._counted = {name: np.zeros(self._capacity) for name in TOTALS} if running_totals else {}
+        self._totals = dict.fromkeys(self._counted, 0.0)
+        self._changes = 0
+        self.check_totals = check_totals
+
+    def __len__(self):
+        return self._size - self._dead
+
+    def __getitem__(self, name):
+        """Live view of a column, in trove order.
+
+        The view is invalidated by the next append, removal or reordering.
+        """
+        self.compact()
+        if name == "CR_current":
+            self._refresh_CR(np.flatnonzero(self._cr_epochs[:self._size] != self._epoch))
+        return self._columns[name][:self._size]
+
+    def __setitem__(self, name, value):
+        self.compact()
+        self._columns[name][:self._size] = value
+        if name == "CR_current":
+            self._cr_epochs[:self._size] = self._epoch
+        elif name in ("Supply", "Ether_Quantity"):
+            self.touch(np.arange(self._size))
+
+    def _per_slot(self):
+        return [*self._columns.values(), *self._counted.values(), self._ids, self._cr_epochs]
+
+    def _reserve(self, n):
+        needed = self._size + n
+        if needed > self._capacity:
+            capacity = self._capacity
+            while capacity < needed:
+                capacity *= 2
+            for name, column in self._columns.items():
+                grown = np.empty(capacity)
+                grown[:self._size] = column[:self._size]
+                self._columns[name] = grown
+            for name, counted in self._counted.items():
+                grown = np.zeros(capacity)
+                grown[:self._size] = counted[:self._size]
+                self._counted[name] = grown
+            for name in ("_ids", "_cr_epochs"):
+                grown = np.empty(capacity, dtype=np.int64)
+                grown[:self._size] = getattr(self, name)[:self._size]
+                setattr(self, name, grown)
+            alive = np.zeros(capacity, dtype=bool)
+            alive[:self._size] = self._alive[:self._size]
+            self._alive = alive
+            self._capacity = capacity
+        if self._next_id + n > self._slot_of.size:
+            size = self._slot_of.size
+            while size < self._next_id + n:
+                size *= 2
+            slot_of = np.empty(size, dtype=np.int64)
+            slot_of[:self._next_id] = self._slot_of[:self._next_id]
+            self._slot_of = slot_of
+
+    def _slots(self, positions):
+        # translate positions among live troves into storage slots
+        positions = np.asarray(positions, dtype=np.int64)
+        if self._dead == 0:
+            return positions
+        return np.flatnonzero(self._alive[:self._size])[positions]
+
+    def _index_slots(self, slots):
+        # (re)index the troves in `slots` at their liquidation prices and inattention bands, if the
+        # book keeps indexes or scheduled events, and count them in the running totals
+        columns = self._columns
+        if self._events is not None or self._liquidations is not None:
+            supply_per_ether = columns["Supply"][slots] / columns["Ether_Quantity"][slots]
+            ids = self._ids[slots]
+            cr_initial, inattention = columns["CR_initial"][slots], columns["Rational_inattention"][slots]
+            low, high = self.inattention_band
+            liquidation_price = self.liquidation_ratio * supply_per_ether
+            band_low = cr_initial * (1 + low * inattention) * supply_per_ether
+            band_high = cr_initial * (1 + high * inattention) * supply_per_ether
+            if self._events is not None:
+                # due from the next step on, a little early: the caller decides on the CR itself
+                self._events.schedule(ids, np.maximum(liquidation_price, band_low) * (1 + 1e-9),
+                                      band_high * (1 - 1e-9), self._step + 1)
+            else:
+                self._liquidations.set(ids, liquidation_price)
+                self._bands.set(ids, band_low, band_high)
+        for name, counted in self._counted.items():
+            before, values = counted[slots], columns[name][slots]
+            changed = before != values
+            if changed.any():
+                self._totals[name] += float(values[changed].sum()) - float(before[changed].sum())
+                self._changes += int(np.count_nonzero(changed))
+                counted[slots] = values
+
+    def _unindex(self, ids):
+        if self._liquidations is not None:
+            self._liquidations.remove(ids)
+            self._bands.remove(ids)
+        if self._events is not None:
+            self._events.remove(ids)
+
+    def _uncount(self, slots):
+        # take the troves in `slots`, each once, out of the totals
+        for name, counted in self._counted.items():
+            self._totals[name] -= float(counted[slots].sum())
+            self._changes += slots.size
+            counted[slots] = 0
+
+    def _refresh_CR(self, slots):
+        if slots.size == 0:
+            return
+        columns = self._columns
+        columns["CR_current"][slots] = columns["Ether_Price"][slots] * columns["Ether_Quantity"][slots] / columns["Supply"][slots]
+        self._cr_epochs[slots] = self._epoch
+
+    def append(self, ether_price, ether_quantity, cr_initial, supply, rational_inattention, cr_current=None):
+        """Add one trove at the end of the book and return its position."""
+        if cr_current is None:
+            cr_current = cr_initial
+        self.compact()
+        self._reserve(1)
+        slot = self._size
+        row = (ether_price, ether_quantity, cr_initial, supply, rational_inattention, cr_current)
+        for name, value in zip(COLUMNS, row):
+            self._columns[name][slot] = value
+        self._ids[slot] = self._next_id
+        self._slot_of[self._next_id] = slot
+        self._next_id += 1
+        self._cr_epochs[slot] = self._epoch
+        for counted in self._counted.values():
+            counted[slot] = 0
+        self._alive[slot] = True
+        self._size += 1
+        self._index_slots(np.array([slot]))
+        return slot
+
+    def extend(self, ether_price, ether_quantity, cr_initial, supply, rational_inattention, cr_current=None):
+        """Bulk version of `append`: every argument is an array (or a scalar broadcast to it)."""
+        if cr_current is None:
+            cr_current = cr_initial
+        values = np.broadcast_arrays(ether_price, ether_quantity, cr_initial, supply, rational_inattention, cr_current)
+        n = values[0].size
+        if n == 0:
+            return
+        self.compact()
+        self._reserve(n)
+        slots = np.arange(self._size, self._size + n)
+        for name, value in zip(COLUMNS, values):
+            self._columns[name][slots] = value.ravel()
+        ids = np.arange(self._next_id, self._next_id + n)
+        self._ids[slots] = ids
+        self._slot_of[ids] = slots
+        self._next_id += n
+        self._cr_epochs[slots] = self._epoch
+        for counted in self._counted.values():
+            counted[slots] = 0
+        self._alive[slots] = True
+        self._size += n
+        self._index_slots(slots)
+
+    def touch(self, positions):
+        """Re-index the troves at `positions` after changing their Supply or Ether_Quantity in place."""
+        slots = self._slots(positions)
+        if slots.size:
+            self._index_slots(slots)
+
+    def discard(self, positions):
+        """Tombstone the troves at the given positions.
+
+        Positions refer to the live troves as they stand when `discard` is
+        called; the slots are only reclaimed by the next `compact`.
+        """
+        slots = self._slots(positions)
+        if slots.size == 0:
+            return
+        slots = np.unique(slots[self._alive[slots]])
+        self._alive[slots] = False
+        self._dead += slots.size
+        self._unindex(self._ids[slots])
+        self._uncount(slots)
+
+    def keep(self, mask):
+        """Tombstone every live trove whose entry in `mask` is False."""
+        self.discard(np.flatnonzero(~np.asarray(mask, dtype=bool)))
+
+    def swap_remove(self, position):
+        """Remove one trove in O(1) by moving the last trove into its place.
+
+        This does not preserve the order of the book.
+        """
+        self.compact()
+        last = self._size - 1
+        self._unindex(self._ids[position])
+        self._uncount(np.array([position]))
+        if position != last:
+            for column in self._per_slot():
+                column[position] = column[last]
+            self._slot_of[self._ids[position]] = position
+        self._alive[last] = False
+        self._size = last
+
+    def compact(self):
+        """Squeeze out all tombstones in one pass, keeping the live troves in order."""
+        if self._dead == 0:
+            return
+        alive = self._alive[:self._size]
+        n = self._size - self._dead
+        for column in self._per_slot():
+            column[:n] = column[:self._size][alive]
+        self._alive[:n] = True
+        self._alive[n:self._size] = False
+        self._size = n
+        self._dead = 0
+        self._slot_of[self._ids[:n]] = np.arange(n)
+
+    def take(self, order):
+        """Reorder the book so that the trove at `order[k]` ends up at position k."""
+        self.compact()
+        order = np.asarray(order, dtype=np.int64)
+        for column in self._per_slot():
+            column[:self._size] = column[:self._size][order]
+        self._slot_of[self._ids[:self._size]] = np.arange(self._size)
+
+    def sort_by(self, name):
+        self.take(np.argsort(self[name]))
+
+    def invalidate_CR(self):
+        """Make every trove's CR_current follow Ether_Price again, from its next read on."""
+        self._epoch += 1
+
+    def current_CR(self, positions):
+        """CR_current of the troves at `positions`, computing only those that are out of date."""
+        slots = self._slots(positions)
+        self._refresh_CR(slots[self._cr_epochs[slots] != self._epoch])
+        return self._columns["CR_current"][slots]
+
+    def schedule_events(self, ether_prices, step=0):
+        """Find the troves to look at from the ether price of every step, `ether_prices`, from now on.
+
+        The book is at `step`, and the troves' Ether_Price is expected to be
+        `ether_prices[step]` from each `advance(step)` on.
+        """
+        self.compact()
+        self._events = EventQueue(ether_prices)
+        self._step = step
+        self._due = None
+        self._liquidations = self._bands = None
+        self._index_slots(np.arange(self._size))
+
+    def advance(self, step):
+        """Move the scheduled events on to `step`."""
+        if self._events is None:
+            return
+        self.compact()
+        # the troves due at the previous step that were not looked at are due now
+        leftover = self._due_slots()
+        self._step = step
+        self._due = None
+        if leftover.size:
+            self._events.schedule(self._ids[leftover], np.inf, -np.inf, step)
+
+    def _due_slots(self):
+        # slots, in order, of the live troves due at the current step
+        if self._due is None:
+            self._due = self._events.pop_due(self._step)
+        slots = self._slot_of[self._due]
+        # the slot of a trove removed since may hold another one, or none
+        live = slots < self._size
+        live[live] = self._ids[slots[live]] == self._due[live]
+        return np.sort(slots[live])
+
+    def liquidatable(self):
+        """Positions, in order, of the troves whose collateral ratio at their Ether_Price is below the liquidation ratio.
+
+        With `indexed`, only the troves whose liquidation price has been
+        crossed are looked at, or with scheduled events the troves due at the
+        step; they leave the liquidation index, and are expected to be
+        discarded by the caller. Otherwise every trove is looked at.
+        """
+        self.compact()
+        if self._events is not None:
+            slots = self._due_slots()
+            crossed = self.current_CR(slots) < self.liquidation_ratio
+            return slots[crossed]
+        if self._liquidations is None:
+            return np.flatnonzero(self["CR_current"] < self.liquidation_ratio)
+        ether_price = self._columns["Ether_Price"][:self._size]
+        # the liquidation price is rounded on its own: take a margin, then decide on the CR itself
+        ids, _ = self._liquidations.pop_above(float(ether_price.min(initial=np.inf)) * (1 - 1e-9))
+        slots = self._slot_of[ids]
+        self._refresh_CR(slots[self._cr_epochs[slots] != self._epoch])
+        crossed = self._columns["CR_current"][slots] < self.liquidation_ratio
+        self._index_slots(slots[~crossed])
+        return np.sort(slots[crossed])
+
+    def band_exits(self):
+        """Positions, in order, of the troves whose CR_current is outside their inattention band.
+
+        Also returns (CR_current - CR_initial) / (CR_initial *
+        Rational_inattention) for each of them. The troves are expected to
+        share one Ether_Price, as the model sets it; only those whose band
+        that price is outside of, or close to a bound of, are looked at with
+        `indexed`, or with scheduled events the troves due at the step;
+        otherwise every trove is.
+        """
+        self.compact()
+        if self._size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if self._events is not None:
+            slots = self._due_slots()
+            # all of them are looked at now: scheduled again, from their Supply and Ether_Quantity as they are
+            self._index_slots(slots)
+            self._due = np.empty(0, dtype=np.int64)
+        elif self._bands is not None:
+            slots = np.sort(self._slot_of[self._bands.exits(self._columns["Ether_Price"][0])])
+        else:
+            slots = np.arange(self._size)
+        cr_initial = self._columns["CR_initial"][slots]
+        check = (self.current_CR(slots) - cr_initial) / (cr_initial * self._columns["Rational_inattention"][slots])
+        low, high = self.inattention_band
+        outside = (check < low) | (check > high)
+        return slots[outside], check[outside]
+
+    def redeem(self, amount, ether_price, key="CR_current"):
+        """Redeem `amount` of ZSUSD from the troves with the lowest `key`.
+
+        The book is sorted by `key`, and the prefix sums of the supply give
+        the boundary trove, the first one `amount` does not cover in full,
+        by binary search. The troves before it are removed with one slice
+        and the rest of `amount` is taken from it. Redeeming more than the
+        whole book raises IndexError. Returns the number of troves removed.
+        """
+        self.sort_by(key)
+        n = self._size
+        supply = self._columns["Supply"][:n]
+        ether_quantity = self._columns["Ether_Quantity"][:n]
+        # running sums in trove order, as a trove-by-trove loop adds them up
+        redeemed = np.cumsum(supply)
+        boundary = int(np.searchsorted(redeemed, amount, side="right"))
+        residual = amount - (redeemed[boundary] - supply[boundary])
+        supply[boundary] = supply[boundary] - residual
+        ether_quantity[boundary] = ether_quantity[boundary] - residual / ether_price
+        self._columns["CR_current"][boundary] = ether_price * ether_quantity[boundary] / supply[boundary]
+        self._cr_epochs[boundary] = self._epoch
+        self._index_slots(np.array([boundary]))
+        self._alive[:boundary] = False
+        self._dead += boundary
+        self._unindex(self._ids[:boundary])
+        self._uncount(np.arange(boundary))
+        return boundary
+
+    def _resync(self):
+        # sum the running totals again from the columns
+        for name in self._totals:
+            self._totals[name] = float(self[name].sum())
+        self._changes = 0
+
+    def total(self, name):
+        """Sum of the Supply or Ether_Quantity of the troves."""
+        if name not in self._totals:
+            return float(self[name].sum())
+        if self._changes >= RESYNC_EVERY or not math.isfinite(self._totals[name]):
+            self._resync()
+        total = self._totals[name]
+        if self.check_totals:
+            # for debugging only: sums the whole column, and allows for the rounding of the
+            # running sum since it was last summed from it
+            column = self[name]
+            expected = float(column.sum())
+            assert (abs(total - expected) <= 1e-9 * np.abs(column).sum() or total == expected
+                    or (math.isnan(total) and math.isnan(expected))), \
+                f"running total of {name} is {total}, the troves add up to {expected}"
+        return total
+
+    def TCR(self, ether_price):
+        """Collateral ratio of all the troves together at `ether_price`."""
+        return ether_price * self.total("Ether_Quantity") / self.total("Supply")
+
+    def to_frame(self):
+        self.compact()
+        return pd.DataFrame({name: self[name].copy() for name in COLUMNS})
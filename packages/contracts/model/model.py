@@ -1,7 +1,11 @@
+import argparse
+import logging
+
 import numpy as np
-import matplotlib.pyplot as plt
 
+from results import save_results
 
+logger = logging.getLogger(__name__)
 
 # model parameters
 class ModelParams:
@@ -69,7 +73,7 @@ def get_new_redeemed_amount(data, params):
         return max(redeemed, max_redeemable)
 
 # Decay base fee correctly
-def get_new_base_fee(data, redeemed_amount):
+def get_new_base_fee(data, params, redeemed_amount):
     if data.token_supply[-1] == 0:
         return 0
 
@@ -91,7 +95,7 @@ def get_new_token_price(data, params, redeemed_amount, momentum):
     T = params.T
 
     factor = - 1 /(A + T)
-    print(f'factor: {factor}')
+    logger.debug('factor: %s', factor)
     # price = (data.trove_issuance[-1] - data.token_demand[-1] - ((A + T) * data.token_price[-1]) + ((B + F) * momentum) - redeemed_amount) * factor 
     price = (data.trove_issuance[-1] - data.innate_token_demand - (A * data.token_price[-1] )  -T + ((B + F) * momentum) - redeemed_amount) * factor 
 
@@ -161,28 +165,13 @@ def sublinear_ETH_price(last_price, steepness, i):
     return last_price + 1/(2*np.sqrt(steepness*(i+1)))
     
 
-# ### Script
-
-params = ModelParams() 
-data = Data() # initialize data timeseries
-
-for i in range(1, 100):
-    # update exogenous ETH price
-    last_ETH_price =  data.ETH_price[-1]
-
-    # ETH_price = last_ETH_price
-    # ETH_price = randomwalk_ETH_price(last_ETH_price)
-    # ETH_price = oscillating_ETH_price(500, 10, i)
-    # ETH_price = quadratic_ETH_price(10, i)
-    # ETH_price = linear_increasing_ETH_price(last_ETH_price, 100)
-    # ETH_price = linear_decreasing_ETH_price(last_ETH_price, 1)
-    ETH_price = sublinear_ETH_price(last_ETH_price, 10, i)
-    
-    # print(ETH_price)
+### Model step
 
+# Advance the model by one timestep at the given ETH price and log the new values into data
+def model_step(data, params, ETH_price):
     momentum = get_new_momentum(data, params, ETH_price)
     redeemed_amount = get_new_redeemed_amount(data, params)
-    base_fee = get_new_base_fee(data, redeemed_amount)
+    base_fee = get_new_base_fee(data, params, redeemed_amount)
 
     data.innate_token_demand = get_innate_token_demand()
 
@@ -192,17 +181,6 @@ for i in range(1, 100):
     token_demand = get_new_token_demand(data, params, token_price, momentum)
     trove_issuance = get_new_trove_issuance(data, params, token_price, momentum)
     token_supply = get_new_token_supply(trove_issuance, redeemed_amount)
-    
-    # display all new data
-    print(f'step: {i}')
-    print(f'ETH price: {ETH_price}')
-    print(f'momentum: {momentum}')
-    print(f'redeemed amount: {redeemed_amount}')
-    print(f'base fee: {base_fee}')
-    print(f'token price: {token_price}')
-    print(f'token demand: {token_demand}')
-    print(f'trove_issuance: {trove_issuance}')
-    print(f'token_supply: {token_supply}')
 
     # update all time series
     data.ETH_price.append(ETH_price)
@@ -214,34 +192,54 @@ for i in range(1, 100):
     data.trove_issuance.append(trove_issuance)
     data.token_supply.append(token_supply)
 
-# print(f'length redeemed amt is  + {len(data.redeemed_amount)}')
-# print(*data.redeemed_amount)
-# print(*data.base_fee)
-# print(*data.token_price)
-# print(*data.momentum)
-
-# Plot results
+# Log the values of the last timestep at INFO level
+def log_step(i, data):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info('step: %s', i)
+    logger.info('ETH price: %s', data.ETH_price[-1])
+    logger.info('momentum: %s', data.momentum[-1])
+    logger.info('redeemed amount: %s', data.redeemed_amount[-1])
+    logger.info('base fee: %s', data.base_fee[-1])
+    logger.info('token price: %s', data.token_price[-1])
+    logger.info('token demand: %s', data.token_demand[-1])
+    logger.info('trove_issuance: %s', data.trove_issuance[-1])
+    logger.info('token_supply: %s', data.token_supply[-1])
 
-fig = plt.figure()
-ax1 = fig.add_subplot(221)
-ax1.set_title('Token price')
-plt.plot(data.token_price)
-
-ax2 = fig.add_subplot(222)
-ax2.set_title('Redeemed amount')
-plt.plot(data.redeemed_amount)
-
-ax3 = fig.add_subplot(223)
-ax3.set_title('ETH Price')
-plt.plot(data.ETH_price)
-
-ax4 = fig.add_subplot(224)
-ax4.set_title('Base Fee')
-plt.plot(data.base_fee)
-
-
-# plt.plot(data.momentum)
-# plt.plot(data.token_demand)
+# ### Script
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the model on one ETH price path.')
+    parser.add_argument('--save', metavar='PATH', help='write the results to PATH (.npz), to plot them later with plots.py')
+    parser.add_argument('--no-plot', action='store_true', help='do not draw the figures')
+    parser.add_argument('--log-level', default='INFO', help='logging level (default: INFO)')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format='%(message)s')
+
+    params = ModelParams() 
+    data = Data() # initialize data timeseries
+
+    for i in range(1, 100):
+        # update exogenous ETH price
+        last_ETH_price =  data.ETH_price[-1]
+
+        # ETH_price = last_ETH_price
+        # ETH_price = randomwalk_ETH_price(last_ETH_price)
+        # ETH_price = oscillating_ETH_price(500, 10, i)
+        # ETH_price = quadratic_ETH_price(10, i)
+        # ETH_price = linear_increasing_ETH_price(last_ETH_price, 100)
+        # ETH_price = linear_decreasing_ETH_price(last_ETH_price, 1)
+        ETH_price = sublinear_ETH_price(last_ETH_price, 10, i)
+        
+        # print(ETH_price)
 
-plt.show()
\ No newline at end of file
+        model_step(data, params, ETH_price)
+        
+        # display all new data
+        log_step(i, data)
+
+    if args.save:
+        save_results(args.save, 'model', data, params)
+    if not args.no_plot:
+        import plots
+        plots.plot_results('model', vars(data), vars(params))
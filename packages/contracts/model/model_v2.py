@@ -1,5 +1,11 @@
+import argparse
+import logging
+
 import numpy as np
-import matplotlib.pyplot as plt
+
+from results import save_results
+
+logger = logging.getLogger(__name__)
 
 # model parameters
 class ModelParams:
@@ -13,20 +19,52 @@ class ModelParams:
 
         self.max_redemption_fraction = 1 # Maximum fraction of supply that can be redeemed in a timestep
 
-# time series data 
+# time series of many paths side by side: a (paths x time) array filled one timestep at a time.
+# Indexing by timestep returns the values of all paths, so the step functions work on it like on a list.
+class PathSeries:
+    def __init__(self, initial, n_paths, n_steps):
+        self.values = np.empty((n_paths, n_steps))
+        self.values[:, 0] = initial
+        self.length = 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(f'timestep {i} out of range')
+        return self.values[:, i]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.values[:, :self.length], dtype=dtype)
+
+    def append(self, value):
+        self.values[:, self.length] = value
+        self.length += 1
+
+# time series data. With n_paths, every series holds n_paths paths of up to n_steps timesteps ("many worlds" mode)
 class Data:
-    def __init__(self):
-        self.ETH_price = [500.0]
-        self.momentum = [0.0]
-        self.base_fee = [0.0]
-        self.redeemed_amount = [0.0]
-        self.token_price = [1.0]
-        self.trove_issuance = [100.0]
-        self.token_supply = [100.0]
+    def __init__(self, n_paths=None, n_steps=250):
+        def series(initial):
+            if n_paths is None:
+                return [initial]
+            return PathSeries(initial, n_paths, n_steps)
+
+        self.ETH_price = series(500.0)
+        self.momentum = series(0.0)
+        self.base_fee = series(0.0)
+        self.redeemed_amount = series(0.0)
+        self.token_price = series(1.0)
+        self.trove_issuance = series(100.0)
+        self.token_supply = series(100.0)
         self.token_demand = 100.0
   
         
 ### Functions
+# All step functions are elementwise: they take and return scalars for a single path,
+# or arrays holding one value per path in "many worlds" mode.
 def get_new_momentum(data, params, ETH_price):
     lookback = params.lookback
     if lookback == 0:
@@ -46,30 +84,23 @@ def get_past_ETH_price(data, params):
     else:
         ETH_price_past = data.ETH_price[length - params.lookback - 1]
 
-    if ETH_price_past == 0:
-        return 1
-    return ETH_price_past
+    return np.where(ETH_price_past == 0, 1, ETH_price_past)
 
 def get_new_redeemed_amount(data, params):
     max_redeemable  = data.token_supply[-1] * params.max_redemption_fraction 
-    if max_redeemable == 0:
-        return 0
 
     redeemed = (1 - data.token_price[-1] - data.base_fee[-1]) * data.token_supply[-1] 
 
-    if redeemed < 0:
-        return 0
-    else:
-        return min(redeemed, max_redeemable)
-       
+    redeemed = np.where(redeemed < 0, 0, np.minimum(redeemed, max_redeemable))
+    return np.where(max_redeemable == 0, 0, redeemed)
 
 # Decay base fee correctly
-def get_new_base_fee(data, redeemed_amount):
-    if data.token_supply[-1] == 0:
-        return 0
+def get_new_base_fee(data, params, redeemed_amount):
+    token_supply = data.token_supply[-1]
+    no_supply = np.equal(token_supply, 0)
 
-    base_fee = (data.base_fee[-1] + (redeemed_amount / (2 * data.token_supply[-1]))) *params.D
-    return base_fee
+    base_fee = (data.base_fee[-1] + (redeemed_amount / (2 * np.where(no_supply, 1, token_supply)))) *params.D
+    return np.where(no_supply, 0, base_fee)
 
 # return the exogenous market demand for holding ZERO tokens. Assume constant. Could be a function of:
 # - Demand for a safe-haven $1-pegged asset  
@@ -83,66 +114,44 @@ def get_new_token_price(data, params, redeemed_amount, momentum):
     F = params.F
 
     factor =  1/T
-    print(f'factor: {factor}')
+    logger.debug('factor: %s', factor)
     price = (((data.token_demand  - redeemed_amount) / (data.trove_issuance[-1])) - (F * momentum)) * factor 
 
-    if price < 0:
-        return 0
-    else:
-        return price
-    return price
+    return np.maximum(price, 0)
 
 def get_new_token_demand(data, params, token_price, momentum):
     demand = data.token_demand
-    if demand < 0:
-        return 0
-    else: 
-        return demand
+    return np.maximum(demand, 0)
 
 def get_new_trove_issuance(data, params, token_price, momentum ):
     trove_issuance = data.trove_issuance[-1] * (params.T*(token_price) + params.F*(momentum))
-
-    if trove_issuance < 0:
-        return 0
-    else: 
-        return trove_issuance
+    return np.maximum(trove_issuance, 0)
 
 def get_new_token_supply(trove_issuance, redeemed):
     new_supply =  trove_issuance - redeemed
-
-    if new_supply < 0:
-        return 0
-    else: 
-        return new_supply
+    return np.maximum(new_supply, 0)
 
 # Given Liquity's hard price ceiling of 1.10, 
 # compute the excess trove issuance needed to maintain the price at 1.1, according to QTM.
 def get_excess_issuance(token_price, token_supply):
-    if token_price > 1.1:
-        excess_issuance = token_supply * (token_price - 1.1)/1.1
-        return excess_issuance
-    else:
-        return 0
+    excess_issuance = token_supply * (token_price - 1.1)/1.1
+    return np.where(token_price > 1.1, excess_issuance, 0)
  
 ### Various ETH price functions
 
 def constant_ETH_price(last_price):
     return last_price
 
-# ETH price generator is a random walk (normal dist.), with occasional large +ve and -ve jumps
+# ETH price generator is a random walk (normal dist.), with occasional large +ve and -ve jumps.
+# Given an array of last prices, every path takes its own independent step.
 def randomwalk_ETH_price(last_price):
-    big_event = 0
-    big_event_chance = np.random.normal()
+    size = np.shape(last_price) or None
+    big_event_chance = np.random.normal(size=size)
 
-    if (big_event_chance > 1.5) or (big_event_chance < -1.5):
-        big_event = big_event_chance * 20
+    big_event = np.where((big_event_chance > 1.5) | (big_event_chance < -1.5), big_event_chance * 20, 0)
  
-    new_price  = last_price + np.random.normal(scale=5) + big_event
-    
-    if new_price < 0: 
-        return 0
-    else:
-        return new_price
+    new_price  = last_price + np.random.normal(scale=5, size=size) + big_event
+    return np.maximum(new_price, 0)
 
 def linear_increasing_ETH_price(last_price, gradient):
     return last_price + gradient
@@ -152,9 +161,7 @@ def oscillating_ETH_price(min, magnitude, i):
 
 def linear_decreasing_ETH_price(start, gradient, i):
     val = (start - (gradient*i))
-    if val <= 0:
-        return 0
-    return val
+    return np.where(val <= 0, 0, val)
 
 def one_over_i_ETH_price(scale, i):
     return scale/i
@@ -165,30 +172,13 @@ def quadratic_ETH_price(min, scale, i):
 def sublinear_ETH_price(last_price, steepness, i):
     return last_price + 1/(2*np.sqrt(steepness*(i+1)))
     
-# ### Script
-
-# Initialize model parameters and data timeseries
-params = ModelParams() 
-data = Data()
-
-# Run the model
-for i in range(1, 250):
-    last_ETH_price =  data.ETH_price[-1]
+### Model step
 
-    # update exogenous ETH price
-
-    # ETH_price = last_ETH_price
-    ETH_price = randomwalk_ETH_price(last_ETH_price)
-    # ETH_price = oscillating_ETH_price(500, 100, i)
-    # ETH_price = quadratic_ETH_price(500, 10, i)
-    # ETH_price = linear_increasing_ETH_price(last_ETH_price, 3)
-    # ETH_price = linear_decreasing_ETH_price(800, 1, i)
-    # ETH_price = one_over_i_ETH_price(1000, i)
-    # ETH_price = sublinear_ETH_price(last_ETH_price, 10, i)
-    
+# Advance the model by one timestep at the given ETH price and log the new values into data
+def model_step(data, params, ETH_price):
     momentum = get_new_momentum(data, params, ETH_price)
     redeemed_amount = get_new_redeemed_amount(data, params)
-    base_fee = get_new_base_fee(data, redeemed_amount)
+    base_fee = get_new_base_fee(data, params, redeemed_amount)
 
     data.token_demand = get_token_demand()
 
@@ -201,22 +191,10 @@ for i in range(1, 250):
     # if price > 1.1, correct it via the price ceiling and QTM
     excess_issuance = get_excess_issuance(token_price, token_supply)
     
-    if token_price > 1.1:
-        token_price = 1.1
+    token_price = np.minimum(token_price, 1.1)
 
     trove_issuance = trove_issuance + excess_issuance
     token_supply = get_new_token_supply(trove_issuance, 0)
-    
-    # Log all new values
-    print(f'step: {i}')
-    print(f'ETH price: {ETH_price}')
-    print(f'momentum: {momentum}')
-    print(f'redeemed amount: {redeemed_amount}')
-    print(f'base fee: {base_fee}')
-    print(f'token price: {token_price}')
-    print(f'token demand: {token_demand}')
-    print(f'trove_issuance: {trove_issuance}')
-    print(f'token_supply: {token_supply}')
 
     # update all timeseries arrays
     data.ETH_price.append(ETH_price)
@@ -228,33 +206,89 @@ for i in range(1, 250):
     data.trove_issuance.append(trove_issuance)
     data.token_supply.append(token_supply)
 
-### Graph the results
-
-fig = plt.figure()
-ax1 = fig.add_subplot(221)
-ax1.set_title('Token price')
-plt.ylim(0.0, 1.5)
-plt.plot(data.token_price)
-
-ax2 = fig.add_subplot(222)
-ax2.set_title('Redeemed amount')
-plt.ylim(0.0, 10)
-plt.plot(data.redeemed_amount)
+# Run n_paths random-walk ETH price paths at once, in a single vectorized pass.
+# A path whose trove issuance drops to 0 has no market clearing price from then on (a single-path run
+# fails with a division by zero there); in many worlds mode it carries on with inf/nan values instead.
+def run_many_worlds(params, n_paths, n_steps=250):
+    data = Data(n_paths, n_steps)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for i in range(1, n_steps):
+            ETH_price = randomwalk_ETH_price(data.ETH_price[-1])
+            model_step(data, params, ETH_price)
+    return data
+
+# Per-path peg stability statistics of a run, one value per path.
+# Timesteps after a path's trove issuance collapsed to 0 are left out, and the path is flagged as collapsed.
+def peg_statistics(data):
+    token_price = np.atleast_2d(np.asarray(data.token_price))
+    redeemed_amount = np.atleast_2d(np.asarray(data.redeemed_amount))
+    issuance_gone = np.cumsum(np.atleast_2d(np.asarray(data.trove_issuance)) == 0, axis=1) > 0
+    valid = np.ones_like(issuance_gone)
+    valid[:, 1:] = ~issuance_gone[:, :-1]
+
+    token_price = np.where(valid, token_price, np.nan)
+    deviation = np.abs(token_price - 1)
+    n_valid = valid.sum(axis=1)
+    return {
+        'collapsed': issuance_gone[:, -1],
+        'max_deviation': np.nanmax(deviation, axis=1),
+        'mean_deviation': np.nanmean(deviation, axis=1),
+        'min_price': np.nanmin(token_price, axis=1),
+        'time_below_peg': (token_price < 1).sum(axis=1) / n_valid,
+        'time_at_ceiling': (token_price >= 1.1).sum(axis=1) / n_valid,
+        'max_redeemed_amount': np.nanmax(np.where(valid, redeemed_amount, np.nan), axis=1),
+    }
+
+# Log the values of the last timestep at INFO level
+def log_step(i, data):
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info('step: %s', i)
+    logger.info('ETH price: %s', data.ETH_price[-1])
+    logger.info('momentum: %s', data.momentum[-1])
+    logger.info('redeemed amount: %s', data.redeemed_amount[-1])
+    logger.info('base fee: %s', data.base_fee[-1])
+    logger.info('token price: %s', data.token_price[-1])
+    logger.info('token demand: %s', data.token_demand)
+    logger.info('trove_issuance: %s', data.trove_issuance[-1])
+    logger.info('token_supply: %s', data.token_supply[-1])
 
-ax3 = fig.add_subplot(223)
-ax3.set_title('ETH Price')
-plt.ylim(0, 1000)
-plt.plot(data.ETH_price)
-
-ax4 = fig.add_subplot(224)
-ax4.set_title('Base fee')
-plt.ylim(0.0, 0.05)
-plt.plot(data.base_fee)
-
-# plt.plot(data.momentum)
-# plt.plot(data.token_demand)
-
-params_string = f'Parameters:  D={params.D}  T={params.T}  F={params.F}  L={params.lookback}  r_max={params.max_redemption_fraction}'
-plt.figtext(0.5, 0.05, params_string, ha="center", fontsize=10)
+# ### Script
 
-plt.show()
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the model on one ETH price path.')
+    parser.add_argument('--save', metavar='PATH', help='write the results to PATH (.npz), to plot them later with plots.py')
+    parser.add_argument('--no-plot', action='store_true', help='do not draw the figures')
+    parser.add_argument('--log-level', default='INFO', help='logging level (default: INFO)')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format='%(message)s')
+
+    # Initialize model parameters and data timeseries
+    params = ModelParams() 
+    data = Data()
+
+    # Run the model
+    for i in range(1, 250):
+        last_ETH_price =  data.ETH_price[-1]
+
+        # update exogenous ETH price
+
+        # ETH_price = last_ETH_price
+        ETH_price = randomwalk_ETH_price(last_ETH_price)
+        # ETH_price = oscillating_ETH_price(500, 100, i)
+        # ETH_price = quadratic_ETH_price(500, 10, i)
+        # ETH_price = linear_increasing_ETH_price(last_ETH_price, 3)
+        # ETH_price = linear_decreasing_ETH_price(800, 1, i)
+        # ETH_price = one_over_i_ETH_price(1000, i)
+        # ETH_price = sublinear_ETH_price(last_ETH_price, 10, i)
+
+        model_step(data, params, ETH_price)
+
+        # Log all new values
+        log_step(i, data)
+
+    if args.save:
+        save_results(args.save, 'model_v2', data, params)
+    if not args.no_plot:
+        import plots
+        plots.plot_results('model_v2', vars(data), vars(params))
@@ -0,0 +1,54 @@
+import argparse
+
+import matplotlib.pyplot as plt
+
+from results import load_results
+
+# Figures of model.py / model_v2.py runs. Plotting is a separate stage that also runs on saved
+# results, so simulation runs (and sweep workers) never build figures:
+#
+#   python model_v2.py --save run.npz --no-plot
+#   python plots.py run.npz
+
+# y axis limits of the panels, per model
+YLIMS = {
+    'model': {},
+    'model_v2': {'token_price': (0.0, 1.5), 'redeemed_amount': (0.0, 10), 'ETH_price': (0, 1000), 'base_fee': (0.0, 0.05)},
+}
+
+# title of the base fee panel, per model
+BASE_FEE_TITLES = {'model': 'Base Fee', 'model_v2': 'Base fee'}
+
+# The parameters written under the figure, as model_v2.py always wrote them; model.py wrote none
+def params_string(model_name, params):
+    if model_name != 'model_v2':
+        return None
+    return (f"Parameters:  D={params['D']}  T={params['T']}  F={params['F']}  L={params['lookback']}  "
+            f"r_max={params['max_redemption_fraction']}")
+
+# Draw the four panels of a run from its time series (name -> values) and parameters (name -> value)
+def plot_results(model_name, series, params):
+    fig = plt.figure()
+    panels = [('Token price', 'token_price'), ('Redeemed amount', 'redeemed_amount'), ('ETH Price', 'ETH_price'),
+              (BASE_FEE_TITLES[model_name], 'base_fee')]
+    for position, (title, name) in enumerate(panels, 1):
+        ax = fig.add_subplot(220 + position)
+        ax.set_title(title)
+        if name in YLIMS[model_name]:
+            plt.ylim(*YLIMS[model_name][name])
+        plt.plot(series[name])
+
+    # plt.plot(series['momentum'])
+    # plt.plot(series['token_demand'])
+
+    text = params_string(model_name, params)
+    if text is not None:
+        plt.figtext(0.5, 0.05, text, ha="center", fontsize=10)
+
+    plt.show()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Draw the figures of a saved model run.')
+    parser.add_argument('results', help='.npz file written by model.py or model_v2.py with --save')
+    args = parser.parse_args()
+    plot_results(*load_results(args.results))
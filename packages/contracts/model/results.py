@@ -0,0 +1,17 @@
+import json
+
+import numpy as np
+
+# Saved model runs: every time series of a run's Data, the parameters it ran with and
+# the name of the model, in one .npz file. Plotting works from these files (see plots.py).
+
+# Save a run of model_name ('model' or 'model_v2') to path
+def save_results(path, model_name, data, params):
+    series = {name: np.asarray(value, dtype=float) for name, value in vars(data).items() if np.ndim(value) > 0}
+    np.savez(path, model=model_name, params=json.dumps(vars(params)), **series)
+
+# Load a saved run: returns the model name, a dict of time series and a dict of parameters
+def load_results(path):
+    with np.load(path) as saved:
+        series = {name: saved[name] for name in saved.files if name not in ('model', 'params')}
+        return str(saved['model']), series, json.loads(str(saved['params']))
@@ -0,0 +1,143 @@
+import hashlib
+import importlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Parameter sweeps over ModelParams of model.py or model_v2.py.
+#
+#   points = latin_hypercube(1000, D=(0, 1), T=(0.5, 5), lookback=(1, 20))
+#   table = sweep('model_v2', points, metrics=['peg_deviation', 'base_fee_volatility'])
+#
+# Every point is run on the same ETH price path, headless, in a process pool, and scored
+# with the given metrics (lower is better). Results are memoised by a hash of the model,
+# the parameters and the ETH price path, so re-running an overlapping sweep only
+# evaluates the new points.
+
+# parameters that only take integer values
+INTEGER_PARAMS = {'lookback'}
+
+### Metrics: run data -> score, lower is better
+
+def peg_deviation(data):
+    return float(np.mean(np.abs(np.asarray(data.token_price, dtype=float) - 1)))
+
+def max_peg_deviation(data):
+    return float(np.max(np.abs(np.asarray(data.token_price, dtype=float) - 1)))
+
+def max_redemption(data):
+    return float(np.max(np.asarray(data.redeemed_amount, dtype=float)))
+
+def base_fee_volatility(data):
+    return float(np.std(np.diff(np.asarray(data.base_fee, dtype=float))))
+
+METRICS = {
+    'peg_deviation': peg_deviation,
+    'max_peg_deviation': max_peg_deviation,
+    'max_redemption': max_redemption,
+    'base_fee_volatility': base_fee_volatility,
+}
+
+### Parameter points
+
+# Cartesian product of the given values, e.g. grid(D=[0.1, 0.5], lookback=[1, 5])
+def grid(**axes):
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+# n Latin-hypercube samples within the given (low, high) bounds, e.g. latin_hypercube(100, D=(0, 1))
+def latin_hypercube(n, seed=0, **bounds):
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for name, (low, high) in bounds.items():
+        # one sample in each of the n equal strata, strata shuffled independently per parameter
+        unit = (rng.permutation(n) + rng.random(n)) / n
+        if name in INTEGER_PARAMS:
+            values = np.floor(low + unit * (high - low + 1)).astype(int)
+        else:
+            values = low + unit * (high - low)
+        columns[name] = values.tolist()
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+### ETH price scenarios
+
+# The ETH price path each model's script runs on: a deterministic sublinear increase for model.py,
+# a seeded random walk with jumps for model_v2.py
+def default_ETH_prices(model_name, n_steps=None, seed=0):
+    model = importlib.import_module(model_name)
+    if model_name == 'model':
+        n_steps = n_steps or 100
+        prices = [model.Data().ETH_price[0]]
+        for i in range(1, n_steps):
+            prices.append(model.sublinear_ETH_price(prices[-1], 10, i))
+        return prices
+    n_steps = n_steps or 250
+    np.random.seed(seed)
+    prices = [model.Data().ETH_price[0]]
+    for i in range(1, n_steps):
+        prices.append(float(model.randomwalk_ETH_price(prices[-1])))
+    return prices
+
+### Evaluation
+
+def point_key(model_name, point, ETH_prices):
+    payload = json.dumps([model_name, sorted(point.items()), [float(p) for p in ETH_prices]])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def evaluate(model_name, point, ETH_prices, metrics):
+    model = importlib.import_module(model_name)
+    params = model.ModelParams()
+    for name, value in point.items():
+        if not hasattr(params, name):
+            raise ValueError(f'{model_name}.ModelParams has no parameter {name!r}')
+        setattr(params, name, value)
+
+    data = model.Data()
+    # points that drive the model out of its domain just score inf/nan
+    with np.errstate(all='ignore'):
+        for ETH_price in ETH_prices[1:]:
+            model.model_step(data, params, ETH_price)
+    return {metric: METRICS[metric](data) for metric in metrics}
+
+def _evaluate_star(args):
+    return evaluate(*args)
+
+# results memoised by point_key, shared by all sweeps of this process. Pass a dict-like
+# (e.g. a shelve) as `cache` to keep them across processes or sessions instead.
+_cache = {}
+
+# Evaluate every point and return a table of its parameters and metric scores, best first.
+# Points are ranked by the mean of their per-metric ranks, or by the single metric `rank_by`.
+def sweep(model_name, points, metrics=('peg_deviation', 'max_redemption', 'base_fee_volatility'),
+          ETH_prices=None, workers=None, cache=None, rank_by=None, chunksize=64):
+    metrics = list(metrics)
+    unknown = [metric for metric in metrics if metric not in METRICS]
+    if unknown:
+        raise ValueError(f'unknown metrics {unknown}, expected some of {sorted(METRICS)}')
+    if ETH_prices is None:
+        ETH_prices = default_ETH_prices(model_name)
+    if cache is None:
+        cache = _cache
+
+    keys = [point_key(model_name, point, ETH_prices) for point in points]
+    todo = {}
+    for key, point in zip(keys, points):
+        cached = cache.get(key, {})
+        if key not in todo and not all(metric in cached for metric in metrics):
+            todo[key] = point
+    if todo:
+        jobs = [(model_name, point, ETH_prices, metrics) for point in todo.values()]
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            for key, scores in zip(todo, pool.map(_evaluate_star, jobs, chunksize=chunksize)):
+                cache[key] = {**cache.get(key, {}), **scores}
+
+    table = pd.DataFrame([{**point, **{metric: cache[key][metric] for metric in metrics}}
+                          for key, point in zip(keys, points)])
+    if rank_by is None:
+        table['rank'] = table[metrics].rank().mean(axis=1)
+        rank_by = 'rank'
+    return table.sort_values(rank_by, kind='stable').reset_index(drop=True)
@@ -0,0 +1,86 @@
+import heapq
+from bisect import bisect_left
+
+# The active borrowers of the simulation, in the order of their target CR ('CR_initial'), as
+# the list of {'index', 'CR_initial', 'Rational_inattention'} entries the harness works on:
+# it has len, positional indexing, iteration, insert and pop like that list.
+#
+# On top of the list it keeps
+# - the CR keys, so hints can bisect them without rebuilding them,
+# - a map from address to account index, so that a borrower named in an event is found by
+#   bisecting its CR rather than by comparing every active account with the address,
+# - a max-heap of the last known ZSUSD balances of the accounts, so that ZSUSD to repay a trove
+#   is taken from the largest holders first, without a balance call for every account.
+#   Balances are noted as the harness moves ZSUSD and are only estimates: whoever takes a
+#   holder from the heap reads its actual balance and notes it again.
+class AccountRegistry:
+    def __init__(self):
+        self.entries = []
+        self.keys = []
+        self.slots = {}  # address -> account index, of every account that has been active
+        self.by_index = {}  # account index -> entry
+        self.balances = {}  # account index -> last known ZSUSD balance (Wei)
+        self.holders = []  # (-balance, account index), with stale pairs left in
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, position):
+        return self.entries[position]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def insert(self, position, entry, address):
+        self.entries.insert(position, entry)
+        self.keys.insert(position, entry['CR_initial'])
+        self.slots[str(address).lower()] = entry['index']
+        self.by_index[entry['index']] = entry
+
+    def pop(self, position):
+        entry = self.entries.pop(position)
+        self.keys.pop(position)
+        del self.by_index[entry['index']]
+        return entry
+
+    # position of the active account `index`, or None
+    def position(self, index):
+        entry = self.by_index.get(index)
+        if entry is None:
+            return None
+        position = bisect_left(self.keys, entry['CR_initial'])
+        while position < len(self.entries) and self.keys[position] == entry['CR_initial']:
+            if self.entries[position] is entry:
+                return position
+            position += 1
+        # only if the CR order was broken by an insertion hint
+        return next(i for i, e in enumerate(self.entries) if e is entry)
+
+    # Removes the active account with `address` and returns its account index, or None if it is not active
+    def remove(self, address):
+        index = self.slots.get(str(address).lower())
+        position = self.position(index)
+        if position is None:
+            return None
+        self.pop(position)
+        return index
+
+    ## ZSUSD holders
+
+    def note_balance(self, index, balance):
+        self.balances[index] = balance
+        if balance > 0:
+            heapq.heappush(self.holders, (-balance, index))
+
+    def add_balance(self, index, amount):
+        self.note_balance(index, max(self.balances.get(index, 0) + amount, 0))
+
+    # (account index, known balance) of the largest known holder, taken off the heap until its
+    # balance is noted again, or None
+    def pop_largest_holder(self):
+        while self.holders:
+            balance, index = heapq.heappop(self.holders)
+            if self.balances.get(index) == -balance:
+                del self.balances[index]
+                return index, -balance
+        return None
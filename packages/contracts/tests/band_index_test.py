@@ -0,0 +1,194 @@
+import math
+
+import numpy as np
+import pytest
+
+from account_registry import AccountRegistry
+from band_index import BandIndex
+from hint_engine import HintEngine
+from inattention_bands import InattentionBands
+from shadow_ledger_test import ACCOUNTS, WHALE, ledger_at_fixed_time, open_trove
+from trove_book import TroveBook
+from trove_book_test import book_of, random_troves
+
+# The inattention band index (macroModel/band_index.py), TroveBook.band_exits with and without it and
+# the harness' InattentionBands (inattention_bands.py), against checking the band of every trove.
+
+def exits(index, price, margin=0.0):
+    return index.exits(price, margin).tolist()
+
+def test_empty_index():
+    index = BandIndex()
+    assert len(index) == 0
+    assert exits(index, 1000.0) == []
+    index.set([], [], [])
+    index.remove([2, 5000])
+    assert len(index) == 0 and exits(index, 1000.0) == []
+
+def test_exits_below_and_above():
+    index = BandIndex()
+    index.set([0, 1, 2], [900.0, 1100.0, 500.0], [1500.0, 1300.0, 800.0])
+    assert exits(index, 1000.0) == [1, 2]
+    assert exits(index, 1200.0) == [2]
+    assert exits(index, 400.0) == [0, 1, 2]
+
+def test_bounds_belong_to_the_band():
+    index = BandIndex()
+    index.set([0, 1], [1000.0, 500.0], [2000.0, 1000.0])
+    # at a bound, a trove is inside its band
+    assert exits(index, 1000.0) == []
+    # but within the margin of it, it is given for the caller to decide on
+    assert exits(index, 1000.0, 1e-9) == [0, 1]
+    assert exits(index, 2000.0 * (1 - 1e-6), 1e-9) == [1]
+
+def test_ties_are_all_given():
+    index = BandIndex()
+    index.set([3, 1, 2], 1000.0, 2000.0)
+    assert exits(index, 999.0) == [1, 2, 3]
+    assert exits(index, 2001.0) == [1, 2, 3]
+
+def test_infinite_bounds():
+    index = BandIndex()
+    # a band from inf is always left, one to inf never from above
+    index.set([0, 1], [math.inf, 1000.0], [math.inf, math.inf])
+    assert exits(index, 1500.0) == [0]
+    assert exits(index, 1e300) == [0]
+    assert exits(index, 500.0) == [0, 1]
+
+def test_set_again_replaces_the_band():
+    index = BandIndex()
+    index.set([0, 1], [900.0, 900.0], [1100.0, 1100.0])
+    index.set(0, 400.0, 600.0)
+    # the same band again leaves one live entry
+    index.set(1, 900.0, 1100.0)
+    assert len(index) == 2
+    assert exits(index, 1000.0) == [0]
+    assert exits(index, 500.0) == [1]
+    assert exits(index, 1200.0) == [0, 1]
+
+def test_removed_troves_are_not_given():
+    index = BandIndex()
+    index.set([0, 1, 2], 900.0, 1100.0)
+    index.remove([1, 1])
+    assert len(index) == 2
+    assert exits(index, 2000.0) == [0, 2]
+    index.set(1, 900.0, 1100.0)
+    assert exits(index, 2000.0) == [0, 1, 2]
+
+def test_clear():
+    index = BandIndex()
+    index.set([0, 1], 900.0, 1100.0)
+    index.clear()
+    assert len(index) == 0 and exits(index, 2000.0) == []
+
+def test_ids_past_the_initial_capacity():
+    index = BandIndex()
+    index.set([1023, 1024, 70000], [1.0, 2.0, 3.0], [10.0, 10.0, 10.0])
+    assert exits(index, 2.5) == [70000]
+    assert exits(index, 11.0) == [1023, 1024, 70000]
+
+def test_arrays_are_rebuilt_once_stale_entries_pile_up():
+    rng = np.random.default_rng(0)
+    index = BandIndex()
+    lows = rng.uniform(500, 1000, 100)
+    highs = lows * 2
+    index.set(np.arange(100), lows, highs)
+    for _ in range(50):
+        moved = rng.choice(100, 20, replace=False)
+        lows[moved] = rng.uniform(500, 1000, 20)
+        highs[moved] = lows[moved] * 2
+        index.set(moved, lows[moved], highs[moved])
+        index.exits(1000.0)
+    assert len(index._lows) <= 2 * len(index) + 64
+    for price in (600.0, 1000.0, 1500.0):
+        assert exits(index, price) == np.flatnonzero((price < lows) | (price > highs)).tolist()
+
+def outside_by_check(book):
+    check = (book['CR_current'] - book['CR_initial']) / (book['CR_initial'] * book['Rational_inattention'])
+    outside = (check < -1) | (check > 2)
+    return np.flatnonzero(outside), check[outside]
+
+def set_price(book, ether_price):
+    book['Ether_Price'] = ether_price
+    book.invalidate_CR()
+
+def assert_band_exits_match(book):
+    positions, check = book.band_exits()
+    expected_positions, expected_check = outside_by_check(book)
+    np.testing.assert_array_equal(positions, expected_positions)
+    np.testing.assert_array_equal(check, expected_check)
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_band_exits_of_an_empty_book(indexed):
+    positions, check = TroveBook(indexed=indexed).band_exits()
+    assert positions.size == 0 and check.size == 0
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_band_exits_at_the_bounds(indexed):
+    book = TroveBook(indexed=indexed)
+    # CR_initial 1.5, inattention 0.2: left alone for a CR within [1.2, 2.1]
+    book.extend(2000.0, [1.2, 2.1, 1.5], 1.5, 2000.0, 0.2)
+    assert_band_exits_match(book)
+    set_price(book, 2000.0 * (1 + 1e-12))
+    assert_band_exits_match(book)
+    set_price(book, 2000.0 * (1 - 1e-12))
+    assert_band_exits_match(book)
+
+@pytest.mark.parametrize('indexed', [False, True])
+@pytest.mark.parametrize('seed', range(3))
+def test_band_exits_follow_touched_troves(seed, indexed):
+    rng = np.random.default_rng(seed)
+    book = book_of(random_troves(rng, 200), indexed=indexed)
+    ether_price = 2000.0
+    for _ in range(50):
+        ether_price *= np.exp(rng.normal(0, 0.05))
+        set_price(book, ether_price)
+        assert_band_exits_match(book)
+        # bring the troves outside back to their target, as adjust_troves does; their CR_current
+        # follows at the next price
+        positions, _ = book.band_exits()
+        book['Ether_Quantity'][positions] = book['CR_initial'][positions] * book['Supply'][positions] / ether_price
+        book.touch(positions)
+        book.discard(rng.choice(len(book), 2, replace=False))
+
+def registry_of(ledger, rng):
+    registry = AccountRegistry()
+    entries = [{'index': index, 'CR_initial': rng.uniform(1.5, 2.5), 'Rational_inattention': rng.uniform(0.05, 0.3)}
+               for index in range(1, len(ACCOUNTS))]
+    entries.sort(key=lambda entry: entry['CR_initial'])
+    for position, entry in enumerate(entries):
+        registry.insert(position, entry, ACCOUNTS[entry['index']])
+    return registry
+
+def positions_by_check(ledger, registry, price):
+    tm = ledger.troveManager
+    positions = []
+    for position, entry in enumerate(registry):
+        id = ACCOUNTS[entry['index']]
+        if tm.Troves(id)[3] != 1:
+            positions.append(position)
+            continue
+        ICR = tm._current_ICR(id, int(price * 10**18)) / 10**18
+        check = (ICR - entry['CR_initial']) / (entry['CR_initial'] * entry['Rational_inattention'])
+        if check < -1 or check > 2:
+            positions.append(position)
+    return positions
+
+def test_inattention_bands_match_the_check_of_every_trove():
+    rng = np.random.default_rng(0)
+    ledger = ledger_at_fixed_time()
+    open_trove(ledger, WHALE, 100000, 2000)
+    # the last accounts have no trove
+    for account in ACCOUNTS[1:15]:
+        open_trove(ledger, account, int(rng.integers(2000, 6000)), int(rng.integers(50, 100)))
+    registry = registry_of(ledger, rng)
+    for price in (100.0, 150.0, 200.0, 300.0, 500.0):
+        bands = InattentionBands(HintEngine())
+        given = bands.exits(ledger, ACCOUNTS, registry, price)
+        # the troves close to a bound are given too
+        expected = positions_by_check(ledger, registry, price)
+        assert set(expected) <= set(given)
+        assert len(given) - len(expected) <= 1
+    # an account leaving the registry is no longer given
+    registry.pop(0)
+    assert bands.exits(ledger, ACCOUNTS, registry, 500.0) == positions_by_check(ledger, registry, 500.0)
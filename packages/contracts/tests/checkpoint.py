@@ -0,0 +1,93 @@
+import os
+import pickle
+
+from brownie import web3
+from brownie.network import rpc
+
+from helpers import Contracts
+from event_sync import SyncedContracts
+from shadow_ledger import ShadowLedger, MirroredContracts
+
+# Checkpoints of a simulation run: a snapshot of the dev chain (evm_snapshot, as taken by
+# `chain.snapshot()`) together with the pickled Python side of the harness, i.e. the
+# addresses of the deployed contracts, the loop index and the harness state.
+#
+#   save_checkpoint(path, contracts, index, state)             # every so many steps
+#   contracts, index, state = load_checkpoint(path, globals())  # resume, or fork a branch
+#
+# A checkpoint can be loaded any number of times, from the same or another process, for as
+# long as the dev chain that took it keeps running: every load reverts the chain to it and
+# takes the snapshot again, so what-if branches can each start from the same point without
+# replaying the steps before it. On the shadow ledger (shadow_mode 'offline') the whole
+# ledger is pickled and no chain is needed.
+#
+# The snapshots only live in the memory of the node. A chain brownie launches itself goes down
+# with the process that launched it, crashed or not, and its checkpoints with it, so checkpoints
+# of the contracts need a node started on its own that the run connects to, e.g.
+#
+#   ganache-cli --port 8545 --accounts 1000 ...  # the cmd_settings of brownie-config.yaml
+#   brownie networks add Ethereum simulation-node host=http://127.0.0.1:8545 chainid=1337
+#   brownie test tests/simulation_test.py --network simulation-node
+#
+# require_persistent_chain fails at the start of such a run rather than at its first checkpoint.
+
+def require_persistent_chain():
+    if rpc.is_child():
+        raise RuntimeError('checkpoints of the contracts are evm snapshots, which only last as long as the node: '
+                           'run against a node started on its own (see checkpoint.py), not one brownie launches, '
+                           'or set checkpoint_every = 0')
+
+def _snapshot():
+    return web3.provider.make_request('evm_snapshot', [])['result']
+
+def _revert(snapshot_id):
+    result = web3.provider.make_request('evm_revert', [snapshot_id])
+    if not result.get('result'):
+        raise RuntimeError(f'the chain has no snapshot {snapshot_id}, was it restarted since the checkpoint was taken?')
+
+def _dump(path, checkpoint):
+    # written aside and moved in place, so a run killed while writing keeps the previous checkpoint
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(checkpoint, f)
+    os.replace(path + '.tmp', path)
+
+def _addresses(contracts):
+    return {name: (contract._name, contract.address) for name, contract in vars(contracts).items()}
+
+# `index` is the step to resume at, `state` anything picklable
+def save_checkpoint(path, contracts, index, state):
+    checkpoint = {'index': index, 'state': state}
+    if isinstance(contracts, SyncedContracts):
+        # the synced state is read again from the chain on loading
+        contracts = contracts.contracts
+    if isinstance(contracts, ShadowLedger):
+        checkpoint['shadow'] = contracts
+    else:
+        if isinstance(contracts, MirroredContracts):
+            checkpoint['shadow'] = contracts.shadow
+            contracts = contracts.contracts
+        checkpoint['contracts'] = _addresses(contracts)
+        checkpoint['snapshot'] = _snapshot()
+    _dump(path, checkpoint)
+
+# Brings the chain back to the checkpoint and returns the contracts, the index and the state
+# saved with it. `containers` maps contract names to their brownie ContractContainers (the
+# globals of a module that did `from brownie import *`).
+def load_checkpoint(path, containers):
+    with open(path, 'rb') as f:
+        checkpoint = pickle.load(f)
+    if 'contracts' not in checkpoint:
+        return checkpoint['shadow'], checkpoint['index'], checkpoint['state']
+
+    require_persistent_chain()
+    _revert(checkpoint['snapshot'])
+    # a snapshot is used up by reverting to it
+    checkpoint['snapshot'] = _snapshot()
+    _dump(path, checkpoint)
+
+    contracts = Contracts()
+    for name, (contract_name, address) in checkpoint['contracts'].items():
+        setattr(contracts, name, containers[contract_name].at(address))
+    if 'shadow' in checkpoint:
+        contracts = MirroredContracts(contracts, checkpoint['shadow'])
+    return contracts, checkpoint['index'], checkpoint['state']
@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The macro model's modules are tested from here, and the simulation harness shares its
+# numerical building blocks (random streams, exogenous paths, ...) with the macro model.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'macroModel'))
+
+# The parameter sweep of the analytical models is tested from here too; appended, so that the
+# macro model's modules come first where both have one of the same name.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'model'))
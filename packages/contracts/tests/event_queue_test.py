@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+from event_queue import EventQueue, PricePath
+from trove_book import COLUMNS, TroveBook
+from trove_book_test import book_of, random_troves
+
+# The ether price path of the macro model's scheduled events (macroModel/event_queue.py)
+# against walking the path step by step, and a TroveBook on scheduled events against one that
+# queries its liquidation and band indexes every step and one that checks every trove.
+
+def first_exit_by_walk(prices, start, low, high):
+    for step in range(max(start, 0), len(prices)):
+        if prices[step] < low or prices[step] > high:
+            return step
+    return len(prices)
+
+def test_first_exit_of_an_empty_path():
+    path = PricePath([])
+    assert len(path) == 0
+    assert path.first_exit(0, 1.0, 2.0) == 0
+    assert path.first_exit(0, np.zeros(20), np.ones(20)).tolist() == [0] * 20
+
+def test_first_exit_at_the_bounds():
+    path = PricePath([5.0, 4.0, 6.0, 3.0])
+    # a price equal to a bound is within it
+    assert path.first_exit(0, 4.0, 6.0) == 3
+    assert path.first_exit(0, 3.0, 6.0) == 4
+    assert path.first_exit(2, 3.0, 5.0) == 2
+    assert path.first_exit(0, -np.inf, np.inf) == 4
+    assert path.first_exit(0, np.inf, np.inf) == 0
+    assert path.first_exit(0, -np.inf, -np.inf) == 0
+
+def test_first_exit_from_past_the_ends():
+    path = PricePath([5.0, 4.0, 6.0])
+    assert path.first_exit(3, 0.0, 1.0) == 3
+    assert path.first_exit(10, 0.0, 1.0) == 3
+    assert path.first_exit(-5, 4.5, 10.0) == 1
+
+# up to 16 troves are scheduled one by one, more at once
+@pytest.mark.parametrize('n', [1, 16, 17, 200])
+@pytest.mark.parametrize('length', [1, 2, 7, 64, 1000])
+def test_first_exit_matches_the_walk(n, length):
+    rng = np.random.default_rng(n * length)
+    prices = np.round(1000 * np.exp(np.cumsum(rng.normal(0, 0.02, length))))
+    path = PricePath(prices)
+    for start in (0, length // 2, length - 1):
+        centre = prices[start]
+        lows = centre * rng.uniform(0.7, 1.0, n)
+        highs = centre * rng.uniform(1.0, 1.3, n)
+        # some bounds exactly at a price of the path
+        at = rng.integers(0, length, n)
+        lows = np.where(rng.random(n) < 0.2, np.minimum(prices[at], centre), lows)
+        expected = [first_exit_by_walk(prices, start, low, high) for low, high in zip(lows, highs)]
+        assert path.first_exit(start, lows, highs).tolist() == expected
+
+def test_empty_queue():
+    queue = EventQueue([1.0, 2.0])
+    assert len(queue) == 0
+    assert queue.pop_due(10).size == 0
+    queue.schedule([], [], [], 0)
+    queue.remove([1, 5000])
+    assert len(queue) == 0
+
+def test_troves_never_due_are_not_queued():
+    queue = EventQueue([5.0, 4.0, 6.0])
+    queue.schedule([0, 1], [0.0, 4.5], [10.0, 10.0], 0)
+    assert len(queue) == 1
+    assert queue.pop_due(2).tolist() == [1]
+
+def test_pop_due_in_step_order_with_ties():
+    queue = EventQueue([5.0, 4.0, 6.0, 3.0])
+    queue.schedule([7, 3, 5, 2], [4.5, 3.5, 4.5, 3.5], [10.0, 10.0, 10.0, 10.0], 0)
+    assert queue.pop_due(0).size == 0
+    assert queue.pop_due(1).tolist() == [5, 7]
+    assert queue.pop_due(3).tolist() == [2, 3]
+    assert len(queue) == 0
+
+def test_rescheduled_and_removed_troves():
+    queue = EventQueue([5.0, 4.0, 6.0, 3.0])
+    queue.schedule([0, 1, 2], 4.5, 10.0, 0)
+    # trove 0 is due later, trove 1 at the same step again, trove 2 not at all
+    queue.schedule(0, 3.5, 10.0, 0)
+    queue.schedule(1, 4.5, 10.0, 0)
+    queue.remove([2, 2])
+    assert len(queue) == 2
+    assert queue.pop_due(2).tolist() == [1]
+    assert queue.pop_due(3).tolist() == [0]
+    assert len(queue) == 0
+
+def test_queue_past_the_initial_capacity():
+    queue = EventQueue([5.0, 4.0])
+    queue.schedule([1023, 1024, 70000], [4.5, 5.5, 4.5], 10.0, 0)
+    assert queue.pop_due(0).tolist() == [1024]
+    assert queue.pop_due(1).tolist() == [1023, 70000]
+
+def run_steps(book, prices, rng):
+    # the liquidations and adjustments of the macro model, step by step
+    looked_at = []
+    for step in range(1, len(prices)):
+        book['Ether_Price'] = prices[step]
+        book.invalidate_CR()
+        book.advance(step)
+        liquidated = book.liquidatable()
+        book.discard(liquidated)
+        outside, check = book.band_exits()
+        quantity = book['Ether_Quantity']
+        quantity[outside] = book['CR_initial'][outside] * book['Supply'][outside] / prices[step]
+        book.touch(outside)
+        if rng.random() < 0.2:
+            new = random_troves(rng, 3, prices[step])
+            book.extend(*(new[name].to_numpy() for name in COLUMNS))
+        if rng.random() < 0.1 and len(book) > 1:
+            book.discard([int(rng.integers(len(book)))])
+        looked_at.append((liquidated.tolist(), outside.tolist(), check.tolist()))
+    return looked_at
+
+@pytest.mark.parametrize('seed', range(3))
+def test_scheduled_events_match_the_indexes_and_the_scan(seed):
+    rng = np.random.default_rng(seed)
+    prices = 2000 * np.exp(np.cumsum(rng.normal(0, 0.03, 300)))
+    frame = random_troves(rng, 100, prices[0])
+    by_scan, by_index, by_events = book_of(frame), book_of(frame, indexed=True), book_of(frame)
+    by_events.schedule_events(prices)
+    looked_at = run_steps(by_scan, prices, np.random.default_rng(seed))
+    assert run_steps(by_index, prices, np.random.default_rng(seed)) == looked_at
+    assert run_steps(by_events, prices, np.random.default_rng(seed)) == looked_at
+    assert by_index.to_frame().equals(by_scan.to_frame())
+    assert by_events.to_frame().equals(by_scan.to_frame())
+
+def test_troves_not_looked_at_are_due_at_the_next_step():
+    book = TroveBook()
+    # CR_initial 1.5, inattention 0.2: left alone for a CR within [1.2, 2.1]
+    book.extend(2000.0, [1.5, 1.5, 1.5], 1.5, 2000.0, 0.2)
+    prices = [2000.0, 1500.0, 1500.0, 1500.0]
+    book.schedule_events(prices)
+    book['Ether_Price'] = 1500.0
+    book.invalidate_CR()
+    book.advance(1)
+    assert book.liquidatable().size == 0
+    # band_exits is not called at step 1
+    book.advance(2)
+    assert book.band_exits()[0].tolist() == [0, 1, 2]
+    # brought back to their target, they are no longer due
+    book['Ether_Quantity'][[1, 2]] = 1.5 * 2000.0 / 1500.0
+    book.touch([1, 2])
+    book.advance(3)
+    assert book.band_exits()[0].tolist() == [0]
+
+def test_scheduled_events_of_an_empty_book():
+    book = TroveBook()
+    book.schedule_events([2000.0, 1000.0])
+    book.advance(1)
+    assert book.liquidatable().size == 0
+    assert book.band_exits()[0].size == 0
@@ -0,0 +1,229 @@
+from abc import ABC, abstractmethod
+
+from brownie import Wei, history
+
+from helpers import ZERO_ADDRESS, MAX_UINT, batch_call
+from shadow_ledger import CCR, compute_CR
+
+# State of the deployed contracts kept up to date from the events of the transactions brownie
+# sends, rather than read back from the chain after each of them.
+#
+#   contracts = SyncedContracts(contracts)
+#   contracts.zsusdToken.balanceOf(account)  # a dictionary lookup once the account is known
+#
+# An EventFollower reads what it needs from the chain once, then follows the events of every
+# transaction in brownie's `history` emitted by the contracts it `follows`; it reads the chain
+# again if the contracts change or the chain was reverted (which also trims `history`).
+
+class EventFollower(ABC):
+    follows = ()  # names of the contracts whose events are followed
+
+    def __init__(self):
+        self.trove_manager = None  # identifies the deployment followed
+        self.emitters = {}  # address -> contract name
+        self.seen = 0  # transactions of `history` followed so far
+
+    # reads the state from the chain
+    @abstractmethod
+    def load(self, contracts):
+        pass
+
+    # applies one event emitted by the contract named `source`
+    @abstractmethod
+    def apply(self, source, event):
+        pass
+
+    # catches up with the transactions sent since the last call
+    def sync(self, contracts):
+        if self.trove_manager != str(contracts.troveManager.address) or len(history) < self.seen:
+            self.trove_manager = str(contracts.troveManager.address)
+            self.emitters = {str(getattr(contracts, name).address): name for name in self.follows}
+            self.seen = len(history)
+            self.load(contracts)
+            return
+        # brownie's TxHistory is indexed by int only, not by slice
+        for i in range(self.seen, len(history)):
+            tx = history[i]
+            if tx.status == -1:
+                # sent without waiting for its receipt (see tx_pipeline.py)
+                tx.wait(1)
+            if tx.status == 1:
+                for event in tx.events:
+                    source = self.emitters.get(str(event.address))
+                    if source is not None:
+                        self.apply(source, event)
+        self.seen = len(history)
+
+# ZSUSD balances and supply, stability pool totals, open troves and the system's coll and debt.
+# The system totals are the running sums of the troves' recorded coll and debt, which the
+# active pool holds, and the default pool's coll and debt; so the TCR, recovery mode and the TCR
+# after a trove change are worked out without a call.
+class StateView(EventFollower):
+    follows = ('zsusdToken', 'stabilityPool', 'activePool', 'defaultPool', 'troveManager', 'borrowerOperations')
+
+    def __init__(self):
+        super().__init__()
+        self.balances = {}  # address -> ZSUSD balance, of the accounts asked for so far
+        self.total_supply = 0
+        self.stability_pool_deposits = 0
+        self.stability_pool_coll = 0
+        self.troves = {}  # address -> recorded (debt, coll), of the open troves
+        self.troves_debt = 0
+        self.troves_coll = 0
+        self.default_pool_debt = 0
+        self.default_pool_coll = 0
+        self.stability_pool = None
+        self.default_pool = None
+
+    def load(self, contracts):
+        total_supply, deposits, coll, troves, default_pool_debt, default_pool_coll = batch_call(contracts, [
+            (contracts.zsusdToken, 'totalSupply', ()),
+            (contracts.stabilityPool, 'getTotalZSUSDDeposits', ()),
+            (contracts.stabilityPool, 'getSOV', ()),
+            (contracts.multiTroveGetter, 'getMultipleSortedTroves', (0, MAX_UINT)),
+            (contracts.defaultPool, 'getZSUSDDebt', ()),
+            (contracts.defaultPool, 'getSOV', ()),
+        ])
+        self.balances = {}
+        self.total_supply = int(total_supply)
+        self.stability_pool_deposits = int(deposits)
+        self.stability_pool_coll = int(coll)
+        self.troves = {str(trove[0]): (int(trove[1]), int(trove[2])) for trove in troves}
+        self.troves_debt = sum(debt for debt, _ in self.troves.values())
+        self.troves_coll = sum(coll for _, coll in self.troves.values())
+        self.default_pool_debt = int(default_pool_debt)
+        self.default_pool_coll = int(default_pool_coll)
+        self.stability_pool = str(contracts.stabilityPool.address)
+        self.default_pool = str(contracts.defaultPool.address)
+
+    def apply(self, source, event):
+        if source == 'zsusdToken' and event.name == 'Transfer':
+            sender, recipient, value = str(event['from']), str(event['to']), int(event['value'])
+            if sender == ZERO_ADDRESS:
+                self.total_supply += value
+            elif sender in self.balances:
+                self.balances[sender] -= value
+            if recipient == ZERO_ADDRESS:
+                self.total_supply -= value
+            elif recipient in self.balances:
+                self.balances[recipient] += value
+        elif source == 'stabilityPool' and event.name == 'StabilityPoolZSUSDBalanceUpdated':
+            self.stability_pool_deposits = int(event['_newBalance'])
+        elif source == 'stabilityPool' and event.name == 'StabilityPoolSOVBalanceUpdated':
+            self.stability_pool_coll = int(event['_newBalance'])
+        elif source == 'activePool' and event.name == 'SOVSent' and str(event['_to']) == self.stability_pool:
+            # collateral of the liquidated troves offset with the deposits
+            self.stability_pool_coll += int(event['_amount'])
+        elif source == 'activePool' and event.name == 'SOVSent' and str(event['_to']) == self.default_pool:
+            # collateral of the liquidated troves redistributed
+            self.default_pool_coll += int(event['_amount'])
+        elif source == 'defaultPool' and event.name == 'SOVSent':
+            # pending rewards moved to the active pool
+            self.default_pool_coll -= int(event['_amount'])
+        elif source == 'defaultPool' and event.name == 'DefaultPoolZSUSDDebtUpdated':
+            self.default_pool_debt = int(event['_ZSUSDDebt'])
+        elif event.name == 'TroveUpdated':
+            id = str(event['_borrower'])
+            debt, coll = self.troves.pop(id, (0, 0))
+            self.troves_debt -= debt
+            self.troves_coll -= coll
+            debt, coll = int(event['_debt']), int(event['_coll'])
+            if debt > 0:
+                self.troves[id] = (debt, coll)
+                self.troves_debt += debt
+                self.troves_coll += coll
+
+    ## Views, after catching up with the chain
+
+    def balance_of(self, contracts, account):
+        self.sync(contracts)
+        account = str(account)
+        if account not in self.balances:
+            # from now on kept up to date by the Transfer events
+            self.balances[account] = int(contracts.zsusdToken.balanceOf(account))
+        return Wei(self.balances[account])
+
+    def entire_system_coll(self):
+        return self.troves_coll + self.default_pool_coll
+
+    def entire_system_debt(self):
+        return self.troves_debt + self.default_pool_debt
+
+    def TCR(self, price):
+        return compute_CR(self.entire_system_coll(), self.entire_system_debt(), int(price))
+
+    # as BorrowerOperations.getNewTCRFromTroveChange
+    def new_TCR(self, coll_change, is_coll_increase, debt_change, is_debt_increase, price):
+        coll = self.entire_system_coll() + (int(coll_change) if is_coll_increase else -int(coll_change))
+        debt = self.entire_system_debt() + (int(debt_change) if is_debt_increase else -int(debt_change))
+        return compute_CR(coll, debt, int(price))
+
+    def views(self, contracts, name):
+        def answer(value, result=Wei):
+            def view(*args):
+                self.sync(contracts)
+                return result(value(*args))
+            return view
+
+        if name == 'zsusdToken':
+            return {
+                'balanceOf': lambda account: self.balance_of(contracts, account),
+                'totalSupply': answer(lambda: self.total_supply),
+            }
+        if name == 'stabilityPool':
+            return {
+                'getTotalZSUSDDeposits': answer(lambda: self.stability_pool_deposits),
+                'getSOV': answer(lambda: self.stability_pool_coll),
+                'getETH': answer(lambda: self.stability_pool_coll),
+            }
+        if name == 'sortedTroves':
+            return {'getSize': answer(lambda: len(self.troves))}
+        if name == 'troveManager':
+            return {
+                'getEntireSystemColl': answer(self.entire_system_coll),
+                'getEntireSystemDebt': answer(self.entire_system_debt),
+                'getTCR': answer(self.TCR),
+                'checkRecoveryMode': answer(lambda price: self.TCR(price) < CCR, bool),
+            }
+        if name == 'borrowerOperations':
+            return {'getNewTCRFromTroveChange': answer(self.new_TCR)}
+        return {}
+
+# The deployed contracts (or MirroredContracts), with the views a StateView knows answered by
+# it and everything else, transactions included, passed through.
+class SyncedContracts:
+    def __init__(self, contracts, view=None):
+        self.contracts = contracts
+        self.view = StateView() if view is None else view
+
+    def __getattr__(self, name):
+        contract = getattr(self.contracts, name)
+        views = self.view.views(self.contracts, name)
+        if not views:
+            return contract
+        return SyncedContract(contract, views)
+
+class SyncedContract:
+    def __init__(self, contract, views):
+        self.contract = contract
+        self.views = views
+
+    def __getattr__(self, name):
+        view = self.views.get(name)
+        if view is None:
+            return getattr(self.contract, name)
+        return SyncedView(self.contract, name, view)
+
+# A view answered locally, which can still be encoded for a batched call (see
+# helpers.batch_call). The stability pool's getETH has no counterpart on the contract.
+class SyncedView:
+    def __init__(self, contract, name, view):
+        self.contract = contract
+        self.name = name
+        self.view = view
+
+    def __call__(self, *args):
+        return self.view(*args)
+
+    def __getattr__(self, name):
+        return getattr(getattr(self.contract, self.name), name)
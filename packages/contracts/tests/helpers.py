@@ -1,7 +1,13 @@
+from collections import namedtuple
+
 from brownie import Wei
 
 ZERO_ADDRESS = '0x' + '0'.zfill(40)
 MAX_BYTES_32 = '0x' + 'F' * 64
+MAX_UINT = 2**256 - 1
+
+# the deployed contracts, as attributes named after them
+class Contracts: pass
 
 def floatToWei(amount):
     return Wei(amount * 1e18)
@@ -11,39 +17,91 @@ def get_zsusd_amount_from_net_debt(contracts, net_debt):
     borrowing_rate = contracts.troveManager.getBorrowingRateWithDecay()
     return Wei(net_debt * Wei(1e18) / (Wei(1e18) + borrowing_rate))
 
-def logGlobalState(contracts):
-    print('\n ---- Global state ----')
-    num_troves = contracts.sortedTroves.getSize()
-    print('Num troves      ', num_troves)
-    activePoolColl = contracts.activePool.getETH()
-    activePoolDebt = contracts.activePool.getZSUSDDebt()
-    defaultPoolColl = contracts.defaultPool.getETH()
-    defaultPoolDebt = contracts.defaultPool.getZSUSDDebt()
+# Calls several views in a single eth_call through the Multicall test contract, or one by one
+# where it is not deployed (e.g. on the shadow ledger). `calls` are (contract, method name, args)
+# tuples; returns their results in the same order.
+def batch_call(contracts, calls):
+    multicall = getattr(contracts, 'multicall', None)
+    if multicall is None:
+        return [getattr(contract, name)(*args) for contract, name, args in calls]
+    methods = [getattr(contract, name) for contract, name, _ in calls]
+    _, return_data = multicall.aggregate(
+        [(contract.address, method.encode_input(*args)) for (contract, _, args), method in zip(calls, methods)]
+    )
+    return [method.decode_output(data) for method, data in zip(methods, return_data)]
+
+# entire debt and coll (pending rewards included) and stake of a trove
+class TroveData(namedtuple('TroveData', 'owner debt coll stake')):
+    # ICR at `price` (in Wei), as TroveManager.getCurrentICR
+    def ICR(self, price):
+        return Wei(self.coll * price // self.debt if self.debt > 0 else MAX_UINT)
+
+# Reads `count` troves in sorted order from position `start` (from the tail for a negative
+# start: -1 is the last trove) with a single call to MultiTroveGetter, and adds their pending
+# rewards as TroveManager does. Any extra `calls` are batched with it.
+# Returns the list of TroveData and the results of `calls`.
+def read_troves(contracts, start=0, count=MAX_UINT, calls=()):
+    troves, L_SOV, L_ZSUSDDebt, *results = batch_call(contracts, [
+        (contracts.multiTroveGetter, 'getMultipleSortedTroves', (start, count)),
+        (contracts.troveManager, 'L_SOV', ()),
+        (contracts.troveManager, 'L_ZSUSDDebt', ()),
+        *calls
+    ])
+    trove_data = [
+        TroveData(
+            owner,
+            Wei(debt + stake * (L_ZSUSDDebt - snapshot_ZSUSD_debt) // 10**18),
+            Wei(coll + stake * (L_SOV - snapshot_SOV) // 10**18),
+            Wei(stake)
+        )
+        for owner, debt, coll, stake, snapshot_SOV, snapshot_ZSUSD_debt in troves
+    ]
+    return trove_data, results
+
+# Reads the global state of the system, and prints it if `verbose`
+def logGlobalState(contracts, verbose=True):
+    # a single round-trip: the TCR, recovery mode and the last ICR are worked out from what it reads
+    last_troves, [num_troves, activePoolColl, activePoolDebt, defaultPoolColl, defaultPoolDebt, SP_ZSUSD, SP_ETH,
+                  price_ether_current, stakes_snapshot, coll_snapshot] = read_troves(contracts, -1, 1, [
+        (contracts.sortedTroves, 'getSize', ()),
+        (contracts.activePool, 'getETH', ()),
+        (contracts.activePool, 'getZSUSDDebt', ()),
+        (contracts.defaultPool, 'getETH', ()),
+        (contracts.defaultPool, 'getZSUSDDebt', ()),
+        (contracts.stabilityPool, 'getTotalZSUSDDeposits', ()),
+        (contracts.stabilityPool, 'getETH', ()),
+        (contracts.priceFeedTestnet, 'getPrice', ()),
+        (contracts.troveManager, 'totalStakesSnapshot', ()),
+        (contracts.troveManager, 'totalCollateralSnapshot', ()),
+    ])
     total_debt = (activePoolDebt + defaultPoolDebt).to("ether")
     total_coll = (activePoolColl + defaultPoolColl).to("ether")
-    print('Total Debt      ', total_debt)
-    print('Total Coll      ', total_coll)
-    SP_ZSUSD = contracts.stabilityPool.getTotalZSUSDDeposits().to("ether")
-    SP_ETH = contracts.stabilityPool.getETH().to("ether")
-    print('SP ZSUSD         ', SP_ZSUSD)
-    print('SP ETH          ', SP_ETH)
-    price_ether_current = contracts.priceFeedTestnet.getPrice()
+    SP_ZSUSD = SP_ZSUSD.to("ether")
+    SP_ETH = SP_ETH.to("ether")
     ETH_price = price_ether_current.to("ether")
-    print('ETH price       ', ETH_price)
-    TCR = contracts.troveManager.getTCR(price_ether_current).to("ether")
-    print('TCR             ', TCR)
-    recovery_mode = contracts.troveManager.checkRecoveryMode(price_ether_current)
-    print('Rec. Mode       ', recovery_mode)
-    stakes_snapshot = contracts.troveManager.totalStakesSnapshot()
-    coll_snapshot = contracts.troveManager.totalCollateralSnapshot()
-    print('Stake snapshot  ', stakes_snapshot.to("ether"))
-    print('Coll snapshot   ', coll_snapshot.to("ether"))
-    if stakes_snapshot > 0:
-        print('Snapshot ratio  ', coll_snapshot / stakes_snapshot)
-    last_trove = contracts.sortedTroves.getLast()
-    last_ICR = contracts.troveManager.getCurrentICR(last_trove, price_ether_current).to("ether")
-    #print('Last trove      ', last_trove)
-    print('Last trove’s ICR', last_ICR)
-    print(' ----------------------\n')
+    entire_system_coll = activePoolColl + defaultPoolColl
+    entire_system_debt = activePoolDebt + defaultPoolDebt
+    TCR = Wei(entire_system_coll * price_ether_current // entire_system_debt if entire_system_debt > 0 else MAX_UINT)
+    recovery_mode = TCR < Wei(15e17)
+    TCR = TCR.to("ether")
+    last_ICR = (last_troves[0].ICR(price_ether_current) if last_troves else Wei(MAX_UINT)).to("ether")
+
+    if verbose:
+        print('\n ---- Global state ----')
+        print('Num troves      ', num_troves)
+        print('Total Debt      ', total_debt)
+        print('Total Coll      ', total_coll)
+        print('SP ZSUSD         ', SP_ZSUSD)
+        print('SP ETH          ', SP_ETH)
+        print('ETH price       ', ETH_price)
+        print('TCR             ', TCR)
+        print('Rec. Mode       ', recovery_mode)
+        print('Stake snapshot  ', stakes_snapshot.to("ether"))
+        print('Coll snapshot   ', coll_snapshot.to("ether"))
+        if stakes_snapshot > 0:
+            print('Snapshot ratio  ', coll_snapshot / stakes_snapshot)
+        #print('Last trove      ', last_trove)
+        print('Last trove’s ICR', last_ICR)
+        print(' ----------------------\n')
 
     return [ETH_price, num_troves, total_coll, total_debt, TCR, recovery_mode, last_ICR, SP_ZSUSD, SP_ETH]
@@ -0,0 +1,201 @@
+from brownie import Wei
+
+from event_sync import EventFollower
+from helpers import ZERO_ADDRESS, MAX_UINT, batch_call
+from shadow_ledger import (DECIMAL_PRECISION, MCR, MIN_NET_DEBT, ZSUSD_GAS_COMPENSATION, APPLY_PENDING_REWARDS,
+                           compute_CR, compute_nominal_CR)
+
+# Hints for SortedTroves worked out locally, instead of with computeNominalCR, getApproxHint
+# (random sampling of up to 2000 troves on chain) and findInsertPosition round-trips.
+#
+#   hints = HintEngine()
+#   upper, lower = hints.insert_hints(contracts, NICR, borrower)
+#   first, NICR, amount, upper, lower = hints.redemption_hints(contracts, amount, price, 70)
+#
+# It keeps the troves in list order with their debt, coll, stake and reward snapshots, and
+# the L terms, so it knows every trove's nominal ICR with its pending rewards as
+# TroveManager.getNominalICR does. It is loaded from the chain with a single MultiTroveGetter
+# call, and then follows the TroveUpdated and LTermsUpdated events (see event_sync.py).
+# The hints are the two neighbours of the exact insert position, so SortedTroves takes them
+# without walking the list. It remembers the hints it gave for each borrower and places the
+# updated trove where SortedTroves puts it with them, so that it keeps the order of the list
+# even among troves with the same nominal ICR. It also notes which troves changed, for whoever
+# keeps something of its own from them (take_changed).
+
+class HintEngine(EventFollower):
+    follows = ('troveManager', 'borrowerOperations')
+
+    def __init__(self):
+        super().__init__()
+        self.ids = []  # in list order, from the highest nominal ICR
+        self.troves = {}  # id -> (debt, coll, stake, snapshot SOV, snapshot ZSUSD debt)
+        self.hints = {}  # id -> the (upper, lower) hints last given to insert it
+        self.changed = None  # ids of the troves updated since take_changed, None if it may be any
+        self.L_coll = 0
+        self.L_debt = 0
+
+    def load(self, contracts):
+        troves, L_coll, L_debt = batch_call(contracts, [
+            (contracts.multiTroveGetter, 'getMultipleSortedTroves', (0, MAX_UINT)),
+            (contracts.troveManager, 'L_SOV', ()),
+            (contracts.troveManager, 'L_ZSUSDDebt', ()),
+        ])
+        self.hints = {}
+        self.changed = None
+        self.ids = [str(trove[0]) for trove in troves]
+        self.troves = {str(owner): tuple(int(value) for value in values) for owner, *values in troves}
+        self.L_coll = int(L_coll)
+        self.L_debt = int(L_debt)
+
+    def apply(self, source, event):
+        if event.name == 'LTermsUpdated':
+            self.L_coll = int(event['_L_SOV'])
+            self.L_debt = int(event['_L_ZSUSDDebt'])
+            # the pending rewards of every trove change
+            self.changed = None
+        elif event.name == 'TroveUpdated':
+            id = str(event['_borrower'])
+            if self.changed is not None:
+                self.changed.add(id)
+            debt = int(event['_debt'])
+            # BorrowerOperations names it `stake`, TroveManager `_stake`
+            stake = int(event['_stake'] if '_stake' in event else event['stake'])
+            # a trove's rewards are applied, and its snapshots taken, before it is updated
+            trove = (debt, int(event['_coll']), stake, self.L_coll, self.L_debt)
+            if source == 'troveManager' and int(event['_operation']) == APPLY_PENDING_REWARDS:
+                # the trove stays where it is in the list
+                self.troves[id] = trove
+                return
+            if id in self.troves:
+                del self.troves[id]
+                self.ids.remove(id)
+            if debt > 0:
+                self.troves[id] = trove
+                upper, lower = self.hints.pop(id, (ZERO_ADDRESS, ZERO_ADDRESS))
+                self.ids.insert(self._insert_position(self.nominal_ICR(id), upper, lower), id)
+
+    ## Troves
+
+    # ids of the troves updated since the last call, or None if any of them may have been
+    def take_changed(self):
+        changed, self.changed = self.changed, set()
+        return changed
+
+    # debt and coll with pending rewards, as TroveManager.getEntireDebtAndColl
+    def entire_debt_and_coll(self, id):
+        debt, coll, stake, snapshot_coll, snapshot_debt = self.troves[id]
+        return (debt + stake * (self.L_debt - snapshot_debt) // DECIMAL_PRECISION,
+                coll + stake * (self.L_coll - snapshot_coll) // DECIMAL_PRECISION)
+
+    def nominal_ICR(self, id):
+        debt, coll = self.entire_debt_and_coll(id)
+        return compute_nominal_CR(coll, debt)
+
+    def current_ICR(self, id, price):
+        debt, coll = self.entire_debt_and_coll(id)
+        return compute_CR(coll, debt, price)
+
+    # first position whose trove has a nominal ICR below `NICR`, or not above it if `strict`
+    def _position(self, NICR, strict=False):
+        low, high = 0, len(self.ids)
+        while low < high:
+            middle = (low + high) // 2
+            middle_NICR = self.nominal_ICR(self.ids[middle])
+            if middle_NICR > NICR or (middle_NICR == NICR and not strict):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _index(self, id):
+        return self.ids.index(id) if id in self.troves else None
+
+    # Where SortedTroves.insert puts a trove with `NICR` given the `upper` and `lower` hints: any
+    # position from `first` to `last` keeps the list sorted. The hints are taken as they are if
+    # they are valid, else the list is walked as in findInsertPosition.
+    def _insert_position(self, NICR, upper, lower):
+        first, last = self._position(NICR, strict=True), self._position(NICR)
+        upper_index, lower_index = self._index(upper), self._index(lower)
+        if upper == ZERO_ADDRESS and lower == ZERO_ADDRESS:
+            hinted = 0 if not self.ids else None
+        elif upper == ZERO_ADDRESS:
+            hinted = 0 if lower_index == 0 else None
+        elif lower == ZERO_ADDRESS:
+            hinted = len(self.ids) if upper_index == len(self.ids) - 1 else None
+        else:
+            hinted = lower_index if upper_index is not None and upper_index + 1 == lower_index else None
+        if hinted is not None and first <= hinted <= last:
+            return hinted
+
+        if upper_index is not None and NICR > self.nominal_ICR(upper):
+            upper_index = None
+        if lower_index is not None and NICR < self.nominal_ICR(lower):
+            lower_index = None
+        if upper_index is None and lower_index is None:
+            # descending from the head
+            return first
+        if upper_index is None:
+            # ascending from the lower hint
+            return len(self.ids) if lower_index == len(self.ids) - 1 and NICR <= self.nominal_ICR(lower) else min(last, lower_index)
+        # descending from the upper hint
+        return 0 if upper_index == 0 and NICR >= self.nominal_ICR(upper) else max(first, upper_index + 1)
+
+    # the troves either side of `position`, skipping the ones in `exclude`
+    def _neighbours(self, position, exclude):
+        upper = position - 1
+        while upper >= 0 and self.ids[upper] in exclude:
+            upper -= 1
+        lower = position
+        while lower < len(self.ids) and self.ids[lower] in exclude:
+            lower += 1
+        return (self.ids[upper] if upper >= 0 else ZERO_ADDRESS,
+                self.ids[lower] if lower < len(self.ids) else ZERO_ADDRESS)
+
+    ## Hints
+
+    # (upper, lower) hints to open `borrower`'s trove with `NICR`, or re-insert it with it
+    def insert_hints(self, contracts, NICR, borrower=None):
+        self.sync(contracts)
+        if borrower is None:
+            return self._neighbours(self._position(int(NICR)), ())
+        hints = self._neighbours(self._position(int(NICR)), (str(borrower),))
+        self.hints[str(borrower)] = hints
+        return hints
+
+    # HintHelpers.getRedemptionHints, with the (upper, lower) hints to re-insert the partially
+    # redeemed trove once the troves redeemed before it are closed
+    def redemption_hints(self, contracts, ZSUSD_amount, price, max_iterations):
+        self.sync(contracts)
+        ZSUSD_amount, price = int(ZSUSD_amount), int(price)
+        remaining_ZSUSD = ZSUSD_amount
+        position = len(self.ids) - 1
+        while position >= 0 and self.current_ICR(self.ids[position], price) < MCR:
+            position -= 1
+        first_redemption_hint = self.ids[position] if position >= 0 else ZERO_ADDRESS
+
+        partial_redemption_hint_NICR = 0
+        redeemed = set()
+        iterations = max_iterations or MAX_UINT
+        while position >= 0 and remaining_ZSUSD > 0 and iterations > 0:
+            iterations -= 1
+            id = self.ids[position]
+            debt, coll = self.entire_debt_and_coll(id)
+            net_ZSUSD_debt = debt - ZSUSD_GAS_COMPENSATION
+            if net_ZSUSD_debt > remaining_ZSUSD:
+                if net_ZSUSD_debt > MIN_NET_DEBT:
+                    max_redeemable_ZSUSD = min(remaining_ZSUSD, net_ZSUSD_debt - MIN_NET_DEBT)
+                    new_coll = coll - max_redeemable_ZSUSD * DECIMAL_PRECISION // price
+                    new_debt = net_ZSUSD_debt - max_redeemable_ZSUSD
+                    partial_redemption_hint_NICR = compute_nominal_CR(new_coll, new_debt + ZSUSD_GAS_COMPENSATION)
+                    remaining_ZSUSD -= max_redeemable_ZSUSD
+                    redeemed.add(id)
+                break
+            remaining_ZSUSD -= net_ZSUSD_debt
+            redeemed.add(id)
+            position -= 1
+
+        upper, lower = self._neighbours(self._position(partial_redemption_hint_NICR), redeemed)
+        if partial_redemption_hint_NICR > 0:
+            self.hints[id] = (upper, lower)
+        return (first_redemption_hint, Wei(partial_redemption_hint_NICR), Wei(ZSUSD_amount - remaining_ZSUSD),
+                upper, lower)
@@ -0,0 +1,173 @@
+import random
+
+import pytest
+
+from helpers import ZERO_ADDRESS
+from hint_engine import HintEngine
+from shadow_ledger import MIN_NET_DEBT, ZSUSD_GAS_COMPENSATION
+from shadow_ledger_test import ACCOUNTS, E, WHALE, ledger_at_fixed_time, open_trove
+
+# The hints of HintEngine (hint_engine.py) against the list walks of SortedTroves and
+# HintHelpers, as the shadow ledger (shadow_ledger.py) does them, on troves with pending rewards
+# from a redistribution and some with the same nominal ICR.
+
+def ledger_with_troves(seed):
+    rng = random.Random(seed)
+    ledger = ledger_at_fixed_time()
+    open_trove(ledger, WHALE, 200000, 5000)
+    # five troves of the same nominal ICR
+    for account in ACCOUNTS[1:6]:
+        open_trove(ledger, account, 2000, 20)
+    for account in ACCOUNTS[6:]:
+        debt = rng.randint(1000, 6000)
+        ledger.borrowerOperations.openTrove(E, debt * E, ZERO_ADDRESS, ZERO_ADDRESS,
+                                            {'from': account, 'value': int(debt * rng.uniform(1.2, 3.0) / 200 * E)})
+    # with the stability pool empty, the troves liquidated are redistributed
+    ledger.priceFeedTestnet.setPrice(140 * E, {'from': WHALE})
+    ledger.troveManager.liquidateTroves(3, {'from': WHALE})
+    ledger.priceFeedTestnet.setPrice(200 * E, {'from': WHALE})
+    ledger.sleep(15 * 24 * 3600)
+    return ledger, rng
+
+def loaded(ledger):
+    engine = HintEngine()
+    engine.load(ledger)
+    return engine
+
+@pytest.mark.parametrize('seed', range(3))
+def test_troves_match_sorted_troves(seed):
+    ledger, _ = ledger_with_troves(seed)
+    tm = ledger.troveManager
+    engine = loaded(ledger)
+    assert engine.L_debt > 0
+    assert engine.ids == ledger.sortedTroves.ids()
+    for id in engine.ids:
+        assert engine.nominal_ICR(id) == tm._nominal_ICR(id)
+        assert engine.entire_debt_and_coll(id) == tuple(tm._entire_debt_and_coll(id)[:2])
+
+def test_insert_hints_of_an_empty_list():
+    ledger = ledger_at_fixed_time()
+    assert loaded(ledger).insert_hints(ledger, 2 * E) == (ZERO_ADDRESS, ZERO_ADDRESS)
+
+def test_insert_hints_at_the_ends_and_among_ties():
+    ledger, _ = ledger_with_troves(0)
+    sorted_troves, tm = ledger.sortedTroves, ledger.troveManager
+    engine = loaded(ledger)
+    ids = sorted_troves.ids()
+    head, tail = tm._nominal_ICR(ids[0]), tm._nominal_ICR(ids[-1])
+    assert engine.insert_hints(ledger, head + 1) == (ZERO_ADDRESS, ids[0])
+    assert engine.insert_hints(ledger, tail - 1) == (ids[-1], ZERO_ADDRESS)
+    # among troves of the same nominal ICR, any position between them is valid; the hints
+    # place the trove after them
+    tied = tm._nominal_ICR(ACCOUNTS[1])
+    upper, lower = engine.insert_hints(ledger, tied)
+    assert sorted_troves.validInsertPosition(tied, upper, lower)
+    assert tm._nominal_ICR(upper) == tied
+    assert lower == ZERO_ADDRESS or tm._nominal_ICR(lower) < tied
+
+@pytest.mark.parametrize('seed', range(3))
+def test_insert_hints_match_find_insert_position(seed):
+    ledger, rng = ledger_with_troves(seed)
+    sorted_troves, tm = ledger.sortedTroves, ledger.troveManager
+    engine = loaded(ledger)
+    NICRs = [tm._nominal_ICR(id) for id in sorted_troves.ids()]
+    for _ in range(100):
+        NICR = rng.choice(NICRs) if rng.random() < 0.3 else rng.randint(min(NICRs) // 2, max(NICRs) * 2)
+        upper, lower = engine.insert_hints(ledger, NICR)
+        assert sorted_troves.validInsertPosition(NICR, upper, lower)
+        if NICR not in NICRs:
+            # with no trove of the same nominal ICR there is a single valid position
+            assert (upper, lower) == tuple(sorted_troves.findInsertPosition(NICR, ZERO_ADDRESS, ZERO_ADDRESS))
+
+# Where the engine puts a trove updated with any hints, valid or not, is where SortedTroves does
+@pytest.mark.parametrize('seed', range(3))
+def test_insert_position_follows_sorted_troves_with_any_hints(seed):
+    ledger, rng = ledger_with_troves(seed)
+    sorted_troves, tm = ledger.sortedTroves, ledger.troveManager
+    engine = loaded(ledger)
+    ids = sorted_troves.ids()
+    NICRs = [tm._nominal_ICR(id) for id in ids]
+    candidates = ids + [ZERO_ADDRESS, ACCOUNTS[-1] if ACCOUNTS[-1] not in ids else ZERO_ADDRESS]
+    for _ in range(300):
+        NICR = rng.choice(NICRs) if rng.random() < 0.5 else rng.randint(min(NICRs) // 2, max(NICRs) * 2)
+        if rng.random() < 0.5:
+            # neighbours, valid or not
+            position = rng.randint(0, len(ids))
+            upper = ids[position - 1] if position > 0 else ZERO_ADDRESS
+            lower = ids[position] if position < len(ids) else ZERO_ADDRESS
+        else:
+            upper, lower = rng.choice(candidates), rng.choice(candidates)
+        prev_id, next_id = sorted_troves.findInsertPosition(NICR, upper, lower)
+        expected = ids.index(next_id) if next_id != ZERO_ADDRESS else len(ids)
+        assert engine._insert_position(NICR, upper, lower) == expected
+
+def test_reinsert_hints_leave_the_trove_out():
+    ledger, _ = ledger_with_troves(1)
+    sorted_troves, tm = ledger.sortedTroves, ledger.troveManager
+    borrower = sorted_troves.ids()[3]
+    debt, coll = tm._entire_debt_and_coll(borrower)[:2]
+    new_NICR = ledger.hintHelpers.computeNominalCR(coll + 5 * E, debt)
+    upper, lower = loaded(ledger).insert_hints(ledger, new_NICR, borrower)
+    assert borrower not in (upper, lower)
+    ledger.borrowerOperations.addColl(upper, lower, {'from': borrower, 'value': 5 * E})
+    assert (sorted_troves.getPrev(borrower), sorted_troves.getNext(borrower)) == (upper, lower)
+
+def redemption_hints_match(ledger, amount, price, max_iterations):
+    engine = loaded(ledger)
+    hints = engine.redemption_hints(ledger, amount, price, max_iterations)
+    assert hints[:3] == tuple(ledger.hintHelpers.getRedemptionHints(amount, price, max_iterations))
+    return engine, hints
+
+@pytest.mark.parametrize('seed', range(3))
+def test_redemption_hints_match_hint_helpers(seed):
+    ledger, rng = ledger_with_troves(seed)
+    sorted_troves, tm = ledger.sortedTroves, ledger.troveManager
+    partial = 0
+    for _ in range(20):
+        price = rng.randint(150, 250) * E
+        ledger.priceFeedTestnet.setPrice(price, {'from': WHALE})
+        amount = rng.randint(100, 20000) * E
+        max_iterations = rng.choice([0, 1, 3, 10])
+        engine, (first, NICR, truncated, upper, lower) = redemption_hints_match(ledger, amount, price, max_iterations)
+        if truncated == 0:
+            continue
+        tm.redeemCollateral(truncated, first, upper, lower, NICR, max_iterations, E, {'from': WHALE})
+        # the partially redeemed trove goes back in between the hints given for it
+        for id, hints in engine.hints.items():
+            if sorted_troves.contains(id):
+                partial += 1
+                assert (sorted_troves.getPrev(id), sorted_troves.getNext(id)) == hints
+        assert loaded(ledger).ids == sorted_troves.ids()
+    assert partial > 0
+
+def test_redemption_hints_skip_troves_below_MCR():
+    ledger, _ = ledger_with_troves(2)
+    tm, ids = ledger.troveManager, ledger.sortedTroves.ids()
+    # a price at which the last trove, and those of the same nominal ICR, are below the MCR
+    debt, coll = tm._entire_debt_and_coll(ids[-1])[:2]
+    price = 105 * debt * E // (100 * coll)
+    below = [id for id in ids if tm._current_ICR(id, price) < 11 * 10**17]
+    assert below and below == ids[-len(below):]
+    _, (first, _, _, _, _) = redemption_hints_match(ledger, 1000 * E, price, 0)
+    assert first == ids[-len(below) - 1]
+
+def test_redemption_hints_of_more_than_every_trove():
+    ledger, _ = ledger_with_troves(0)
+    tm, ids = ledger.troveManager, ledger.sortedTroves.ids()
+    net_debts = sum(tm._entire_debt_and_coll(id)[0] - ZSUSD_GAS_COMPENSATION for id in ids)
+    _, (first, NICR, truncated, upper, lower) = redemption_hints_match(ledger, 2 * net_debts, 200 * E, 0)
+    # every trove is redeemed in full, none partially
+    assert (first, NICR, truncated) == (ids[-1], 0, net_debts)
+    assert (upper, lower) == (ZERO_ADDRESS, ZERO_ADDRESS)
+
+def test_partial_redemption_below_the_minimum_net_debt_stops():
+    ledger, _ = ledger_with_troves(0)
+    tm, last = ledger.troveManager, ledger.sortedTroves.ids()[-1]
+    net_debt = tm._entire_debt_and_coll(last)[0] - ZSUSD_GAS_COMPENSATION
+    # leaves the last trove less than the minimum net debt: it is not redeemed from at all
+    amount = net_debt - MIN_NET_DEBT + 1
+    _, (first, NICR, truncated, _, _) = redemption_hints_match(ledger, amount, 200 * E, 0)
+    assert first == last
+    assert NICR > 0 and truncated == net_debt - MIN_NET_DEBT
+    _, (_, NICR, truncated, upper, lower) = redemption_hints_match(ledger, net_debt, 200 * E, 0)
+    assert (NICR, truncated) == (0, net_debt)
@@ -0,0 +1,64 @@
+import math
+
+from band_index import BandIndex
+
+# The inattention bands of the active troves as ether price intervals, so that adjust_troves
+# only looks at the troves the price took out of their band instead of at every trove.
+#
+#   bands = InattentionBands(hint_engine)
+#   for position in bands.exits(contracts, accounts, active_accounts, price_ether_current):
+#       ...  # active_accounts[position] may be adjusted
+#
+# The owner of a trove leaves it alone while (ICR - CR_initial) / (CR_initial * Rational_inattention)
+# stays within [-1, 2], that is while the ether price stays within
+# [CR_initial * (1 - Rational_inattention), CR_initial * (1 + 2 * Rational_inattention)] * debt / coll.
+# The bands are kept in a BandIndex (see macroModel/band_index.py) by account index, from the
+# troves a HintEngine follows, and only those of the troves it saw change are worked out again.
+# The positions given include the troves close to a bound of their band, for the caller to
+# decide on with its own check. An active account without a trove is always given, as every
+# trove was when all of them were read.
+
+class InattentionBands:
+    def __init__(self, hint_engine, band=(-1, 2)):
+        self.hint_engine = hint_engine
+        self.band = band
+        self.index = BandIndex()
+        self.active_accounts = None  # the AccountRegistry the bands are of
+
+    def _update(self, accounts, active_accounts):
+        changed = self.hint_engine.take_changed()
+        if changed is None or self.active_accounts is not active_accounts:
+            self.index.clear()
+            self.active_accounts = active_accounts
+            indexes = [entry['index'] for entry in active_accounts]
+        else:
+            indexes = {active_accounts.slots.get(id.lower()) for id in changed} - {None}
+
+        low, high = self.band
+        removed, ids, lows, highs = [], [], [], []
+        for index in indexes:
+            entry = active_accounts.by_index.get(index)
+            if entry is None:
+                removed.append(index)
+                continue
+            id = str(accounts[index])
+            ids.append(index)
+            if id not in self.hint_engine.troves:
+                lows.append(math.inf)
+                highs.append(math.inf)
+                continue
+            debt, coll = self.hint_engine.entire_debt_and_coll(id)
+            debt_per_coll = debt / coll if coll > 0 else math.inf
+            CR_initial, inattention = entry['CR_initial'], entry['Rational_inattention']
+            lows.append(CR_initial * (1 + low * inattention) * debt_per_coll)
+            highs.append(CR_initial * (1 + high * inattention) * debt_per_coll)
+        self.index.remove(removed)
+        self.index.set(ids, lows, highs)
+
+    # positions in `active_accounts`, in order, of the troves `price` is outside of the band of, or
+    # close to a bound of
+    def exits(self, contracts, accounts, active_accounts, price):
+        self.hint_engine.sync(contracts)
+        self._update(accounts, active_accounts)
+        positions = (active_accounts.position(int(index)) for index in self.index.exits(price))
+        return sorted(position for position in positions if position is not None)
@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+
+from liquidation_index import LiquidationIndex
+from trove_book import COLUMNS, TroveBook
+from trove_book_test import book_of, random_troves
+
+# The liquidation-price heap of the macro model (macroModel/liquidation_index.py), and
+# TroveBook.liquidatable with and without it, against the filter on CR_current it replaced.
+
+def test_empty_index():
+    index = LiquidationIndex()
+    assert len(index) == 0
+    ids, prices = index.pop_above(0.0)
+    assert ids.size == 0 and prices.size == 0
+    index.set([], [])
+    index.remove([3, 5000])
+    assert len(index) == 0
+
+def test_pop_above_includes_the_price_itself():
+    index = LiquidationIndex()
+    index.set([0, 1, 2], [1500.0, 1000.0, 1200.0])
+    ids, prices = index.pop_above(1200.0)
+    assert ids.tolist() == [0, 2]
+    assert prices.tolist() == [1500.0, 1200.0]
+    assert len(index) == 1
+    # popped troves are out of the index
+    assert index.pop_above(1200.0)[0].size == 0
+
+def test_ties_are_all_popped():
+    index = LiquidationIndex()
+    index.set([4, 1, 7, 2], 1300.0)
+    ids, _ = index.pop_above(1300.0)
+    assert sorted(ids.tolist()) == [1, 2, 4, 7]
+    assert len(index) == 0
+
+def test_set_again_replaces_the_price():
+    index = LiquidationIndex()
+    index.set([0, 1], [1500.0, 1400.0])
+    index.set(0, 900.0)
+    index.set(1, 1400.0)
+    assert len(index) == 2
+    # the stale entry of trove 0 at 1500 and the duplicate of trove 1 are skipped
+    ids, prices = index.pop_above(1000.0)
+    assert ids.tolist() == [1] and prices.tolist() == [1400.0]
+    assert index.pop_above(800.0)[0].tolist() == [0]
+    assert len(index) == 0
+
+def test_removed_troves_are_not_popped():
+    index = LiquidationIndex()
+    index.set([0, 1, 2], [1500.0, 1400.0, 1300.0])
+    index.remove([1, 1])
+    assert len(index) == 2
+    assert index.pop_above(0.0)[0].tolist() == [0, 2]
+    # removed, then indexed again
+    index.set(1, 1100.0)
+    assert len(index) == 1
+    assert index.pop_above(0.0)[0].tolist() == [1]
+
+def test_ids_past_the_initial_capacity():
+    index = LiquidationIndex()
+    ids = np.array([5, 1023, 1024, 70000])
+    index.set(ids, [1.0, 2.0, 3.0, 4.0])
+    assert len(index) == 4
+    assert index.pop_above(2.5)[0].tolist() == [70000, 1024]
+    assert index.pop_above(0.0)[0].tolist() == [1023, 5]
+
+def test_heap_is_rebuilt_once_stale_entries_pile_up():
+    rng = np.random.default_rng(0)
+    index = LiquidationIndex()
+    prices = rng.uniform(500, 1500, 100)
+    index.set(np.arange(100), prices)
+    for _ in range(50):
+        moved = rng.choice(100, 20, replace=False)
+        prices[moved] = rng.uniform(500, 1500, 20)
+        index.set(moved, prices[moved])
+    assert len(index) == 100
+    assert len(index._heap) <= 2 * len(index) + 64 + 20
+    ids, popped = index.pop_above(1000.0)
+    expected = np.flatnonzero(prices >= 1000.0)
+    np.testing.assert_array_equal(np.sort(ids), expected)
+    np.testing.assert_array_equal(popped, prices[ids])
+    assert np.all(np.diff(popped) <= 0)
+
+def liquidatable_by_filter(book):
+    CR = book['Ether_Price'] * book['Ether_Quantity'] / book['Supply']
+    return np.flatnonzero(CR < book.liquidation_ratio)
+
+def set_price(book, ether_price):
+    book['Ether_Price'] = ether_price
+    book.invalidate_CR()
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_liquidatable_of_an_empty_book(indexed):
+    assert TroveBook(indexed=indexed).liquidatable().size == 0
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_trove_at_the_liquidation_ratio_is_not_liquidated(indexed):
+    book = TroveBook(indexed=indexed)
+    book.extend(2000.0, [1.1, 1.2, 2.0], 1.5, 2000.0, 0.1)
+    # the first trove is exactly at the ratio at 2000, the second at 2000 * 1.1 / 1.2
+    set_price(book, 2000.0)
+    assert book.liquidatable().tolist() == []
+    set_price(book, 2000.0 * 1.1 / 1.2 - 1e-6)
+    assert book.liquidatable().tolist() == [0, 1]
+    book.discard([0, 1])
+    # looked at, held, and still indexed
+    set_price(book, 1000.0)
+    assert book.liquidatable().tolist() == [0]
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_liquidatable_follows_in_place_changes_once_touched(indexed):
+    frame = random_troves(np.random.default_rng(1), 20)
+    book = book_of(frame, indexed=indexed)
+    set_price(book, 1400.0)
+    expected = liquidatable_by_filter(book)
+    book.discard(expected)
+    assert book.liquidatable().size == 0
+    # drawing more debt brings a trove under the ratio
+    book['Supply'][3] *= 2.0
+    book.touch([3])
+    set_price(book, 1400.0)
+    expected = liquidatable_by_filter(book)
+    assert 3 in expected
+    np.testing.assert_array_equal(book.liquidatable(), expected)
+    # and more collateral lifts it back
+    book.discard(expected)
+    book['Ether_Quantity'][0] *= 10.0
+    book.touch([0])
+    set_price(book, 1400.0 / 4)
+    expected = liquidatable_by_filter(book)
+    assert 0 not in expected
+    np.testing.assert_array_equal(book.liquidatable(), expected)
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_discarded_troves_are_never_liquidatable(indexed):
+    frame = random_troves(np.random.default_rng(2), 30)
+    book = book_of(frame, indexed=indexed)
+    book.discard([0, 5, 6])
+    book.swap_remove(10)
+    set_price(book, 100.0)
+    assert book.liquidatable().tolist() == list(range(len(book)))
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_redeemed_troves_leave_the_index(indexed):
+    frame = random_troves(np.random.default_rng(4), 20)
+    book = book_of(frame, indexed=indexed)
+    book.sort_by('CR_current')
+    supply = book['Supply'].copy()
+    removed = book.redeem(supply[:3].sum() + supply[3] / 2, 2000.0)
+    assert removed == 3
+    # the boundary trove is indexed at its new liquidation price
+    set_price(book, 2000.0 * 1.1 / book['CR_current'][0] - 1e-6)
+    assert 0 in book.liquidatable()
+
+@pytest.mark.parametrize('indexed', [False, True])
+@pytest.mark.parametrize('seed', range(3))
+def test_liquidatable_matches_the_filter_along_a_price_path(seed, indexed):
+    rng = np.random.default_rng(seed)
+    book = book_of(random_troves(rng, 200), indexed=indexed)
+    ether_price = 2000.0
+    for _ in range(100):
+        ether_price *= np.exp(rng.normal(0, 0.05))
+        set_price(book, ether_price)
+        if rng.random() < 0.3:
+            new = random_troves(rng, 5, ether_price)
+            book.extend(*(new[name].to_numpy() for name in COLUMNS))
+        expected = liquidatable_by_filter(book)
+        np.testing.assert_array_equal(book.liquidatable(), expected)
+        book.discard(expected)
@@ -0,0 +1,181 @@
+import csv
+import math
+import os
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # only needed for the columnar outputs
+    pyarrow = None
+
+# Where test_run_simulation writes its results, one row per step:
+# - the csv it always wrote, with the same 15 columns,
+# - optionally a columnar copy with the step timings too, as Parquet (a directory with one
+#   file per flush) or as an Arrow IPC stream (a .arrows file), both needing pyarrow,
+# - optionally a binary log of fixed-size records (BINARY_LOG_DTYPE), to be read with
+#   `numpy.memmap(path, dtype=BINARY_LOG_DTYPE)`.
+#
+#   with open_results(simulation_csv, 'parquet', binary_log=True, flush_every=day) as results:
+#       results.write(row, timings)
+#
+# Rows are buffered and written out every `flush_every` steps, and on `flush`. What is written
+# out is complete on disk: a run that dies loses at most the rows since the last flush, and
+# every output can be read while the run goes on.
+
+FIELDS = ['iteration', 'ETH_price', 'price_ZSUSD', 'price_ZERO', 'num_troves', 'total_coll', 'total_debt', 'TCR',
+          'recovery_mode', 'last_ICR', 'SP_ZSUSD', 'SP_ETH', 'total_coll_added', 'total_coll_liquidated',
+          'total_zsusd_redempted']
+
+# seconds spent in each part of a step
+TIMINGS = ['time_liquidation', 'time_close', 'time_adjust', 'time_open', 'time_stability', 'time_stabilizer',
+           'time_step']
+
+INTEGER_FIELDS = ('iteration', 'num_troves')
+BOOLEAN_FIELDS = ('recovery_mode',)
+
+BINARY_LOG_DTYPE = np.dtype([
+    (name, '<i8' if name in INTEGER_FIELDS else '?' if name in BOOLEAN_FIELDS else '<f8')
+    for name in FIELDS + TIMINGS
+])
+
+# the row as numbers, with the timings (NaN where unknown)
+def _record(row, timings):
+    values = [int(value) if name in INTEGER_FIELDS else bool(value) if name in BOOLEAN_FIELDS else float(value)
+              for name, value in zip(FIELDS, row)]
+    return values + [math.nan if timings is None else float(timings.get(name, math.nan)) for name in TIMINGS]
+
+# The rows written since the last flush; each sink writes them out in its own `flush`
+class BufferedSink:
+    def __init__(self, flush_every):
+        self.flush_every = max(1, flush_every)
+        self.buffer = []
+
+    def write(self, row, timings=None):
+        self.buffer.append((row, timings))
+        if len(self.buffer) >= self.flush_every:
+            self.flush()
+
+    def _take(self):
+        rows, self.buffer = self.buffer, []
+        return rows
+
+class CsvSink(BufferedSink):
+    def __init__(self, path, flush_every):
+        super().__init__(flush_every)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file, delimiter=',')
+        self.writer.writerow(FIELDS)
+        self.file.flush()
+
+    def flush(self):
+        rows = self._take()
+        if rows:
+            self.writer.writerows(row for row, _ in rows)
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+class ArrowSink(BufferedSink):
+    def __init__(self, path, format, flush_every):
+        if pyarrow is None:
+            raise ImportError(f"results_format '{format}' needs pyarrow (pip install pyarrow)")
+        super().__init__(flush_every)
+        self.path = path
+        self.format = format
+        self.schema = pyarrow.schema([
+            (name, pyarrow.int64() if name in INTEGER_FIELDS else
+                   pyarrow.bool_() if name in BOOLEAN_FIELDS else pyarrow.float64())
+            for name in FIELDS + TIMINGS
+        ])
+        self.parts = 0
+        if format == 'parquet':
+            os.makedirs(path, exist_ok=True)
+            for name in os.listdir(path):
+                if name.startswith('part-') and name.endswith('.parquet'):
+                    os.remove(os.path.join(path, name))
+        elif format == 'arrow':
+            self.file = pyarrow.OSFile(path, 'wb')
+            self.writer = pyarrow.ipc.new_stream(self.file, self.schema)
+        else:
+            raise ValueError(f"unknown results_format '{format}', expected 'parquet' or 'arrow'")
+
+    def flush(self):
+        rows = self._take()
+        if not rows:
+            return
+        records = [_record(row, timings) for row, timings in rows]
+        batch = pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(zip(*records), self.schema)],
+            schema=self.schema
+        )
+        if self.format == 'parquet':
+            # one file per flush, written aside and moved in place so that only whole files are seen
+            part = os.path.join(self.path, f'part-{self.parts:05d}.parquet')
+            pyarrow.parquet.write_table(pyarrow.Table.from_batches([batch]), part + '.tmp')
+            os.replace(part + '.tmp', part)
+            self.parts += 1
+        else:
+            self.writer.write_batch(batch)
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.format == 'arrow':
+            self.writer.close()
+            self.file.close()
+
+class BinaryLogSink(BufferedSink):
+    def __init__(self, path, flush_every):
+        super().__init__(flush_every)
+        self.file = open(path, 'wb')
+
+    def flush(self):
+        rows = self._take()
+        if rows:
+            records = np.array([tuple(_record(row, timings)) for row, timings in rows], dtype=BINARY_LOG_DTYPE)
+            self.file.write(records.tobytes())
+            self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+# The csv and the outputs asked for, written together
+class Results:
+    def __init__(self, sinks):
+        self.sinks = sinks
+
+    def write(self, row, timings=None):
+        for sink in self.sinks:
+            sink.write(row, timings)
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# `columnar` is None, 'parquet' or 'arrow'. The other outputs are named after the csv:
+# simulation.parquet/, simulation.arrows, simulation.bin
+def open_results(csv_path, columnar=None, binary_log=False, flush_every=1):
+    base = os.path.splitext(csv_path)[0]
+    sinks = [CsvSink(csv_path, flush_every)]
+    if columnar == 'parquet':
+        sinks.append(ArrowSink(base + '.parquet', columnar, flush_every))
+    elif columnar is not None:
+        sinks.append(ArrowSink(base + '.arrows', columnar, flush_every))
+    if binary_log:
+        sinks.append(BinaryLogSink(base + '.bin', flush_every))
+    return Results(sinks)
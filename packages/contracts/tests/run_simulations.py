@@ -0,0 +1,131 @@
+import argparse
+import csv
+import os
+import queue
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import yaml
+
+# Runs test_run_simulation for many seeds in parallel, on one local dev chain per worker, and
+# merges their csv outputs into one file with a leading `seed` column.
+#
+#   python tests/run_simulations.py --seeds 1-64 --workers 16 --out simulations.csv
+#
+# Run it from packages/contracts. The contracts are compiled once, here, with the installed
+# compiler (nothing is downloaded). Every worker then runs in a copy of the project of its own:
+# the contracts, the harness and the models it imports, the compiled build folder, and a
+# brownie-config.yaml whose development network has the worker's port (base port + i) and a
+# network id of its own, otherwise the cmd_settings of the project's. No two brownie processes
+# write to the same build folder, tests.json included, and brownie's own list of networks is
+# left alone. Worker i runs its simulations one after the other in its copy, on the network
+# development. Each run gets its seed and output path through SIMULATION_SEED and
+# SIMULATION_CSV.
+
+TEST = 'tests/simulation_test.py::test_run_simulation'
+# what a worker's copy of the project is made of, besides its config and build folder
+PROJECT_FOLDERS = ('contracts', 'tests', 'macroModel', 'model')
+
+def project_path(run_dir, port):
+    return os.path.abspath(os.path.join(run_dir, f'project-{port}'))
+
+def _ignore(run_dir):
+    # bytecode, simulation outputs, and the run directory itself if it is among the copied folders
+    patterns = shutil.ignore_patterns('__pycache__', 'simulation.*', 'simulations*')
+    def ignore(folder, names):
+        return set(patterns(folder, names)) | {name for name in names
+                                               if os.path.abspath(os.path.join(folder, name)) == run_dir}
+    return ignore
+
+# a copy of the compiled project for each worker, with the worker's dev chain in its config
+def copy_projects(ports, run_dir):
+    with open('brownie-config.yaml') as f:
+        config = yaml.safe_load(f)
+    settings = config['networks']['development']['cmd_settings']
+    ignore = _ignore(os.path.abspath(run_dir))
+    for i, port in enumerate(ports, 1):
+        path = project_path(run_dir, port)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        shutil.copytree('build', os.path.join(path, 'build'))
+        for folder in PROJECT_FOLDERS:
+            shutil.copytree(folder, os.path.join(path, folder), ignore=ignore)
+        worker_settings = {**settings, 'port': port, 'network_id': settings['network_id'] + i}
+        worker_config = {**config, 'networks': {**config['networks'],
+                                                'development': {**config['networks']['development'],
+                                                                'cmd_settings': worker_settings}}}
+        with open(os.path.join(path, 'brownie-config.yaml'), 'w') as f:
+            yaml.safe_dump(worker_config, f, sort_keys=False)
+
+# "1-4,10" -> [1, 2, 3, 4, 10]
+def parse_seeds(text):
+    seeds = []
+    for part in text.split(','):
+        first, _, last = part.partition('-')
+        seeds.extend(range(int(first), int(last or first) + 1))
+    return seeds
+
+def run(seed, ports, out_dir):
+    port = ports.get()
+    try:
+        csv_path = os.path.abspath(os.path.join(out_dir, f'simulation_{seed}.csv'))
+        env = {**os.environ, 'SIMULATION_SEED': str(seed), 'SIMULATION_CSV': csv_path}
+        with open(os.path.join(out_dir, f'simulation_{seed}.log'), 'w') as log:
+            result = subprocess.run(['brownie', 'test', TEST, '--network', 'development', '-s'],
+                                    cwd=project_path(out_dir, port), env=env, stdout=log, stderr=subprocess.STDOUT)
+        return seed, csv_path, result.returncode
+    finally:
+        ports.put(port)
+
+def merge(results, out):
+    header = None
+    with open(out, 'w', newline='') as merged:
+        writer = csv.writer(merged)
+        for seed, csv_path, _ in sorted(results):
+            if not os.path.exists(csv_path):
+                continue
+            with open(csv_path, newline='') as f:
+                reader = csv.reader(f)
+                run_header = next(reader, None)
+                if run_header is None:
+                    continue
+                if header is None:
+                    header = run_header
+                    writer.writerow(['seed', *header])
+                writer.writerows([seed, *row] for row in reader)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the on-chain simulation for many seeds in parallel.')
+    parser.add_argument('--seeds', default='2019', help='seeds to run, e.g. 1-64 or 1,5,9 (default: 2019)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of dev chains (default: number of cores)')
+    parser.add_argument('--base-port', type=int, default=8546, help='port of the first dev chain (default: 8546)')
+    parser.add_argument('--out', default='tests/simulations.csv', help='merged csv (default: tests/simulations.csv)')
+    parser.add_argument('--run-dir', default='tests/simulations', help='per-run csvs and logs (default: tests/simulations)')
+    args = parser.parse_args(argv)
+
+    seeds = parse_seeds(args.seeds)
+    n_workers = min(args.workers, len(seeds))
+    worker_ports = list(range(args.base_port, args.base_port + n_workers))
+    ports = queue.Queue()
+    for port in worker_ports:
+        ports.put(port)
+    os.makedirs(args.run_dir, exist_ok=True)
+    # compile once, before any worker starts
+    subprocess.run(['brownie', 'compile'], check=True, stdout=subprocess.DEVNULL)
+    copy_projects(worker_ports, args.run_dir)
+
+    with ThreadPoolExecutor(max_workers=n_workers) as pool:
+        results = []
+        for seed, csv_path, returncode in pool.map(lambda seed: run(seed, ports, args.run_dir), seeds):
+            print(f'seed {seed}: {"ok" if returncode == 0 else f"failed ({returncode})"}')
+            results.append((seed, csv_path, returncode))
+
+    merge(results, args.out)
+    failed = [seed for seed, _, returncode in results if returncode != 0]
+    print(f'{len(seeds) - len(failed)}/{len(seeds)} runs passed, merged into {args.out}')
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
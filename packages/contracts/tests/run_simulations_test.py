@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+import subprocess
+import threading
+import time
+
+import yaml
+
+import run_simulations
+
+# The parallel runner (run_simulations.py) with two workers, on a project of its own in a
+# temporary folder and with `brownie` replaced by a stand-in that writes to the build folder of
+# the project it runs in, as brownie test does, and an output csv.
+
+CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'brownie-config.yaml')
+
+def write(path, text=''):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+def make_project(root):
+    with open(CONFIG) as f:
+        write(os.path.join(root, 'brownie-config.yaml'), f.read())
+    write(os.path.join(root, 'build', 'contracts', 'TroveManager.json'), '{}')
+    write(os.path.join(root, 'contracts', 'TroveManager.sol'))
+    write(os.path.join(root, 'tests', 'simulation_test.py'))
+    write(os.path.join(root, 'tests', '__pycache__', 'simulation_test.pyc'))
+    write(os.path.join(root, 'tests', 'simulation.csv'), 'left over\n')
+    write(os.path.join(root, 'macroModel', 'trove_book.py'))
+    write(os.path.join(root, 'model', 'sweep.py'))
+
+class FakeBrownie:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.running = set()
+        self.overlapped = False
+
+    def __call__(self, command, cwd=None, env=None, **kwargs):
+        if command[1] == 'compile':
+            return subprocess.CompletedProcess(command, 0)
+        assert command[1:] == ['test', run_simulations.TEST, '--network', 'development', '-s']
+        with self.lock:
+            self.overlapped |= bool(self.running)
+            self.running.add(cwd)
+        time.sleep(0.05)
+        with open(os.path.join(cwd, 'brownie-config.yaml')) as f:
+            port = yaml.safe_load(f)['networks']['development']['cmd_settings']['port']
+        tests_json = os.path.join(cwd, 'build', 'tests.json')
+        seeds = json.load(open(tests_json)) if os.path.exists(tests_json) else []
+        with open(tests_json, 'w') as f:
+            json.dump(seeds + [env['SIMULATION_SEED']], f)
+        with open(env['SIMULATION_CSV'], 'w', newline='') as f:
+            csv.writer(f).writerows([['port'], [port]])
+        with self.lock:
+            self.running.discard(cwd)
+        return subprocess.CompletedProcess(command, 0)
+
+def test_two_workers_run_in_projects_of_their_own(tmp_path, monkeypatch):
+    make_project(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    brownie = FakeBrownie()
+    monkeypatch.setattr(run_simulations.subprocess, 'run', brownie)
+    assert run_simulations.main(['--seeds', '1-6', '--workers', '2', '--out', 'simulations.csv']) == 0
+    assert brownie.overlapped
+
+    with open('simulations.csv', newline='') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == ['seed', 'port']
+    ports = {int(seed): int(port) for seed, port in rows[1:]}
+    assert sorted(ports) == [1, 2, 3, 4, 5, 6]
+    assert set(ports.values()) == {8546, 8547}
+
+    with open('brownie-config.yaml') as f:
+        config = yaml.safe_load(f)
+    settings = config['networks']['development'].pop('cmd_settings')
+    network_ids = {settings['network_id']}
+    for port in (8546, 8547):
+        project = run_simulations.project_path('tests/simulations', port)
+        with open(os.path.join(project, 'brownie-config.yaml')) as f:
+            worker_config = yaml.safe_load(f)
+        # the project's config, but for the port and network id of the worker's dev chain
+        worker_settings = worker_config['networks']['development'].pop('cmd_settings')
+        assert worker_config == config
+        assert worker_settings['port'] == port
+        assert {**worker_settings, 'port': 0, 'network_id': 0} == {**settings, 'port': 0, 'network_id': 0}
+        network_ids.add(worker_settings['network_id'])
+        # each worker wrote to its own build folder only
+        with open(os.path.join(project, 'build', 'tests.json')) as f:
+            assert sorted(map(int, json.load(f))) == sorted(seed for seed, p in ports.items() if p == port)
+        assert os.path.exists(os.path.join(project, 'build', 'contracts', 'TroveManager.json'))
+        for folder in run_simulations.PROJECT_FOLDERS:
+            assert os.path.isdir(os.path.join(project, folder))
+        # neither the run directory, nor outputs and bytecode, are copied
+        assert os.listdir(os.path.join(project, 'tests')) == ['simulation_test.py']
+    assert len(network_ids) == 3
+    assert not os.path.exists(os.path.join('build', 'tests.json'))
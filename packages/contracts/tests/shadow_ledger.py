@@ -0,0 +1,1721 @@
+import time
+from collections import defaultdict, namedtuple
+
+from brownie import Wei
+from eth_utils import keccak, to_checksum_address
+
+from helpers import ZERO_ADDRESS
+
+# Pure-Python shadow of the trove system: TroveManager (incl. redemptions), SortedTroves,
+# StabilityPool, ActivePool/DefaultPool/CollSurplusPool, ZSUSDToken, BorrowerOperations,
+# HintHelpers and PriceFeedTestnet, with the same integer (Wei) arithmetic as the contracts.
+#
+# A ShadowLedger has the same attributes as the `contracts` object of the simulation, with the
+# methods the harness calls, so the harness runs on it unchanged:
+#
+#   contracts = ShadowLedger()                                # offline, no chain at all
+#   accounts = shadow_accounts(1000)                          # ... and no brownie accounts
+#   contracts = MirroredContracts(contracts, ShadowLedger())  # on chain, every transaction mirrored
+#   contracts.verify(accounts)                                # raises ShadowDivergence on any mismatch
+#
+# Transactions take the usual brownie parameter dict ({'from': ..., 'value': ...}), return an
+# object with `events` and raise ShadowRevert with the contract's revert reason, leaving the
+# state untouched. Not mirrored: front ends, ZERO issuance and staking, and the SOV/ETH
+# balances of the accounts themselves.
+
+DECIMAL_PRECISION = 10**18
+NICR_PRECISION = 10**20
+MAX_UINT = 2**256 - 1
+
+# LiquityBase, LiquityBaseParams
+ZSUSD_GAS_COMPENSATION = 20 * 10**18
+MIN_NET_DEBT = 180 * 10**18
+MCR = 11 * 10**17
+CCR = 15 * 10**17
+PERCENT_DIVISOR = 200
+BORROWING_FEE_FLOOR = DECIMAL_PRECISION // 1000 * 5
+REDEMPTION_FEE_FLOOR = DECIMAL_PRECISION // 1000 * 5
+MAX_BORROWING_FEE = DECIMAL_PRECISION // 100 * 5
+
+# TroveManagerBase
+SECONDS_IN_ONE_MINUTE = 60
+MINUTE_DECAY_FACTOR = 999037758833783000
+BETA = 2
+BOOTSTRAP_PERIOD = 14 * 24 * 60 * 60
+
+# StabilityPool
+SCALE_FACTOR = 10**9
+
+# PriceFeedTestnet
+INITIAL_PRICE = 200 * 10**18
+
+# TroveManager Status
+NON_EXISTENT, ACTIVE, CLOSED_BY_OWNER, CLOSED_BY_LIQUIDATION, CLOSED_BY_REDEMPTION = range(5)
+# TroveManagerOperation
+APPLY_PENDING_REWARDS, LIQUIDATE_IN_NORMAL_MODE, LIQUIDATE_IN_RECOVERY_MODE, REDEEM_COLLATERAL = range(4)
+# BorrowerOperation
+OPEN_TROVE, CLOSE_TROVE, ADJUST_TROVE = range(3)
+
+# holders of ZSUSD that are contracts
+GAS_POOL = 'gasPool'
+FEE_DISTRIBUTOR = 'feeDistributor'
+
+Trove = namedtuple('Trove', 'debt coll stake status array_index')
+EMPTY_TROVE = Trove(0, 0, 0, NON_EXISTENT, 0)
+
+# values of a single liquidation, and totals of a liquidation sequence
+Liquidation = namedtuple('Liquidation', 'debt coll coll_gas_compensation ZSUSD_gas_compensation debt_to_offset '
+                                        'coll_to_send_to_SP debt_to_redistribute coll_to_redistribute coll_surplus')
+NO_LIQUIDATION = Liquidation(0, 0, 0, 0, 0, 0, 0, 0, 0)
+
+class ShadowRevert(Exception):
+    pass
+
+class ShadowDivergence(AssertionError):
+    pass
+
+### LiquityMath
+
+def dec_mul(x, y):
+    return (x * y + DECIMAL_PRECISION // 2) // DECIMAL_PRECISION
+
+def dec_pow(base, minutes):
+    minutes = min(minutes, 525600000)
+    if minutes == 0:
+        return DECIMAL_PRECISION
+    y = DECIMAL_PRECISION
+    x = base
+    n = minutes
+    while n > 1:
+        if n % 2 == 0:
+            x = dec_mul(x, x)
+            n = n // 2
+        else:
+            y = dec_mul(x, y)
+            x = dec_mul(x, x)
+            n = (n - 1) // 2
+    return dec_mul(x, y)
+
+def compute_nominal_CR(coll, debt):
+    if debt > 0:
+        return coll * NICR_PRECISION // debt
+    return MAX_UINT
+
+def compute_CR(coll, debt, price):
+    if debt > 0:
+        return coll * price // debt
+    return MAX_UINT
+
+def sub(a, b):
+    if b > a:
+        raise ShadowRevert('SafeMath: subtraction overflow')
+    return a - b
+
+def div(a, b):
+    if b == 0:
+        raise ShadowRevert('SafeMath: division by zero')
+    return a // b
+
+def require(condition, reason):
+    if not condition:
+        raise ShadowRevert(reason)
+
+def address(account):
+    return str(account)
+
+# `count` distinct checksummed addresses to run on the shadow ledger alone with, in place of
+# the accounts of a chain
+def shadow_accounts(count):
+    return [to_checksum_address(keccak(b'shadow account %d' % i)[-20:]) for i in range(count)]
+
+### Transactions
+
+# tuple returned by a view with several return values, also indexable by name like brownie's
+class ReturnValue(tuple):
+    def __new__(cls, values, names):
+        value = super().__new__(cls, values)
+        value.names = names
+        return value
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self.names.index(key)
+        return super().__getitem__(key)
+
+class ShadowTx:
+    def __init__(self, sender, value, timestamp):
+        self.sender = sender
+        self.value = value
+        self.timestamp = timestamp
+        self.events = defaultdict(list)
+        self.return_value = None
+
+    def emit(self, name, **args):
+        self.events[name].append(args)
+
+# Marks a state-changing contract method. Its last argument is the brownie transaction dict;
+# a 'timestamp' entry overrides the block timestamp (used to follow the chain when mirroring).
+def transaction(method):
+    def send(self, *args):
+        if args and isinstance(args[-1], dict):
+            *args, params = args
+        else:
+            params = {}
+        if 'from' not in params:
+            raise ValueError(f"{method.__name__}: no 'from' account given")
+        return self.ledger.transact(method, self, args, params)
+    send.__name__ = method.__name__
+    send.transaction = True
+    return send
+
+# Undo log of a transaction. The state of the contracts is their attributes, and the dicts
+# and lists among them, whose values are numbers, strings or tuples; every write to either
+# during a transaction records how to take it back, so a revert only undoes what the
+# transaction changed.
+
+MISSING = object()
+
+def _restore(mapping, key, value):
+    if value is MISSING:
+        dict.pop(mapping, key, None)
+    else:
+        dict.__setitem__(mapping, key, value)
+
+def _restore_list(items, values):
+    list.__setitem__(items, slice(None), values)
+
+class JournaledDict(dict):
+    def __init__(self, ledger, items=()):
+        super().__init__(items)
+        self.ledger = ledger
+
+    def __reduce__(self):
+        return type(self), (self.ledger, dict(self))
+
+    def _log(self, key):
+        journal = self.ledger.journal
+        if journal is not None:
+            journal.append((_restore, self, key, dict.get(self, key, MISSING)))
+
+    def __setitem__(self, key, value):
+        self._log(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._log(key)
+        super().__delitem__(key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self._log(key)
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def popitem(self):
+        key = next(reversed(self))
+        return key, self.pop(key)
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+class JournaledList(list):
+    def __init__(self, ledger, items=()):
+        super().__init__(items)
+        self.ledger = ledger
+
+    def __reduce__(self):
+        return type(self), (self.ledger, list(self))
+
+    def _log(self, undo, *args):
+        journal = self.ledger.journal
+        if journal is not None:
+            journal.append((undo, self, *args))
+
+    def append(self, value):
+        self._log(list.pop)
+        super().append(value)
+
+    def pop(self, index=-1):
+        index = range(len(self))[index]
+        value = super().pop(index)
+        self._log(list.insert, index, value)
+        return value
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            # rare: the whole list is kept
+            self._log(_restore_list, list(self))
+        else:
+            self._log(list.__setitem__, index, self[index])
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._log(_restore_list, list(self))
+        super().__delitem__(index)
+
+    def insert(self, index, value):
+        self._log(_restore_list, list(self))
+        super().insert(index, value)
+
+    def extend(self, values):
+        self._log(_restore_list, list(self))
+        super().extend(values)
+
+class ShadowContract:
+    def __init__(self, ledger, address):
+        self.ledger = ledger
+        self.address = address
+
+    # the dicts and lists of the state are kept journaled
+    def __setattr__(self, name, value):
+        if name != 'ledger':
+            if type(value) is dict:
+                value = JournaledDict(self.ledger, value)
+            elif type(value) is list:
+                value = JournaledList(self.ledger, value)
+            journal = self.ledger.journal
+            if journal is not None:
+                journal.append((_restore, self.__dict__, name, self.__dict__.get(name, MISSING)))
+        super().__setattr__(name, value)
+
+    def __repr__(self):
+        return f'<Shadow {self.address}>'
+
+### Contracts
+
+class ShadowPriceFeed(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'priceFeed')
+        self.price = INITIAL_PRICE
+
+    def getPrice(self):
+        return Wei(self.price)
+
+    def fetchPrice(self):
+        return Wei(self.price)
+
+    @transaction
+    def setPrice(self, price):
+        self.price = int(price)
+        return True
+
+class ShadowPool(ShadowContract):
+    def __init__(self, ledger, address):
+        super().__init__(ledger, address)
+        self.coll = 0
+        self.debt = 0
+
+    def getETH(self):
+        return Wei(self.coll)
+    getSOV = getETH
+
+    def getZSUSDDebt(self):
+        return Wei(self.debt)
+
+    def _send_coll(self, pool, amount):
+        self.coll = sub(self.coll, amount)
+        if pool is not None:
+            pool.coll += amount
+            self.ledger.tx.emit('SOVSent', _to=pool.address, _amount=amount)
+
+class ShadowCollSurplusPool(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'collSurplusPool')
+        self.coll = 0
+        self.balances = {}
+
+    def getETH(self):
+        return Wei(self.coll)
+    getSOV = getETH
+
+    def getCollateral(self, account):
+        return Wei(self.balances.get(address(account), 0))
+
+    def _account_surplus(self, account, amount):
+        self.balances[account] = self.balances.get(account, 0) + amount
+
+class ShadowZSUSDToken(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'zsusdToken')
+        self.balances = {}
+        self.total_supply = 0
+
+    def balanceOf(self, account):
+        return Wei(self.balances.get(address(account), 0))
+
+    def totalSupply(self):
+        return Wei(self.total_supply)
+
+    @transaction
+    def transfer(self, recipient, amount):
+        self._move(self.ledger.tx.sender, address(recipient), int(amount))
+        return True
+
+    def _move(self, sender, recipient, amount):
+        self.balances[sender] = sub(self.balances.get(sender, 0), amount)
+        self.balances[recipient] = self.balances.get(recipient, 0) + amount
+        self.ledger.tx.emit('Transfer', **{'from': sender, 'to': recipient, 'value': amount})
+
+    def _mint(self, account, amount):
+        self.total_supply += amount
+        self.balances[account] = self.balances.get(account, 0) + amount
+        self.ledger.tx.emit('Transfer', **{'from': ZERO_ADDRESS, 'to': account, 'value': amount})
+
+    def _burn(self, account, amount):
+        self.balances[account] = sub(self.balances.get(account, 0), amount)
+        self.total_supply -= amount
+        self.ledger.tx.emit('Transfer', **{'from': account, 'to': ZERO_ADDRESS, 'value': amount})
+
+# doubly linked list of troves ordered by descending NICR, as SortedTroves
+class ShadowSortedTroves(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'sortedTroves')
+        self.nodes = {}  # id -> (prev id, next id)
+        self.head = ZERO_ADDRESS
+        self.tail = ZERO_ADDRESS
+
+    def ids(self):
+        ids = []
+        id = self.head
+        while id != ZERO_ADDRESS:
+            ids.append(id)
+            id = self.nodes[id][1]
+        return ids
+
+    def contains(self, id):
+        return address(id) in self.nodes
+
+    def isEmpty(self):
+        return len(self.nodes) == 0
+
+    def getSize(self):
+        return len(self.nodes)
+
+    def getFirst(self):
+        return self.head
+
+    def getLast(self):
+        return self.tail
+
+    def getNext(self, id):
+        return self.nodes.get(address(id), (ZERO_ADDRESS, ZERO_ADDRESS))[1]
+
+    def getPrev(self, id):
+        return self.nodes.get(address(id), (ZERO_ADDRESS, ZERO_ADDRESS))[0]
+
+    def validInsertPosition(self, NICR, prev_id, next_id):
+        return self._valid_insert_position(int(NICR), address(prev_id), address(next_id))
+
+    def findInsertPosition(self, NICR, prev_id, next_id):
+        return self._find_insert_position(int(NICR), address(prev_id), address(next_id))
+
+    def _nominal_ICR(self, id):
+        return self.ledger.troveManager._nominal_ICR(id)
+
+    def _valid_insert_position(self, NICR, prev_id, next_id):
+        if prev_id == ZERO_ADDRESS and next_id == ZERO_ADDRESS:
+            return self.isEmpty()
+        if prev_id == ZERO_ADDRESS:
+            return self.head == next_id and NICR >= self._nominal_ICR(next_id)
+        if next_id == ZERO_ADDRESS:
+            return self.tail == prev_id and NICR <= self._nominal_ICR(prev_id)
+        return (self.getNext(prev_id) == next_id and
+                self._nominal_ICR(prev_id) >= NICR >= self._nominal_ICR(next_id))
+
+    def _descend_list(self, NICR, start_id):
+        if self.head == start_id and NICR >= self._nominal_ICR(start_id):
+            return ZERO_ADDRESS, start_id
+        prev_id = start_id
+        next_id = self.getNext(prev_id)
+        while prev_id != ZERO_ADDRESS and not self._valid_insert_position(NICR, prev_id, next_id):
+            prev_id = self.getNext(prev_id)
+            next_id = self.getNext(prev_id)
+        return prev_id, next_id
+
+    def _ascend_list(self, NICR, start_id):
+        if self.tail == start_id and NICR <= self._nominal_ICR(start_id):
+            return start_id, ZERO_ADDRESS
+        next_id = start_id
+        prev_id = self.getPrev(next_id)
+        while next_id != ZERO_ADDRESS and not self._valid_insert_position(NICR, prev_id, next_id):
+            next_id = self.getPrev(next_id)
+            prev_id = self.getPrev(next_id)
+        return prev_id, next_id
+
+    def _find_insert_position(self, NICR, prev_id, next_id):
+        if prev_id != ZERO_ADDRESS:
+            if prev_id not in self.nodes or NICR > self._nominal_ICR(prev_id):
+                prev_id = ZERO_ADDRESS
+        if next_id != ZERO_ADDRESS:
+            if next_id not in self.nodes or NICR < self._nominal_ICR(next_id):
+                next_id = ZERO_ADDRESS
+        if prev_id == ZERO_ADDRESS and next_id == ZERO_ADDRESS:
+            return self._descend_list(NICR, self.head)
+        if prev_id == ZERO_ADDRESS:
+            return self._ascend_list(NICR, next_id)
+        return self._descend_list(NICR, prev_id)
+
+    def _insert(self, id, NICR, prev_id, next_id):
+        require(id not in self.nodes, 'SortedTroves: List already contains the node')
+        require(id != ZERO_ADDRESS, 'SortedTroves: Id cannot be zero')
+        require(NICR > 0, 'SortedTroves: NICR must be positive')
+        prev_id = address(prev_id)
+        next_id = address(next_id)
+        if not self._valid_insert_position(NICR, prev_id, next_id):
+            prev_id, next_id = self._find_insert_position(NICR, prev_id, next_id)
+        if prev_id == ZERO_ADDRESS and next_id == ZERO_ADDRESS:
+            self.nodes[id] = (ZERO_ADDRESS, ZERO_ADDRESS)
+            self.head = self.tail = id
+        elif prev_id == ZERO_ADDRESS:
+            self.nodes[id] = (ZERO_ADDRESS, self.head)
+            self._set_prev(self.head, id)
+            self.head = id
+        elif next_id == ZERO_ADDRESS:
+            self.nodes[id] = (self.tail, ZERO_ADDRESS)
+            self._set_next(self.tail, id)
+            self.tail = id
+        else:
+            self.nodes[id] = (prev_id, next_id)
+            self._set_next(prev_id, id)
+            self._set_prev(next_id, id)
+
+    def _remove(self, id):
+        require(id in self.nodes, 'SortedTroves: List does not contain the id')
+        prev_id, next_id = self.nodes.pop(id)
+        if not self.nodes:
+            self.head = self.tail = ZERO_ADDRESS
+        elif id == self.head:
+            self.head = next_id
+            self._set_prev(self.head, ZERO_ADDRESS)
+        elif id == self.tail:
+            self.tail = prev_id
+            self._set_next(self.tail, ZERO_ADDRESS)
+        else:
+            self._set_next(prev_id, next_id)
+            self._set_prev(next_id, prev_id)
+
+    def _re_insert(self, id, NICR, prev_id, next_id):
+        require(id in self.nodes, 'SortedTroves: List does not contain the id')
+        require(NICR > 0, 'SortedTroves: NICR must be positive')
+        self._remove(id)
+        self._insert(id, NICR, prev_id, next_id)
+
+    def _set_prev(self, id, prev_id):
+        self.nodes[id] = (prev_id, self.nodes[id][1])
+
+    def _set_next(self, id, next_id):
+        self.nodes[id] = (self.nodes[id][0], next_id)
+
+class ShadowTroveManager(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'troveManager')
+        self.troves = {}
+        self.reward_snapshots = {}  # borrower -> (L_SOV, L_ZSUSDDebt)
+        self.owners = []
+        self.total_stakes = 0
+        self.total_stakes_snapshot = 0
+        self.total_collateral_snapshot = 0
+        # L_SOV and L_ZSUSDDebt
+        self.L_coll = 0
+        self.L_debt = 0
+        self.last_SOV_error_redistribution = 0
+        self.last_ZSUSD_debt_error_redistribution = 0
+        self.base_rate = 0
+        self.last_fee_operation_time = 0
+
+    ## Views
+
+    def ZSUSD_GAS_COMPENSATION(self):
+        return Wei(ZSUSD_GAS_COMPENSATION)
+
+    def MIN_NET_DEBT(self):
+        return Wei(MIN_NET_DEBT)
+
+    def MCR(self):
+        return Wei(MCR)
+
+    def CCR(self):
+        return Wei(CCR)
+
+    def baseRate(self):
+        return Wei(self.base_rate)
+
+    def totalStakes(self):
+        return Wei(self.total_stakes)
+
+    def L_SOV(self):
+        return Wei(self.L_coll)
+
+    def L_ZSUSDDebt(self):
+        return Wei(self.L_debt)
+
+    def Troves(self, borrower):
+        trove = self._trove(address(borrower))
+        return ReturnValue((Wei(trove.debt), Wei(trove.coll), Wei(trove.stake), trove.status, trove.array_index),
+                           ('debt', 'coll', 'stake', 'status', 'arrayIndex'))
+
+    def rewardSnapshots(self, borrower):
+        SOV, ZSUSD_debt = self.reward_snapshots.get(address(borrower), (0, 0))
+        return ReturnValue((Wei(SOV), Wei(ZSUSD_debt)), ('SOV', 'ZSUSDDebt'))
+
+    def totalStakesSnapshot(self):
+        return Wei(self.total_stakes_snapshot)
+
+    def totalCollateralSnapshot(self):
+        return Wei(self.total_collateral_snapshot)
+
+    def getTroveOwnersCount(self):
+        return len(self.owners)
+
+    def getTroveFromTroveOwnersArray(self, index):
+        return self.owners[index]
+
+    def getTroveStatus(self, borrower):
+        return self._trove(address(borrower)).status
+
+    def getTroveStake(self, borrower):
+        return Wei(self._trove(address(borrower)).stake)
+
+    def getTroveDebt(self, borrower):
+        return Wei(self._trove(address(borrower)).debt)
+
+    def getTroveColl(self, borrower):
+        return Wei(self._trove(address(borrower)).coll)
+
+    def getPendingETHReward(self, borrower):
+        return Wei(self._pending_rewards(address(borrower))[0])
+    getPendingSOVReward = getPendingETHReward
+
+    def getPendingZSUSDDebtReward(self, borrower):
+        return Wei(self._pending_rewards(address(borrower))[1])
+
+    def getEntireDebtAndColl(self, borrower):
+        debt, coll, pending_debt, pending_coll = self._entire_debt_and_coll(address(borrower))
+        return ReturnValue((Wei(debt), Wei(coll), Wei(pending_debt), Wei(pending_coll)),
+                           ('debt', 'coll', 'pendingZSUSDDebtReward', 'pendingETHReward'))
+
+    def getNominalICR(self, borrower):
+        return Wei(self._nominal_ICR(address(borrower)))
+
+    def getCurrentICR(self, borrower, price):
+        return Wei(self._current_ICR(address(borrower), int(price)))
+
+    def getEntireSystemColl(self):
+        return Wei(self._entire_system_coll())
+
+    def getEntireSystemDebt(self):
+        return Wei(self._entire_system_debt())
+
+    def getTCR(self, price):
+        return Wei(self._TCR(int(price)))
+
+    def checkRecoveryMode(self, price):
+        return self._check_recovery_mode(int(price))
+
+    def getBorrowingRate(self):
+        return Wei(self._borrowing_rate(self.base_rate))
+
+    def getBorrowingRateWithDecay(self):
+        return Wei(self._borrowing_rate(self._decayed_base_rate()))
+
+    def getBorrowingFee(self, ZSUSD_debt):
+        return Wei(self._borrowing_rate(self.base_rate) * int(ZSUSD_debt) // DECIMAL_PRECISION)
+
+    def getBorrowingFeeWithDecay(self, ZSUSD_debt):
+        return Wei(self._borrowing_rate(self._decayed_base_rate()) * int(ZSUSD_debt) // DECIMAL_PRECISION)
+
+    def getRedemptionRate(self):
+        return Wei(self._redemption_rate(self.base_rate))
+
+    def getRedemptionRateWithDecay(self):
+        return Wei(self._redemption_rate(self._decayed_base_rate()))
+
+    def getRedemptionFeeWithDecay(self, SOV_drawn):
+        return Wei(self._redemption_fee(self._redemption_rate(self._decayed_base_rate()), int(SOV_drawn)))
+
+    ## Trove accounting
+
+    def _trove(self, borrower):
+        return self.troves.get(borrower, EMPTY_TROVE)
+
+    def _update_trove(self, borrower, **changes):
+        self.troves[borrower] = self._trove(borrower)._replace(**changes)
+
+    def _pending_rewards(self, borrower):
+        trove = self._trove(borrower)
+        if trove.status != ACTIVE:
+            return 0, 0
+        snapshot_SOV, snapshot_ZSUSD_debt = self.reward_snapshots.get(borrower, (0, 0))
+        return (trove.stake * (self.L_coll - snapshot_SOV) // DECIMAL_PRECISION,
+                trove.stake * (self.L_debt - snapshot_ZSUSD_debt) // DECIMAL_PRECISION)
+
+    def _entire_debt_and_coll(self, borrower):
+        trove = self._trove(borrower)
+        pending_coll, pending_debt = self._pending_rewards(borrower)
+        return trove.debt + pending_debt, trove.coll + pending_coll, pending_debt, pending_coll
+
+    def _current_ICR(self, borrower, price):
+        debt, coll, _, _ = self._entire_debt_and_coll(borrower)
+        return compute_CR(coll, debt, price)
+
+    def _nominal_ICR(self, borrower):
+        debt, coll, _, _ = self._entire_debt_and_coll(borrower)
+        return compute_nominal_CR(coll, debt)
+
+    def _has_pending_rewards(self, borrower):
+        if self._trove(borrower).status != ACTIVE:
+            return False
+        return self.reward_snapshots.get(borrower, (0, 0))[0] < self.L_coll
+
+    def _apply_pending_rewards(self, borrower):
+        if not self._has_pending_rewards(borrower):
+            return
+        pending_coll, pending_debt = self._pending_rewards(borrower)
+        trove = self._trove(borrower)
+        self._update_trove(borrower, coll=trove.coll + pending_coll, debt=trove.debt + pending_debt)
+        self._update_trove_reward_snapshots(borrower)
+        self._move_pending_trove_rewards_to_active_pool(pending_debt, pending_coll)
+        trove = self._trove(borrower)
+        self.ledger.tx.emit('TroveUpdated', _borrower=borrower, _debt=trove.debt, _coll=trove.coll,
+                            _stake=trove.stake, _operation=APPLY_PENDING_REWARDS)
+
+    def _update_trove_reward_snapshots(self, borrower):
+        self.reward_snapshots[borrower] = (self.L_coll, self.L_debt)
+
+    def _move_pending_trove_rewards_to_active_pool(self, ZSUSD, SOV):
+        active_pool, default_pool = self.ledger.activePool, self.ledger.defaultPool
+        default_pool.debt = sub(default_pool.debt, ZSUSD)
+        self.ledger.tx.emit('DefaultPoolZSUSDDebtUpdated', _ZSUSDDebt=default_pool.debt)
+        active_pool.debt += ZSUSD
+        default_pool._send_coll(active_pool, SOV)
+
+    def _remove_stake(self, borrower):
+        self.total_stakes = sub(self.total_stakes, self._trove(borrower).stake)
+        self._update_trove(borrower, stake=0)
+
+    def _compute_new_stake(self, coll):
+        if self.total_collateral_snapshot == 0:
+            return coll
+        return coll * self.total_stakes_snapshot // self.total_collateral_snapshot
+
+    def _update_stake_and_total_stakes(self, borrower):
+        trove = self._trove(borrower)
+        new_stake = self._compute_new_stake(trove.coll)
+        self.total_stakes = self.total_stakes - trove.stake + new_stake
+        self._update_trove(borrower, stake=new_stake)
+        return new_stake
+
+    def _add_trove_owner_to_array(self, borrower):
+        self.owners.append(borrower)
+        index = len(self.owners) - 1
+        self._update_trove(borrower, array_index=index)
+        return index
+
+    def _remove_trove_owner(self, borrower):
+        index = self._trove(borrower).array_index
+        address_to_move = self.owners[-1]
+        self.owners[index] = address_to_move
+        self._update_trove(address_to_move, array_index=index)
+        self.owners.pop()
+
+    def _close_trove(self, borrower, status):
+        require(len(self.owners) > 1 and self.ledger.sortedTroves.getSize() > 1,
+                'TroveManager: Only one trove in the system')
+        self._update_trove(borrower, status=status, coll=0, debt=0)
+        self.reward_snapshots[borrower] = (0, 0)
+        self._remove_trove_owner(borrower)
+        self.ledger.sortedTroves._remove(borrower)
+
+    ## System
+
+    def _entire_system_coll(self):
+        return self.ledger.activePool.coll + self.ledger.defaultPool.coll
+
+    def _entire_system_debt(self):
+        return self.ledger.activePool.debt + self.ledger.defaultPool.debt
+
+    def _TCR(self, price):
+        return compute_CR(self._entire_system_coll(), self._entire_system_debt(), price)
+
+    def _check_recovery_mode(self, price):
+        return self._TCR(price) < CCR
+
+    ## Fees
+
+    def _borrowing_rate(self, base_rate):
+        return min(BORROWING_FEE_FLOOR + base_rate, MAX_BORROWING_FEE)
+
+    def _redemption_rate(self, base_rate):
+        return min(REDEMPTION_FEE_FLOOR + base_rate, DECIMAL_PRECISION)
+
+    def _redemption_fee(self, redemption_rate, SOV_drawn):
+        fee = redemption_rate * SOV_drawn // DECIMAL_PRECISION
+        require(fee < SOV_drawn, 'TroveManager: Fee would eat up all returned collateral')
+        return fee
+
+    def _decayed_base_rate(self):
+        minutes_passed = (self.ledger.now() - self.last_fee_operation_time) // SECONDS_IN_ONE_MINUTE
+        return self.base_rate * dec_pow(MINUTE_DECAY_FACTOR, minutes_passed) // DECIMAL_PRECISION
+
+    def _update_last_fee_op_time(self):
+        now = self.ledger.now()
+        if now - self.last_fee_operation_time >= SECONDS_IN_ONE_MINUTE:
+            self.last_fee_operation_time = now
+
+    def _decay_base_rate_from_borrowing(self):
+        self.base_rate = self._decayed_base_rate()
+        self.ledger.tx.emit('BaseRateUpdated', _baseRate=self.base_rate)
+        self._update_last_fee_op_time()
+
+    def _update_base_rate_from_redemption(self, SOV_drawn, price, total_ZSUSD_supply):
+        redeemed_ZSUSD_fraction = SOV_drawn * price // total_ZSUSD_supply
+        self.base_rate = min(self._decayed_base_rate() + redeemed_ZSUSD_fraction // BETA, DECIMAL_PRECISION)
+        self.ledger.tx.emit('BaseRateUpdated', _baseRate=self.base_rate)
+        self._update_last_fee_op_time()
+
+    ## Liquidations
+
+    @transaction
+    def liquidate(self, borrower):
+        borrower = address(borrower)
+        require(self._trove(borrower).status == ACTIVE, 'TroveManager: Trove does not exist or is closed')
+        self._batch_liquidate_troves([borrower])
+
+    @transaction
+    def liquidateTroves(self, n):
+        price = self.ledger.priceFeedTestnet.price
+        ZSUSD_in_stab_pool = self.ledger.stabilityPool.total_deposits
+        if self._check_recovery_mode(price):
+            totals = self._liquidate_troves_sequence_recovery_mode(price, ZSUSD_in_stab_pool, int(n))
+        else:
+            totals = self._liquidate_troves_sequence_normal_mode(price, ZSUSD_in_stab_pool, int(n))
+        self._finish_liquidation(totals)
+
+    @transaction
+    def batchLiquidateTroves(self, trove_array):
+        self._batch_liquidate_troves([address(trove) for trove in trove_array])
+
+    def _batch_liquidate_troves(self, trove_array):
+        require(len(trove_array) != 0, 'TroveManager: Calldata address array must not be empty')
+        price = self.ledger.priceFeedTestnet.price
+        ZSUSD_in_stab_pool = self.ledger.stabilityPool.total_deposits
+        if self._check_recovery_mode(price):
+            totals = self._batch_liquidate_recovery_mode(price, ZSUSD_in_stab_pool, trove_array)
+        else:
+            totals = self._batch_liquidate_normal_mode(price, ZSUSD_in_stab_pool, trove_array)
+        self._finish_liquidation(totals)
+
+    def _finish_liquidation(self, totals):
+        ledger = self.ledger
+        require(totals.debt > 0, 'TroveManager: nothing to liquidate')
+        ledger.stabilityPool._offset(totals.debt_to_offset, totals.coll_to_send_to_SP)
+        self._redistribute_debt_and_coll(totals.debt_to_redistribute, totals.coll_to_redistribute)
+        if totals.coll_surplus > 0:
+            ledger.activePool._send_coll(ledger.collSurplusPool, totals.coll_surplus)
+        self._update_system_snapshots_exclude_coll_remainder(totals.coll_gas_compensation)
+        ledger.tx.emit('Liquidation', _liquidatedDebt=totals.debt,
+                       _liquidatedColl=totals.coll - totals.coll_gas_compensation - totals.coll_surplus,
+                       _collGasCompensation=totals.coll_gas_compensation,
+                       _ZSUSDGasCompensation=totals.ZSUSD_gas_compensation)
+        # gas compensation to the liquidator
+        if totals.ZSUSD_gas_compensation > 0:
+            ledger.zsusdToken._move(GAS_POOL, ledger.tx.sender, totals.ZSUSD_gas_compensation)
+        if totals.coll_gas_compensation > 0:
+            ledger.activePool._send_coll(None, totals.coll_gas_compensation)
+
+    def _liquidate_troves_sequence_recovery_mode(self, price, ZSUSD_in_stab_pool, n):
+        sorted_troves = self.ledger.sortedTroves
+        totals = NO_LIQUIDATION
+        remaining_ZSUSD_in_stab_pool = ZSUSD_in_stab_pool
+        back_to_normal_mode = False
+        entire_system_debt = self._entire_system_debt()
+        entire_system_coll = self._entire_system_coll()
+        user = sorted_troves.getLast()
+        first_user = sorted_troves.getFirst()
+        i = 0
+        while i < n and user != first_user:
+            next_user = sorted_troves.getPrev(user)
+            ICR = self._current_ICR(user, price)
+            if not back_to_normal_mode:
+                if ICR >= MCR and remaining_ZSUSD_in_stab_pool == 0:
+                    break
+                TCR = compute_CR(entire_system_coll, entire_system_debt, price)
+                single = self._liquidate_recovery_mode(user, ICR, remaining_ZSUSD_in_stab_pool, TCR, price)
+                remaining_ZSUSD_in_stab_pool = sub(remaining_ZSUSD_in_stab_pool, single.debt_to_offset)
+                entire_system_debt = sub(entire_system_debt, single.debt_to_offset)
+                entire_system_coll = sub(sub(entire_system_coll, single.coll_to_send_to_SP), single.coll_surplus)
+                totals = Liquidation(*map(sum, zip(totals, single)))
+                back_to_normal_mode = compute_CR(entire_system_coll, entire_system_debt, price) >= CCR
+            elif ICR < MCR:
+                single = self._liquidate_normal_mode(user, remaining_ZSUSD_in_stab_pool)
+                remaining_ZSUSD_in_stab_pool = sub(remaining_ZSUSD_in_stab_pool, single.debt_to_offset)
+                totals = Liquidation(*map(sum, zip(totals, single)))
+            else:
+                break
+            user = next_user
+            i += 1
+        return totals
+
+    def _liquidate_troves_sequence_normal_mode(self, price, ZSUSD_in_stab_pool, n):
+        totals = NO_LIQUIDATION
+        remaining_ZSUSD_in_stab_pool = ZSUSD_in_stab_pool
+        for _ in range(n):
+            user = self.ledger.sortedTroves.getLast()
+            if self._current_ICR(user, price) >= MCR:
+                break
+            single = self._liquidate_normal_mode(user, remaining_ZSUSD_in_stab_pool)
+            remaining_ZSUSD_in_stab_pool = sub(remaining_ZSUSD_in_stab_pool, single.debt_to_offset)
+            totals = Liquidation(*map(sum, zip(totals, single)))
+        return totals
+
+    def _batch_liquidate_recovery_mode(self, price, ZSUSD_in_stab_pool, trove_array):
+        totals = NO_LIQUIDATION
+        remaining_ZSUSD_in_stab_pool = ZSUSD_in_stab_pool
+        back_to_normal_mode = False
+        entire_system_debt = self._entire_system_debt()
+        entire_system_coll = self._entire_system_coll()
+        for user in trove_array:
+            if self._trove(user).status != ACTIVE:
+                continue
+            ICR = self._current_ICR(user, price)
+            if not back_to_normal_mode:
+                if ICR >= MCR and remaining_ZSUSD_in_stab_pool == 0:
+                    continue
+                TCR = compute_CR(entire_system_coll, entire_system_debt, price)
+                single = self._liquidate_recovery_mode(user, ICR, remaining_ZSUSD_in_stab_pool, TCR, price)
+                remaining_ZSUSD_in_stab_pool = sub(remaining_ZSUSD_in_stab_pool, single.debt_to_offset)
+                entire_system_debt = sub(entire_system_debt, single.debt_to_offset)
+                entire_system_coll = sub(entire_system_coll, single.coll_to_send_to_SP)
+                totals = Liquidation(*map(sum, zip(totals, single)))
+                back_to_normal_mode = compute_CR(entire_system_coll, entire_system_debt, price) >= CCR
+            elif ICR < MCR:
+                single = self._liquidate_normal_mode(user, remaining_ZSUSD_in_stab_pool)
+                remaining_ZSUSD_in_stab_pool = sub(remaining_ZSUSD_in_stab_pool, single.debt_to_offset)
+                totals = Liquidation(*map(sum, zip(totals, single)))
+        return totals
+
+    def _batch_liquidate_normal_mode(self, price, ZSUSD_in_stab_pool, trove_array):
+        totals = NO_LIQUIDATION
+        remaining_ZSUSD_in_stab_pool = ZSUSD_in_stab_pool
+        for user in trove_array:
+            if self._current_ICR(user, price) < MCR:
+                single = self._liquidate_normal_mode(user, remaining_ZSUSD_in_stab_pool)
+                remaining_ZSUSD_in_stab_pool = sub(remaining_ZSUSD_in_stab_pool, single.debt_to_offset)
+                totals = Liquidation(*map(sum, zip(totals, single)))
+        return totals
+
+    def _liquidate_normal_mode(self, borrower, ZSUSD_in_stab_pool):
+        debt, coll, pending_debt, pending_coll = self._entire_debt_and_coll(borrower)
+        self._move_pending_trove_rewards_to_active_pool(pending_debt, pending_coll)
+        self._remove_stake(borrower)
+        coll_gas_compensation = coll // PERCENT_DIVISOR
+        offset = self._offset_and_redistribution_values(debt, coll - coll_gas_compensation, ZSUSD_in_stab_pool)
+        self._close_trove(borrower, CLOSED_BY_LIQUIDATION)
+        self._emit_liquidated(borrower, debt, coll, LIQUIDATE_IN_NORMAL_MODE)
+        return Liquidation(debt, coll, coll_gas_compensation, ZSUSD_GAS_COMPENSATION, *offset, 0)
+
+    def _liquidate_recovery_mode(self, borrower, ICR, ZSUSD_in_stab_pool, TCR, price):
+        if len(self.owners) <= 1:
+            return NO_LIQUIDATION
+        debt, coll, pending_debt, pending_coll = self._entire_debt_and_coll(borrower)
+        coll_gas_compensation = coll // PERCENT_DIVISOR
+        coll_to_liquidate = coll - coll_gas_compensation
+        if ICR <= DECIMAL_PRECISION:
+            # ICR <= 100%: redistribute everything
+            self._move_pending_trove_rewards_to_active_pool(pending_debt, pending_coll)
+            self._remove_stake(borrower)
+            single = Liquidation(debt, coll, coll_gas_compensation, ZSUSD_GAS_COMPENSATION,
+                                 0, 0, debt, coll_to_liquidate, 0)
+            self._close_trove(borrower, CLOSED_BY_LIQUIDATION)
+            self._emit_liquidated(borrower, debt, coll, LIQUIDATE_IN_RECOVERY_MODE)
+        elif ICR < MCR:
+            # 100% < ICR < MCR: offset and redistribute as in normal mode
+            self._move_pending_trove_rewards_to_active_pool(pending_debt, pending_coll)
+            self._remove_stake(borrower)
+            offset = self._offset_and_redistribution_values(debt, coll_to_liquidate, ZSUSD_in_stab_pool)
+            single = Liquidation(debt, coll, coll_gas_compensation, ZSUSD_GAS_COMPENSATION, *offset, 0)
+            self._close_trove(borrower, CLOSED_BY_LIQUIDATION)
+            self._emit_liquidated(borrower, debt, coll, LIQUIDATE_IN_RECOVERY_MODE)
+        elif ICR < TCR and debt <= ZSUSD_in_stab_pool:
+            # MCR <= ICR < TCR: offset only, at a capped rate of MCR, the rest is a collateral surplus
+            self._move_pending_trove_rewards_to_active_pool(pending_debt, pending_coll)
+            self._remove_stake(borrower)
+            single = self._capped_offset_values(debt, coll, price)
+            self._close_trove(borrower, CLOSED_BY_LIQUIDATION)
+            if single.coll_surplus > 0:
+                self.ledger.collSurplusPool._account_surplus(borrower, single.coll_surplus)
+            self._emit_liquidated(borrower, debt, single.coll_to_send_to_SP, LIQUIDATE_IN_RECOVERY_MODE)
+        else:
+            return NO_LIQUIDATION
+        return single
+
+    def _emit_liquidated(self, borrower, debt, coll, operation):
+        self.ledger.tx.emit('TroveLiquidated', _borrower=borrower, _debt=debt, _coll=coll, _operation=operation)
+        self.ledger.tx.emit('TroveUpdated', _borrower=borrower, _debt=0, _coll=0, _stake=0, _operation=operation)
+
+    def _offset_and_redistribution_values(self, debt, coll, ZSUSD_in_stab_pool):
+        if ZSUSD_in_stab_pool > 0:
+            debt_to_offset = min(debt, ZSUSD_in_stab_pool)
+            coll_to_send_to_SP = coll * debt_to_offset // debt
+            return debt_to_offset, coll_to_send_to_SP, debt - debt_to_offset, coll - coll_to_send_to_SP
+        return 0, 0, debt, coll
+
+    def _capped_offset_values(self, debt, coll, price):
+        coll_to_offset = debt * MCR // price
+        coll_gas_compensation = coll_to_offset // PERCENT_DIVISOR
+        return Liquidation(debt, coll, coll_gas_compensation, ZSUSD_GAS_COMPENSATION, debt,
+                           coll_to_offset - coll_gas_compensation, 0, 0, sub(coll, coll_to_offset))
+
+    def _redistribute_debt_and_coll(self, debt, coll):
+        if debt == 0:
+            return
+        SOV_numerator = coll * DECIMAL_PRECISION + self.last_SOV_error_redistribution
+        ZSUSD_debt_numerator = debt * DECIMAL_PRECISION + self.last_ZSUSD_debt_error_redistribution
+        SOV_reward_per_unit_staked = div(SOV_numerator, self.total_stakes)
+        ZSUSD_debt_reward_per_unit_staked = div(ZSUSD_debt_numerator, self.total_stakes)
+        self.last_SOV_error_redistribution = SOV_numerator - SOV_reward_per_unit_staked * self.total_stakes
+        self.last_ZSUSD_debt_error_redistribution = (ZSUSD_debt_numerator -
+                                                     ZSUSD_debt_reward_per_unit_staked * self.total_stakes)
+        self.L_coll += SOV_reward_per_unit_staked
+        self.L_debt += ZSUSD_debt_reward_per_unit_staked
+        self.ledger.tx.emit('LTermsUpdated', _L_SOV=self.L_coll, _L_ZSUSDDebt=self.L_debt)
+        active_pool, default_pool = self.ledger.activePool, self.ledger.defaultPool
+        active_pool.debt = sub(active_pool.debt, debt)
+        default_pool.debt += debt
+        self.ledger.tx.emit('DefaultPoolZSUSDDebtUpdated', _ZSUSDDebt=default_pool.debt)
+        active_pool._send_coll(default_pool, coll)
+
+    def _update_system_snapshots_exclude_coll_remainder(self, coll_remainder):
+        self.total_stakes_snapshot = self.total_stakes
+        self.total_collateral_snapshot = sub(self.ledger.activePool.coll, coll_remainder) + self.ledger.defaultPool.coll
+
+    ## Redemptions (TroveManagerRedeemOps)
+
+    @transaction
+    def redeemCollateral(self, ZSUSD_amount, first_redemption_hint, upper_partial_redemption_hint,
+                         lower_partial_redemption_hint, partial_redemption_hint_NICR, max_iterations, max_fee_percentage):
+        ledger = self.ledger
+        ZSUSD_amount, max_iterations, max_fee_percentage = int(ZSUSD_amount), int(max_iterations), int(max_fee_percentage)
+        require(REDEMPTION_FEE_FLOOR <= max_fee_percentage <= DECIMAL_PRECISION,
+                'Max fee percentage must be between 0.5% and 100%')
+        require(ledger.now() >= ledger.deployment_time + BOOTSTRAP_PERIOD,
+                'TroveManager: Redemptions are not allowed during bootstrap phase')
+        price = ledger.priceFeedTestnet.price
+        require(self._TCR(price) >= MCR, 'TroveManager: Cannot redeem when TCR < MCR')
+        require(ZSUSD_amount > 0, 'TroveManager: Amount must be greater than zero')
+        redeemer = ledger.tx.sender
+        require(ledger.zsusdToken.balances.get(redeemer, 0) >= ZSUSD_amount,
+                "TroveManager: Requested redemption amount must be <= user's ZSUSD token balance")
+        total_ZSUSD_supply_at_start = self._entire_system_debt()
+        remaining_ZSUSD = ZSUSD_amount
+
+        sorted_troves = ledger.sortedTroves
+        first_redemption_hint = address(first_redemption_hint)
+        if self._is_valid_first_redemption_hint(first_redemption_hint, price):
+            current_borrower = first_redemption_hint
+        else:
+            current_borrower = sorted_troves.getLast()
+            while current_borrower != ZERO_ADDRESS and self._current_ICR(current_borrower, price) < MCR:
+                current_borrower = sorted_troves.getPrev(current_borrower)
+
+        if max_iterations == 0:
+            max_iterations = MAX_UINT
+        total_ZSUSD_to_redeem = 0
+        total_SOV_drawn = 0
+        while current_borrower != ZERO_ADDRESS and remaining_ZSUSD > 0 and max_iterations > 0:
+            max_iterations -= 1
+            next_user_to_check = sorted_troves.getPrev(current_borrower)
+            self._apply_pending_rewards(current_borrower)
+            redemption = self._redeem_collateral_from_trove(
+                current_borrower, remaining_ZSUSD, price, address(upper_partial_redemption_hint),
+                address(lower_partial_redemption_hint), int(partial_redemption_hint_NICR))
+            if redemption is None:
+                # partial redemption cancelled
+                break
+            ZSUSD_lot, SOV_lot = redemption
+            total_ZSUSD_to_redeem += ZSUSD_lot
+            total_SOV_drawn += SOV_lot
+            remaining_ZSUSD -= ZSUSD_lot
+            current_borrower = next_user_to_check
+        require(total_SOV_drawn > 0, 'TroveManager: Unable to redeem any amount')
+
+        self._update_base_rate_from_redemption(total_SOV_drawn, price, total_ZSUSD_supply_at_start)
+        SOV_fee = self._redemption_fee(self._redemption_rate(self.base_rate), total_SOV_drawn)
+        require(SOV_fee * DECIMAL_PRECISION // total_SOV_drawn <= max_fee_percentage, 'Fee exceeded provided maximum')
+        ledger.activePool._send_coll(None, SOV_fee)
+        ledger.tx.emit('Redemption', _attemptedZSUSDAmount=ZSUSD_amount, _actualZSUSDAmount=total_ZSUSD_to_redeem,
+                       _SOVSent=total_SOV_drawn, _SOVFee=SOV_fee)
+        ledger.zsusdToken._burn(redeemer, total_ZSUSD_to_redeem)
+        ledger.activePool.debt = sub(ledger.activePool.debt, total_ZSUSD_to_redeem)
+        ledger.activePool._send_coll(None, total_SOV_drawn - SOV_fee)
+
+    def _is_valid_first_redemption_hint(self, first_redemption_hint, price):
+        sorted_troves = self.ledger.sortedTroves
+        if (first_redemption_hint == ZERO_ADDRESS or not sorted_troves.contains(first_redemption_hint) or
+                self._current_ICR(first_redemption_hint, price) < MCR):
+            return False
+        next_trove = sorted_troves.getNext(first_redemption_hint)
+        return next_trove == ZERO_ADDRESS or self._current_ICR(next_trove, price) < MCR
+
+    # ZSUSD and SOV taken from the trove, or None if its partial redemption is cancelled
+    def _redeem_collateral_from_trove(self, borrower, max_ZSUSD_amount, price, upper_partial_redemption_hint,
+                                      lower_partial_redemption_hint, partial_redemption_hint_NICR):
+        ledger = self.ledger
+        trove = self._trove(borrower)
+        ZSUSD_lot = min(max_ZSUSD_amount, sub(trove.debt, ZSUSD_GAS_COMPENSATION))
+        SOV_lot = ZSUSD_lot * DECIMAL_PRECISION // price
+        new_debt = trove.debt - ZSUSD_lot
+        new_coll = sub(trove.coll, SOV_lot)
+        if new_debt == ZSUSD_GAS_COMPENSATION:
+            self._remove_stake(borrower)
+            self._close_trove(borrower, CLOSED_BY_REDEMPTION)
+            # burn the liquidation reserve and leave the rest of the collateral as a surplus
+            ledger.zsusdToken._burn(GAS_POOL, ZSUSD_GAS_COMPENSATION)
+            ledger.activePool.debt = sub(ledger.activePool.debt, ZSUSD_GAS_COMPENSATION)
+            ledger.collSurplusPool._account_surplus(borrower, new_coll)
+            ledger.activePool._send_coll(ledger.collSurplusPool, new_coll)
+            ledger.tx.emit('TroveUpdated', _borrower=borrower, _debt=0, _coll=0, _stake=0, _operation=REDEEM_COLLATERAL)
+        else:
+            new_NICR = compute_nominal_CR(new_coll, new_debt)
+            if new_NICR != partial_redemption_hint_NICR or new_debt - ZSUSD_GAS_COMPENSATION < MIN_NET_DEBT:
+                return None
+            ledger.sortedTroves._re_insert(borrower, new_NICR, upper_partial_redemption_hint,
+                                           lower_partial_redemption_hint)
+            self._update_trove(borrower, debt=new_debt, coll=new_coll)
+            stake = self._update_stake_and_total_stakes(borrower)
+            ledger.tx.emit('TroveUpdated', _borrower=borrower, _debt=new_debt, _coll=new_coll, _stake=stake,
+                           _operation=REDEEM_COLLATERAL)
+        return ZSUSD_lot, SOV_lot
+
+class ShadowStabilityPool(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'stabilityPool')
+        self.coll = 0
+        self.total_deposits = 0
+        self.deposit_values = {}
+        self.deposit_snapshots = {}  # depositor -> (P, S, scale, epoch)
+        self.P = DECIMAL_PRECISION
+        self.current_scale = 0
+        self.current_epoch = 0
+        self.epoch_to_scale_to_sum = {}  # (epoch, scale) -> S
+        self.last_SOV_error_offset = 0
+        self.last_ZSUSD_loss_error_offset = 0
+
+    def getETH(self):
+        return Wei(self.coll)
+    getSOV = getETH
+
+    def getTotalZSUSDDeposits(self):
+        return Wei(self.total_deposits)
+
+    def deposits(self, depositor):
+        return ReturnValue((Wei(self.deposit_values.get(address(depositor), 0)), ZERO_ADDRESS),
+                           ('initialValue', 'frontEndTag'))
+
+    def getDepositorETHGain(self, depositor):
+        return Wei(self._depositor_gain(address(depositor)))
+    getDepositorSOVGain = getDepositorETHGain
+
+    def getCompoundedZSUSDDeposit(self, depositor):
+        return Wei(self._compounded_deposit(address(depositor)))
+
+    @transaction
+    def provideToSP(self, amount, front_end_tag):
+        ledger = self.ledger
+        depositor = ledger.tx.sender
+        amount = int(amount)
+        require(address(front_end_tag) == ZERO_ADDRESS,
+                'StabilityPool: Tag must be a registered front end, or the zero address')
+        require(amount > 0, 'StabilityPool: Amount must be non-zero')
+        initial_deposit = self.deposit_values.get(depositor, 0)
+        depositor_SOV_gain = self._depositor_gain(depositor)
+        compounded_deposit = self._compounded_deposit(depositor)
+        ledger.zsusdToken._move(depositor, self.address, amount)
+        self.total_deposits += amount
+        ledger.tx.emit('StabilityPoolZSUSDBalanceUpdated', _newBalance=self.total_deposits)
+        new_deposit = compounded_deposit + amount
+        self._update_deposit_and_snapshots(depositor, new_deposit)
+        ledger.tx.emit('UserDepositChanged', _depositor=depositor, _newDeposit=new_deposit)
+        ledger.tx.emit('SOVGainWithdrawn', _depositor=depositor, _SOV=depositor_SOV_gain,
+                       _ZSUSDLoss=initial_deposit - compounded_deposit)
+        self._send_SOV_gain_to_depositor(depositor_SOV_gain)
+
+    @transaction
+    def withdrawFromSP(self, amount):
+        ledger = self.ledger
+        depositor = ledger.tx.sender
+        amount = int(amount)
+        if amount != 0:
+            tm = ledger.troveManager
+            lowest_ICR = tm._current_ICR(ledger.sortedTroves.getLast(), ledger.priceFeedTestnet.price)
+            require(lowest_ICR >= MCR, 'StabilityPool: Cannot withdraw while there are troves with ICR < MCR')
+        initial_deposit = self.deposit_values.get(depositor, 0)
+        require(initial_deposit > 0, 'StabilityPool: User must have a non-zero deposit')
+        depositor_SOV_gain = self._depositor_gain(depositor)
+        compounded_deposit = self._compounded_deposit(depositor)
+        ZSUSD_to_withdraw = min(amount, compounded_deposit)
+        if ZSUSD_to_withdraw > 0:
+            ledger.zsusdToken._move(self.address, depositor, ZSUSD_to_withdraw)
+            self.total_deposits = sub(self.total_deposits, ZSUSD_to_withdraw)
+            ledger.tx.emit('StabilityPoolZSUSDBalanceUpdated', _newBalance=self.total_deposits)
+        new_deposit = compounded_deposit - ZSUSD_to_withdraw
+        self._update_deposit_and_snapshots(depositor, new_deposit)
+        ledger.tx.emit('UserDepositChanged', _depositor=depositor, _newDeposit=new_deposit)
+        ledger.tx.emit('SOVGainWithdrawn', _depositor=depositor, _SOV=depositor_SOV_gain,
+                       _ZSUSDLoss=initial_deposit - compounded_deposit)
+        self._send_SOV_gain_to_depositor(depositor_SOV_gain)
+
+    def _send_SOV_gain_to_depositor(self, amount):
+        if amount == 0:
+            return
+        self.coll = sub(self.coll, amount)
+        self.ledger.tx.emit('StabilityPoolSOVBalanceUpdated', _newBalance=self.coll)
+
+    def _depositor_gain(self, depositor):
+        initial_deposit = self.deposit_values.get(depositor, 0)
+        if initial_deposit == 0:
+            return 0
+        P_snapshot, S_snapshot, scale_snapshot, epoch_snapshot = self.deposit_snapshots[depositor]
+        first_portion = self.epoch_to_scale_to_sum.get((epoch_snapshot, scale_snapshot), 0) - S_snapshot
+        second_portion = self.epoch_to_scale_to_sum.get((epoch_snapshot, scale_snapshot + 1), 0) // SCALE_FACTOR
+        return initial_deposit * (first_portion + second_portion) // P_snapshot // DECIMAL_PRECISION
+
+    def _compounded_deposit(self, depositor):
+        initial_deposit = self.deposit_values.get(depositor, 0)
+        if initial_deposit == 0:
+            return 0
+        P_snapshot, _, scale_snapshot, epoch_snapshot = self.deposit_snapshots[depositor]
+        if epoch_snapshot < self.current_epoch:
+            return 0
+        scale_diff = self.current_scale - scale_snapshot
+        if scale_diff == 0:
+            compounded_deposit = initial_deposit * self.P // P_snapshot
+        elif scale_diff == 1:
+            compounded_deposit = initial_deposit * self.P // P_snapshot // SCALE_FACTOR
+        else:
+            compounded_deposit = 0
+        # below a billionth of the initial deposit it is just rounding error
+        if compounded_deposit < initial_deposit // 10**9:
+            return 0
+        return compounded_deposit
+
+    def _update_deposit_and_snapshots(self, depositor, new_value):
+        self.deposit_values[depositor] = new_value
+        if new_value == 0:
+            self.deposit_snapshots.pop(depositor, None)
+            return
+        S = self.epoch_to_scale_to_sum.get((self.current_epoch, self.current_scale), 0)
+        self.deposit_snapshots[depositor] = (self.P, S, self.current_scale, self.current_epoch)
+
+    def _offset(self, debt_to_offset, coll_to_add):
+        if self.total_deposits == 0 or debt_to_offset == 0:
+            return
+        SOV_gain_per_unit_staked, ZSUSD_loss_per_unit_staked = self._compute_rewards_per_unit_staked(
+            coll_to_add, debt_to_offset, self.total_deposits)
+        self._update_reward_sum_and_product(SOV_gain_per_unit_staked, ZSUSD_loss_per_unit_staked)
+        # cancel the debt with the deposits and take the collateral
+        ledger = self.ledger
+        ledger.activePool.debt = sub(ledger.activePool.debt, debt_to_offset)
+        self.total_deposits = sub(self.total_deposits, debt_to_offset)
+        ledger.tx.emit('StabilityPoolZSUSDBalanceUpdated', _newBalance=self.total_deposits)
+        ledger.zsusdToken._burn(self.address, debt_to_offset)
+        ledger.activePool._send_coll(self, coll_to_add)
+
+    def _compute_rewards_per_unit_staked(self, coll_to_add, debt_to_offset, total_deposits):
+        SOV_numerator = coll_to_add * DECIMAL_PRECISION + self.last_SOV_error_offset
+        if debt_to_offset == total_deposits:
+            ZSUSD_loss_per_unit_staked = DECIMAL_PRECISION
+            self.last_ZSUSD_loss_error_offset = 0
+        else:
+            ZSUSD_loss_numerator = debt_to_offset * DECIMAL_PRECISION - self.last_ZSUSD_loss_error_offset
+            # rounded up, so that the deposits never claim more than what is left
+            ZSUSD_loss_per_unit_staked = ZSUSD_loss_numerator // total_deposits + 1
+            self.last_ZSUSD_loss_error_offset = ZSUSD_loss_per_unit_staked * total_deposits - ZSUSD_loss_numerator
+        SOV_gain_per_unit_staked = SOV_numerator // total_deposits
+        self.last_SOV_error_offset = SOV_numerator - SOV_gain_per_unit_staked * total_deposits
+        return SOV_gain_per_unit_staked, ZSUSD_loss_per_unit_staked
+
+    def _update_reward_sum_and_product(self, SOV_gain_per_unit_staked, ZSUSD_loss_per_unit_staked):
+        new_product_factor = DECIMAL_PRECISION - ZSUSD_loss_per_unit_staked
+        key = (self.current_epoch, self.current_scale)
+        self.epoch_to_scale_to_sum[key] = self.epoch_to_scale_to_sum.get(key, 0) + SOV_gain_per_unit_staked * self.P
+        if new_product_factor == 0:
+            # the pool was emptied
+            self.current_epoch += 1
+            self.current_scale = 0
+            new_P = DECIMAL_PRECISION
+        elif self.P * new_product_factor // DECIMAL_PRECISION < SCALE_FACTOR:
+            new_P = self.P * new_product_factor * SCALE_FACTOR // DECIMAL_PRECISION
+            self.current_scale += 1
+        else:
+            new_P = self.P * new_product_factor // DECIMAL_PRECISION
+        assert new_P > 0
+        self.P = new_P
+
+class ShadowBorrowerOperations(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'borrowerOperations')
+
+    def getCompositeDebt(self, debt):
+        return Wei(int(debt) + ZSUSD_GAS_COMPENSATION)
+
+    def getNewTCRFromTroveChange(self, coll_change, is_coll_increase, debt_change, is_debt_increase, price):
+        return Wei(self._new_TCR(int(coll_change), is_coll_increase, int(debt_change), is_debt_increase, int(price)))
+
+    def getNewICRFromTroveChange(self, coll, debt, coll_change, is_coll_increase, debt_change, is_debt_increase, price):
+        new_coll, new_debt = self._new_trove_amounts(int(coll), int(debt), int(coll_change), is_coll_increase,
+                                                     int(debt_change), is_debt_increase)
+        return Wei(compute_CR(new_coll, new_debt, int(price)))
+
+    @transaction
+    def openTrove(self, max_fee_percentage, ZSUSD_amount, upper_hint, lower_hint, amount=0):
+        sender = self.ledger.tx.sender
+        self._open_trove(int(max_fee_percentage), int(ZSUSD_amount), upper_hint, lower_hint, sender,
+                         self._coll_received(amount), sender)
+
+    @transaction
+    def openTroveFrom(self, owner, max_fee_percentage, ZSUSD_amount, upper_hint, lower_hint, amount):
+        owner = address(owner)
+        self._open_trove(int(max_fee_percentage), int(ZSUSD_amount), upper_hint, lower_hint, owner, int(amount), owner)
+
+    @transaction
+    def addColl(self, upper_hint, lower_hint, amount=0):
+        self._adjust_trove(self.ledger.tx.sender, 0, 0, False, upper_hint, lower_hint, 0, self._coll_received(amount))
+
+    @transaction
+    def withdrawColl(self, coll_withdrawal, upper_hint, lower_hint):
+        self._adjust_trove(self.ledger.tx.sender, int(coll_withdrawal), 0, False, upper_hint, lower_hint, 0, 0)
+
+    @transaction
+    def withdrawZSUSD(self, max_fee_percentage, ZSUSD_amount, upper_hint, lower_hint):
+        self._adjust_trove(self.ledger.tx.sender, 0, int(ZSUSD_amount), True, upper_hint, lower_hint,
+                           int(max_fee_percentage), 0)
+
+    @transaction
+    def repayZSUSD(self, ZSUSD_amount, upper_hint, lower_hint):
+        self._adjust_trove(self.ledger.tx.sender, 0, int(ZSUSD_amount), False, upper_hint, lower_hint, 0, 0)
+
+    @transaction
+    def adjustTrove(self, max_fee_percentage, coll_withdrawal, ZSUSD_change, is_debt_increase, upper_hint,
+                    lower_hint, amount=0):
+        self._adjust_trove(self.ledger.tx.sender, int(coll_withdrawal), int(ZSUSD_change), is_debt_increase,
+                           upper_hint, lower_hint, int(max_fee_percentage), self._coll_received(amount))
+
+    @transaction
+    def closeTrove(self):
+        ledger = self.ledger
+        tm = ledger.troveManager
+        borrower = ledger.tx.sender
+        require(tm._trove(borrower).status == ACTIVE, 'BorrowerOps: Trove does not exist or is closed')
+        price = ledger.priceFeedTestnet.price
+        require(not tm._check_recovery_mode(price), 'BorrowerOps: Operation not permitted during Recovery Mode')
+        tm._apply_pending_rewards(borrower)
+        trove = tm._trove(borrower)
+        coll, debt = trove.coll, trove.debt
+        require(ledger.zsusdToken.balances.get(borrower, 0) >= sub(debt, ZSUSD_GAS_COMPENSATION),
+                'BorrowerOps: Caller doesnt have enough ZSUSD to make repayment')
+        require(self._new_TCR(coll, False, debt, False, price) >= CCR,
+                'BorrowerOps: An operation that would result in TCR < CCR is not permitted')
+        tm._remove_stake(borrower)
+        tm._close_trove(borrower, CLOSED_BY_OWNER)
+        ledger.tx.emit('TroveUpdated', _borrower=borrower, _debt=0, _coll=0, stake=0, operation=CLOSE_TROVE)
+        self._repay_ZSUSD(borrower, debt - ZSUSD_GAS_COMPENSATION)
+        self._repay_ZSUSD(GAS_POOL, ZSUSD_GAS_COMPENSATION)
+        ledger.activePool._send_coll(None, coll)
+
+    # collateral sent with the transaction: the `_amount` argument, or the value of an ETH transfer
+    def _coll_received(self, amount):
+        return int(amount) or self.ledger.tx.value
+
+    def _open_trove(self, max_fee_percentage, ZSUSD_amount, upper_hint, lower_hint, sender, coll, tokens_recipient):
+        ledger = self.ledger
+        tm = ledger.troveManager
+        price = ledger.priceFeedTestnet.price
+        is_recovery_mode = tm._check_recovery_mode(price)
+        self._require_valid_max_fee_percentage(max_fee_percentage, is_recovery_mode)
+        require(tm._trove(sender).status != ACTIVE, 'BorrowerOps: Trove is active')
+        ZSUSD_fee = 0
+        net_debt = ZSUSD_amount
+        if not is_recovery_mode:
+            ZSUSD_fee = self._trigger_borrowing_fee(ZSUSD_amount, max_fee_percentage)
+            net_debt += ZSUSD_fee
+        self._require_at_least_min_net_debt(net_debt)
+        composite_debt = net_debt + ZSUSD_GAS_COMPENSATION
+        ICR = compute_CR(coll, composite_debt, price)
+        NICR = compute_nominal_CR(coll, composite_debt)
+        if is_recovery_mode:
+            self._require_ICR_is_above_CCR(ICR)
+        else:
+            self._require_ICR_is_above_MCR(ICR)
+            self._require_new_TCR_is_above_CCR(self._new_TCR(coll, True, composite_debt, True, price))
+
+        trove = tm._trove(sender)
+        tm._update_trove(sender, status=ACTIVE, coll=trove.coll + coll, debt=trove.debt + composite_debt)
+        tm._update_trove_reward_snapshots(sender)
+        stake = tm._update_stake_and_total_stakes(sender)
+        ledger.sortedTroves._insert(sender, NICR, upper_hint, lower_hint)
+        array_index = tm._add_trove_owner_to_array(sender)
+        ledger.tx.emit('TroveCreated', _borrower=sender, arrayIndex=array_index)
+
+        ledger.activePool.coll += coll
+        self._withdraw_ZSUSD(tokens_recipient, ZSUSD_amount, net_debt)
+        self._withdraw_ZSUSD(GAS_POOL, ZSUSD_GAS_COMPENSATION, ZSUSD_GAS_COMPENSATION)
+        ledger.tx.emit('TroveUpdated', _borrower=sender, _debt=composite_debt, _coll=coll, stake=stake,
+                       operation=OPEN_TROVE)
+        ledger.tx.emit('ZSUSDBorrowingFeePaid', _borrower=sender, _ZSUSDFee=ZSUSD_fee)
+
+    def _adjust_trove(self, borrower, coll_withdrawal, ZSUSD_change, is_debt_increase, upper_hint, lower_hint,
+                      max_fee_percentage, coll_received):
+        ledger = self.ledger
+        tm = ledger.troveManager
+        price = ledger.priceFeedTestnet.price
+        is_recovery_mode = tm._check_recovery_mode(price)
+        if is_debt_increase:
+            self._require_valid_max_fee_percentage(max_fee_percentage, is_recovery_mode)
+            require(ZSUSD_change > 0, 'BorrowerOps: Debt increase requires non-zero debtChange')
+        require(coll_received == 0 or coll_withdrawal == 0, 'BorrowerOperations: Cannot withdraw and add coll')
+        require(coll_received != 0 or coll_withdrawal != 0 or ZSUSD_change != 0,
+                'BorrowerOps: There must be either a collateral change or a debt change')
+        require(tm._trove(borrower).status == ACTIVE, 'BorrowerOps: Trove does not exist or is closed')
+
+        tm._apply_pending_rewards(borrower)
+        if coll_received != 0:
+            coll_change, is_coll_increase = coll_received, True
+        else:
+            coll_change, is_coll_increase = coll_withdrawal, False
+        net_debt_change = ZSUSD_change
+        ZSUSD_fee = 0
+        if is_debt_increase and not is_recovery_mode:
+            ZSUSD_fee = self._trigger_borrowing_fee(ZSUSD_change, max_fee_percentage)
+            net_debt_change += ZSUSD_fee
+
+        trove = tm._trove(borrower)
+        debt, coll = trove.debt, trove.coll
+        old_ICR = compute_CR(coll, debt, price)
+        new_coll, new_debt = self._new_trove_amounts(coll, debt, coll_change, is_coll_increase, net_debt_change,
+                                                     is_debt_increase)
+        new_ICR = compute_CR(new_coll, new_debt, price)
+        assert coll_withdrawal <= coll
+        if is_recovery_mode:
+            require(coll_withdrawal == 0, 'BorrowerOps: Collateral withdrawal not permitted Recovery Mode')
+            if is_debt_increase:
+                self._require_ICR_is_above_CCR(new_ICR)
+                require(new_ICR >= old_ICR, "BorrowerOps: Cannot decrease your Trove's ICR in Recovery Mode")
+        else:
+            self._require_ICR_is_above_MCR(new_ICR)
+            self._require_new_TCR_is_above_CCR(
+                self._new_TCR(coll_change, is_coll_increase, net_debt_change, is_debt_increase, price))
+        if not is_debt_increase and ZSUSD_change > 0:
+            self._require_at_least_min_net_debt(sub(sub(debt, ZSUSD_GAS_COMPENSATION), net_debt_change))
+            require(net_debt_change <= sub(debt, ZSUSD_GAS_COMPENSATION),
+                    "BorrowerOps: Amount repaid must not be larger than the Trove's debt")
+            require(ledger.zsusdToken.balances.get(borrower, 0) >= net_debt_change,
+                    'BorrowerOps: Caller doesnt have enough ZSUSD to make repayment')
+
+        tm._update_trove(borrower, coll=new_coll, debt=new_debt)
+        stake = tm._update_stake_and_total_stakes(borrower)
+        ledger.sortedTroves._re_insert(borrower, compute_nominal_CR(new_coll, new_debt), upper_hint, lower_hint)
+        ledger.tx.emit('TroveUpdated', _borrower=borrower, _debt=new_debt, _coll=new_coll, stake=stake,
+                       operation=ADJUST_TROVE)
+        ledger.tx.emit('ZSUSDBorrowingFeePaid', _borrower=borrower, _ZSUSDFee=ZSUSD_fee)
+
+        if is_debt_increase:
+            self._withdraw_ZSUSD(borrower, ZSUSD_change, net_debt_change)
+        else:
+            self._repay_ZSUSD(borrower, ZSUSD_change)
+        if is_coll_increase:
+            ledger.activePool.coll += coll_change
+        else:
+            ledger.activePool._send_coll(None, coll_change)
+
+    def _trigger_borrowing_fee(self, ZSUSD_amount, max_fee_percentage):
+        tm = self.ledger.troveManager
+        tm._decay_base_rate_from_borrowing()
+        ZSUSD_fee = tm._borrowing_rate(tm.base_rate) * ZSUSD_amount // DECIMAL_PRECISION
+        require(div(ZSUSD_fee * DECIMAL_PRECISION, ZSUSD_amount) <= max_fee_percentage, 'Fee exceeded provided maximum')
+        self.ledger.zsusdToken._mint(FEE_DISTRIBUTOR, ZSUSD_fee)
+        return ZSUSD_fee
+
+    def _withdraw_ZSUSD(self, account, ZSUSD_amount, net_debt_increase):
+        self.ledger.activePool.debt += net_debt_increase
+        self.ledger.zsusdToken._mint(account, ZSUSD_amount)
+
+    def _repay_ZSUSD(self, account, ZSUSD):
+        self.ledger.activePool.debt = sub(self.ledger.activePool.debt, ZSUSD)
+        self.ledger.zsusdToken._burn(account, ZSUSD)
+
+    def _new_trove_amounts(self, coll, debt, coll_change, is_coll_increase, debt_change, is_debt_increase):
+        new_coll = coll + coll_change if is_coll_increase else sub(coll, coll_change)
+        new_debt = debt + debt_change if is_debt_increase else sub(debt, debt_change)
+        return new_coll, new_debt
+
+    def _new_TCR(self, coll_change, is_coll_increase, debt_change, is_debt_increase, price):
+        tm = self.ledger.troveManager
+        total_coll, total_debt = self._new_trove_amounts(tm._entire_system_coll(), tm._entire_system_debt(),
+                                                         coll_change, is_coll_increase, debt_change, is_debt_increase)
+        return compute_CR(total_coll, total_debt, price)
+
+    def _require_valid_max_fee_percentage(self, max_fee_percentage, is_recovery_mode):
+        if is_recovery_mode:
+            require(max_fee_percentage <= DECIMAL_PRECISION, 'Max fee percentage must less than or equal to 100%')
+        else:
+            require(BORROWING_FEE_FLOOR <= max_fee_percentage <= DECIMAL_PRECISION,
+                    'Max fee percentage must be between 0.5% and 100%')
+
+    def _require_at_least_min_net_debt(self, net_debt):
+        require(net_debt >= MIN_NET_DEBT, "BorrowerOps: Trove's net debt must be greater than minimum")
+
+    def _require_ICR_is_above_MCR(self, ICR):
+        require(ICR >= MCR, 'BorrowerOps: An operation that would result in ICR < MCR is not permitted')
+
+    def _require_ICR_is_above_CCR(self, ICR):
+        require(ICR >= CCR, 'BorrowerOps: Operation must leave trove with ICR >= CCR')
+
+    def _require_new_TCR_is_above_CCR(self, TCR):
+        require(TCR >= CCR, 'BorrowerOps: An operation that would result in TCR < CCR is not permitted')
+
+class ShadowHintHelpers(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'hintHelpers')
+
+    def computeNominalCR(self, coll, debt):
+        return Wei(compute_nominal_CR(int(coll), int(debt)))
+
+    def computeCR(self, coll, debt, price):
+        return Wei(compute_CR(int(coll), int(debt), int(price)))
+
+    # same pseudo-random sampling of TroveOwners as the contract, so it returns the same hint
+    def getApproxHint(self, CR, num_trials, input_random_seed):
+        tm = self.ledger.troveManager
+        CR = int(CR)
+        if not tm.owners:
+            return ReturnValue((ZERO_ADDRESS, Wei(0), input_random_seed), ('hintAddress', 'diff', 'latestRandomSeed'))
+        hint_address = self.ledger.sortedTroves.getLast()
+        diff = abs(CR - tm._nominal_ICR(hint_address))
+        latest_random_seed = int(input_random_seed)
+        for _ in range(1, int(num_trials)):
+            latest_random_seed = int.from_bytes(keccak(latest_random_seed.to_bytes(32, 'big')), 'big')
+            current_address = tm.owners[latest_random_seed % len(tm.owners)]
+            current_diff = abs(tm._nominal_ICR(current_address) - CR)
+            if current_diff < diff:
+                diff = current_diff
+                hint_address = current_address
+        return ReturnValue((hint_address, Wei(diff), latest_random_seed), ('hintAddress', 'diff', 'latestRandomSeed'))
+
+    def getRedemptionHints(self, ZSUSD_amount, price, max_iterations):
+        tm = self.ledger.troveManager
+        sorted_troves = self.ledger.sortedTroves
+        ZSUSD_amount, price, max_iterations = int(ZSUSD_amount), int(price), int(max_iterations)
+        remaining_ZSUSD = ZSUSD_amount
+        current_trove_user = sorted_troves.getLast()
+        while current_trove_user != ZERO_ADDRESS and tm._current_ICR(current_trove_user, price) < MCR:
+            current_trove_user = sorted_troves.getPrev(current_trove_user)
+        first_redemption_hint = current_trove_user
+        partial_redemption_hint_NICR = 0
+        if max_iterations == 0:
+            max_iterations = MAX_UINT
+        while current_trove_user != ZERO_ADDRESS and remaining_ZSUSD > 0 and max_iterations > 0:
+            max_iterations -= 1
+            trove = tm._trove(current_trove_user)
+            pending_coll, pending_debt = tm._pending_rewards(current_trove_user)
+            net_ZSUSD_debt = sub(trove.debt, ZSUSD_GAS_COMPENSATION) + pending_debt
+            if net_ZSUSD_debt > remaining_ZSUSD:
+                if net_ZSUSD_debt > MIN_NET_DEBT:
+                    max_redeemable_ZSUSD = min(remaining_ZSUSD, net_ZSUSD_debt - MIN_NET_DEBT)
+                    new_coll = sub(trove.coll + pending_coll, max_redeemable_ZSUSD * DECIMAL_PRECISION // price)
+                    new_debt = net_ZSUSD_debt - max_redeemable_ZSUSD
+                    partial_redemption_hint_NICR = compute_nominal_CR(new_coll, new_debt + ZSUSD_GAS_COMPENSATION)
+                    remaining_ZSUSD -= max_redeemable_ZSUSD
+                break
+            remaining_ZSUSD -= net_ZSUSD_debt
+            current_trove_user = sorted_troves.getPrev(current_trove_user)
+        return ReturnValue((first_redemption_hint, Wei(partial_redemption_hint_NICR), Wei(ZSUSD_amount - remaining_ZSUSD)),
+                           ('firstRedemptionHint', 'partialRedemptionHintNICR', 'truncatedZSUSDamount'))
+
+class ShadowMultiTroveGetter(ShadowContract):
+    def __init__(self, ledger):
+        super().__init__(ledger, 'multiTroveGetter')
+
+    # (owner, debt, coll, stake, snapshotSOV, snapshotZSUSDDebt) of `count` troves from position
+    # `start` of the sorted list, or from the tail for a negative `start`
+    def getMultipleSortedTroves(self, start, count):
+        ids = self.ledger.sortedTroves.ids()
+        if start < 0:
+            ids.reverse()
+            start = -(start + 1)
+        tm = self.ledger.troveManager
+        return [(id, *tm.Troves(id)[:3], *tm.rewardSnapshots(id)) for id in ids[start:start + count]]
+
+### Ledger
+
+class ShadowLedger:
+    # `timestamp` is the current block time, by default the clock of this machine (as on a
+    # development chain); `deployment_time` starts the redemption bootstrap period.
+    def __init__(self, timestamp=None, deployment_time=None):
+        self.time_offset = 0 if timestamp is None else int(timestamp) - int(time.time())
+        self.deployment_time = self.time() if deployment_time is None else int(deployment_time)
+        self.tx = None
+        # undo log of the transaction going on (see JournaledDict)
+        self.journal = None
+
+        self.priceFeedTestnet = ShadowPriceFeed(self)
+        self.zsusdToken = ShadowZSUSDToken(self)
+        self.activePool = ShadowPool(self, 'activePool')
+        self.defaultPool = ShadowPool(self, 'defaultPool')
+        self.collSurplusPool = ShadowCollSurplusPool(self)
+        self.sortedTroves = ShadowSortedTroves(self)
+        self.troveManager = ShadowTroveManager(self)
+        self.stabilityPool = ShadowStabilityPool(self)
+        self.borrowerOperations = ShadowBorrowerOperations(self)
+        self.hintHelpers = ShadowHintHelpers(self)
+        self.multiTroveGetter = ShadowMultiTroveGetter(self)
+
+    def contracts(self):
+        return {name: contract for name, contract in vars(self).items() if isinstance(contract, ShadowContract)}
+
+    ## Clock, like brownie's `chain`
+
+    def time(self):
+        return int(time.time()) + self.time_offset
+
+    def sleep(self, seconds):
+        self.time_offset += int(seconds)
+
+    # block timestamp of the current transaction, or of the next block in a view
+    def now(self):
+        return self.tx.timestamp if self.tx is not None else self.time()
+
+    ## Transactions
+
+    # State of every contract. All values are numbers, strings, tuples, or dicts and lists of
+    # them, so a one-level copy is enough to restore it later (with `revert`).
+    def snapshot(self):
+        return {name: {key: value.copy() if isinstance(value, (dict, list)) else value
+                       for key, value in vars(contract).items() if key != 'ledger'}
+                for name, contract in self.contracts().items()}
+
+    def revert(self, snapshot):
+        for name, contract in self.contracts().items():
+            for key, value in snapshot[name].items():
+                setattr(contract, key, value.copy() if isinstance(value, (dict, list)) else value)
+
+    # A reverted transaction is taken back through its undo log, latest write first.
+    def transact(self, method, contract, args, params):
+        timestamp = params.get('timestamp')
+        self.tx = ShadowTx(address(params['from']), int(params.get('value', 0)),
+                           self.time() if timestamp is None else int(timestamp))
+        self.journal = journal = []
+        try:
+            self.tx.return_value = method(contract, *args)
+            return self.tx
+        except ShadowRevert:
+            self.journal = None
+            for undo, *undo_args in reversed(journal):
+                undo(*undo_args)
+            raise
+        finally:
+            self.tx = None
+            self.journal = None
+
+    ## Cross-check
+
+    # Differences between the deployed `contracts` and the shadow, as readable lines: system
+    # totals, the trove list with every trove's debt, coll and stake, and the ZSUSD balance and
+    # stability pool deposit of each of `accounts`.
+    def diff(self, contracts, accounts=()):
+        mismatches = []
+
+        def check(what, chain_value, shadow_value):
+            if chain_value != shadow_value:
+                mismatches.append(f'{what}: chain {chain_value}, shadow {shadow_value}')
+
+        for name in ('activePool', 'defaultPool'):
+            check(f'{name} coll', getattr(contracts, name).getETH(), getattr(self, name).coll)
+            check(f'{name} debt', getattr(contracts, name).getZSUSDDebt(), getattr(self, name).debt)
+        check('stability pool deposits', contracts.stabilityPool.getTotalZSUSDDeposits(), self.stabilityPool.total_deposits)
+        check('stability pool coll', contracts.stabilityPool.getETH(), self.stabilityPool.coll)
+        check('ZSUSD supply', contracts.zsusdToken.totalSupply(), self.zsusdToken.total_supply)
+        tm = self.troveManager
+        check('total stakes', contracts.troveManager.totalStakes(), tm.total_stakes)
+        check('total stakes snapshot', contracts.troveManager.totalStakesSnapshot(), tm.total_stakes_snapshot)
+        check('total collateral snapshot', contracts.troveManager.totalCollateralSnapshot(), tm.total_collateral_snapshot)
+        check('base rate', contracts.troveManager.baseRate(), tm.base_rate)
+
+        troves = []
+        trove = contracts.sortedTroves.getFirst()
+        while trove != ZERO_ADDRESS:
+            troves.append(trove)
+            trove = contracts.sortedTroves.getNext(trove)
+        shadow_troves = self.sortedTroves.ids()
+        if troves != shadow_troves:
+            position = next((i for i, (a, b) in enumerate(zip(troves, shadow_troves)) if a != b),
+                            min(len(troves), len(shadow_troves)))
+            mismatches.append(f'sorted troves differ from position {position} on: '
+                              f'chain {troves[position:position + 3]}, shadow {shadow_troves[position:position + 3]}')
+        for trove in troves:
+            debt, coll = contracts.troveManager.getEntireDebtAndColl(trove)[:2]
+            shadow_debt, shadow_coll, _, _ = tm._entire_debt_and_coll(trove)
+            check(f'trove {trove} (debt, coll, stake)', (debt, coll, contracts.troveManager.getTroveStake(trove)),
+                  (shadow_debt, shadow_coll, tm._trove(trove).stake))
+
+        for account in accounts:
+            check(f'ZSUSD balance of {account}', contracts.zsusdToken.balanceOf(account),
+                  self.zsusdToken.balances.get(address(account), 0))
+            check(f'stability pool deposit of {account}', contracts.stabilityPool.getCompoundedZSUSDDeposit(account),
+                  self.stabilityPool._compounded_deposit(address(account)))
+        return mismatches
+
+# The deployed contracts, with every transaction sent through them replayed on `shadow` at the
+# same block timestamp. Views are answered by the chain, so the harness behaves exactly as
+# without the shadow; `verify` compares both.
+class MirroredContracts:
+    def __init__(self, contracts, shadow):
+        self.contracts = contracts
+        self.shadow = shadow
+
+    def __getattr__(self, name):
+        contract = getattr(self.contracts, name)
+        shadow_contract = self.shadow.contracts().get(name)
+        if shadow_contract is None:
+            return contract
+        return MirroredContract(contract, shadow_contract)
+
+    def verify(self, accounts=()):
+        mismatches = self.shadow.diff(self.contracts, accounts)
+        if mismatches:
+            raise ShadowDivergence('shadow ledger diverged from the chain:\n  ' + '\n  '.join(mismatches))
+
+class MirroredContract:
+    def __init__(self, contract, shadow_contract):
+        self.contract = contract
+        self.shadow_contract = shadow_contract
+
+    def __getattr__(self, name):
+        attribute = getattr(self.contract, name)
+        shadow_method = getattr(self.shadow_contract, name, None)
+        if not getattr(shadow_method, 'transaction', False):
+            return attribute
+
+        def mirrored(*args):
+            tx = attribute(*args)
+            if getattr(tx, 'status', 1) == -1:
+                # sent without waiting (see tx_pipeline.py): the shadow needs its block timestamp
+                tx.wait(1)
+            if getattr(tx, 'status', 1) == 0:
+                return tx
+            *call_args, params = args if args and isinstance(args[-1], dict) else (*args, {})
+            try:
+                shadow_method(*call_args, {**params, 'timestamp': tx.timestamp})
+            except ShadowRevert as error:
+                raise ShadowDivergence(f'{name} succeeded on chain but reverted in the shadow: {error}')
+            return tx
+        return mirrored
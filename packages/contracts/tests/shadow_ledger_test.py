@@ -0,0 +1,226 @@
+import random
+
+import pytest
+
+from helpers import ZERO_ADDRESS
+from shadow_ledger import (REDEMPTION_FEE_FLOOR, JournaledDict, JournaledList, ShadowLedger, ShadowRevert,
+                           ShadowTx, address, shadow_accounts)
+
+# The shadow ledger (shadow_ledger.py) on the cases where the trove system does something other
+# than the obvious: transactions reverting half way, troves of the same nominal ICR, pending
+# rewards from redistributions, and the redemption bootstrap period. The undo log reverted
+# transactions are taken back with is checked against restoring a copy of the whole state.
+
+E = 10**18
+START = 1600000000
+ACCOUNTS = [f'0x{i:040x}' for i in range(1, 21)]
+WHALE = ACCOUNTS[0]
+
+def ledger_at_fixed_time():
+    ledger = ShadowLedger(deployment_time=START)
+    # the block time only moves with `sleep`, not with the clock of this machine
+    ledger.time_offset = 0
+    ledger.time = lambda: START + ledger.time_offset
+    return ledger
+
+def open_trove(ledger, account, debt, coll):
+    return ledger.borrowerOperations.openTrove(E, debt * E, ZERO_ADDRESS, ZERO_ADDRESS,
+                                               {'from': account, 'value': coll * E})
+
+def ledger_with_troves():
+    ledger = ledger_at_fixed_time()
+    open_trove(ledger, WHALE, 100000, 2000)
+    for i, account in enumerate(ACCOUNTS[1:11]):
+        open_trove(ledger, account, 2000 + 100 * i, 16 + i)
+    return ledger
+
+def test_sorted_by_nominal_ICR_with_ties_first():
+    ledger = ledger_with_troves()
+    tm, sorted_troves = ledger.troveManager, ledger.sortedTroves
+    # the same coll and debt as the trove of ACCOUNTS[1]
+    open_trove(ledger, ACCOUNTS[11], 2000, 16)
+    ids = sorted_troves.ids()
+    NICRs = [tm._nominal_ICR(id) for id in ids]
+    assert NICRs == sorted(NICRs, reverse=True)
+    # inserted without hints, a trove goes before those of the same nominal ICR
+    assert ids.index(ACCOUNTS[11]) + 1 == ids.index(ACCOUNTS[1])
+    for prev_id, next_id in zip([ZERO_ADDRESS] + ids, ids + [ZERO_ADDRESS]):
+        assert sorted_troves.getNext(prev_id) == next_id or prev_id == ZERO_ADDRESS
+
+def test_reverted_transaction_leaves_state_untouched():
+    ledger = ledger_with_troves()
+    ledger.sleep(15 * 24 * 3600)
+    before = ledger.snapshot()
+    # the fee is checked after the troves are redeemed from
+    with pytest.raises(ShadowRevert, match='Fee exceeded provided maximum'):
+        ledger.troveManager.redeemCollateral(5000 * E, ZERO_ADDRESS, ZERO_ADDRESS, ZERO_ADDRESS, 0, 0,
+                                             REDEMPTION_FEE_FLOOR, {'from': WHALE})
+    assert ledger.snapshot() == before
+    assert ledger.tx is None
+
+def test_no_sender():
+    with pytest.raises(ValueError, match="no 'from' account"):
+        ledger_at_fixed_time().borrowerOperations.openTrove(E, 2000 * E, ZERO_ADDRESS, ZERO_ADDRESS)
+
+def test_last_trove_stays():
+    ledger = ledger_at_fixed_time()
+    open_trove(ledger, WHALE, 2000, 20)
+    ledger.priceFeedTestnet.setPrice(100 * E, {'from': WHALE})
+    # in recovery mode, as the system is with its only trove below the MCR, the last trove is
+    # left alone
+    assert ledger.troveManager.checkRecoveryMode(100 * E)
+    with pytest.raises(ShadowRevert, match='nothing to liquidate'):
+        ledger.troveManager.liquidate(WHALE, {'from': WHALE})
+    with pytest.raises(ShadowRevert, match='nothing to liquidate'):
+        ledger.troveManager.liquidateTroves(1, {'from': WHALE})
+
+def test_redistribution_leaves_pending_rewards():
+    ledger = ledger_with_troves()
+    tm = ledger.troveManager
+    ledger.priceFeedTestnet.setPrice(120 * E, {'from': WHALE})
+    # with the stability pool empty the troves liquidated go to the others
+    tx = tm.liquidateTroves(3, {'from': WHALE})
+    assert len(tx.events['TroveLiquidated']) == 3
+    assert ledger.defaultPool.debt > 0 and ledger.defaultPool.coll > 0
+    ids = ledger.sortedTroves.ids()
+    pending_debt = sum(tm._entire_debt_and_coll(id)[2] for id in ids)
+    # the rewards are shared out rounded down, the dust stays in the default pool
+    assert 0 <= ledger.defaultPool.debt - pending_debt < 10**9
+    # applying them moves them to the active pool, and keeps the trove's entire debt
+    ledger.priceFeedTestnet.setPrice(200 * E, {'from': WHALE})
+    entire_debt = tm._entire_debt_and_coll(ids[-1])[0]
+    ledger.borrowerOperations.addColl(ZERO_ADDRESS, ZERO_ADDRESS, {'from': ids[-1], 'value': E})
+    assert tm.getPendingZSUSDDebtReward(ids[-1]) == 0
+    assert tm._trove(ids[-1]).debt == entire_debt
+
+def test_nothing_to_liquidate():
+    ledger = ledger_with_troves()
+    with pytest.raises(ShadowRevert, match='nothing to liquidate'):
+        ledger.troveManager.liquidateTroves(10, {'from': WHALE})
+
+def test_redemptions_wait_for_the_bootstrap_period():
+    ledger = ledger_with_troves()
+    tm = ledger.troveManager
+    redeem = lambda: tm.redeemCollateral(3000 * E, ZERO_ADDRESS, ZERO_ADDRESS, ZERO_ADDRESS, 0, 0, E, {'from': WHALE})
+    with pytest.raises(ShadowRevert, match='bootstrap phase'):
+        redeem()
+    ledger.sleep(14 * 24 * 3600)
+    lowest = ledger.sortedTroves.ids()[-2:]
+    redeem()
+    # from the lowest ICR up: the last trove is redeemed in full and closed
+    assert not ledger.sortedTroves.contains(lowest[1])
+    assert ledger.sortedTroves.contains(lowest[0])
+
+class Journal:
+    journal = None
+
+def undone(container, change):
+    # applies `change` to `container` while journaled, then takes it back from the journal
+    owner = container.ledger
+    owner.journal = journal = []
+    change(container)
+    owner.journal = None
+    for undo, *undo_args in reversed(journal):
+        undo(*undo_args)
+    return container
+
+@pytest.mark.parametrize('change', [
+    lambda d: d.__setitem__('a', 10),
+    lambda d: d.__setitem__('new', 10),
+    lambda d: d.__delitem__('b'),
+    lambda d: d.pop('a'),
+    lambda d: d.pop('missing', None),
+    lambda d: d.setdefault('new', 3),
+    lambda d: d.update({'a': 5, 'new': 6}),
+    lambda d: d.popitem(),
+    lambda d: d.clear(),
+    lambda d: [d.pop('a'), d.__setitem__('a', 7), d.__setitem__('a', 8)],
+])
+def test_journaled_dict_changes_are_undone(change):
+    items = {'a': 1, 'b': (2, 3), 'c': 'x'}
+    # a key deleted and put back comes last; nothing in the ledger depends on the order of its dicts
+    assert undone(JournaledDict(Journal(), items), change) == items
+
+@pytest.mark.parametrize('change', [
+    lambda l: l.append(9),
+    lambda l: l.pop(),
+    lambda l: l.pop(0),
+    lambda l: l.pop(-2),
+    lambda l: l.__setitem__(1, 9),
+    lambda l: l.__setitem__(slice(1, None), [7]),
+    lambda l: l.__delitem__(0),
+    lambda l: l.insert(1, 9),
+    lambda l: l.extend([7, 8]),
+    lambda l: [l.append(9), l.pop(0), l.__setitem__(0, 5), l.insert(0, 4)],
+])
+def test_journaled_list_changes_are_undone(change):
+    items = [1, 2, 3, 4]
+    assert undone(JournaledList(Journal(), items), change) == items
+
+def test_changes_outside_a_transaction_are_not_journaled():
+    d, l = JournaledDict(Journal()), JournaledList(Journal())
+    d['a'] = 1
+    l.append(1)
+    assert d.ledger.journal is None and l.ledger.journal is None
+
+# ShadowLedger.transact as it was before the undo log
+def transact_with_copies(self, method, contract, args, params):
+    timestamp = params.get('timestamp')
+    self.tx = ShadowTx(address(params['from']), int(params.get('value', 0)),
+                       self.time() if timestamp is None else int(timestamp))
+    state = self.snapshot()
+    try:
+        self.tx.return_value = method(contract, *args)
+        return self.tx
+    except ShadowRevert:
+        self.revert(state)
+        raise
+    finally:
+        self.tx = None
+
+def random_transactions(ledger, seed, steps=200):
+    rng = random.Random(seed)
+    tm, bo, sp = ledger.troveManager, ledger.borrowerOperations, ledger.stabilityPool
+    open_trove(ledger, WHALE, 100000, 2000)
+    sp.provideToSP(20000 * E, ZERO_ADDRESS, {'from': WHALE})
+    ledger.sleep(15 * 24 * 3600)
+
+    transactions = [
+        lambda a: open_trove(ledger, a, rng.randint(1000, 3000), rng.randint(12, 40)),
+        lambda a: bo.adjustTrove(E, 0, rng.randint(1, 800) * E, rng.random() < 0.5, ZERO_ADDRESS, ZERO_ADDRESS,
+                                 {'from': a, 'value': rng.randint(0, 3) * E}),
+        lambda a: bo.withdrawColl(rng.randint(1, 10) * E, ZERO_ADDRESS, ZERO_ADDRESS, {'from': a}),
+        lambda a: bo.closeTrove({'from': a}),
+        lambda a: sp.provideToSP(rng.randint(1, 1000) * E, ZERO_ADDRESS, {'from': a}),
+        lambda a: sp.withdrawFromSP(rng.randint(1, 1000) * E, {'from': a}),
+        lambda a: ledger.zsusdToken.transfer(rng.choice(ACCOUNTS), rng.randint(1, 2000) * E, {'from': a}),
+        lambda a: ledger.priceFeedTestnet.setPrice(rng.randint(150, 250) * E, {'from': WHALE}),
+        lambda a: tm.liquidateTroves(rng.randint(1, 5), {'from': WHALE}),
+        lambda a: tm.redeemCollateral(rng.randint(100, 5000) * E, ZERO_ADDRESS, ZERO_ADDRESS, ZERO_ADDRESS, 0, 0, E,
+                                      {'from': WHALE}),
+    ]
+    states, reverts = [], 0
+    for _ in range(steps):
+        transaction = rng.choice(transactions)
+        account = rng.choice(ACCOUNTS)
+        before = ledger.snapshot()
+        try:
+            transaction(account)
+        except ShadowRevert:
+            reverts += 1
+            assert ledger.snapshot() == before
+        states.append(ledger.snapshot())
+    return states, reverts
+
+@pytest.mark.parametrize('seed', range(2))
+def test_undo_log_matches_state_copies(seed, monkeypatch):
+    states, reverts = random_transactions(ledger_at_fixed_time(), seed)
+    assert 0 < reverts < len(states)
+    monkeypatch.setattr(ShadowLedger, 'transact', transact_with_copies)
+    assert random_transactions(ledger_at_fixed_time(), seed) == (states, reverts)
+
+def test_shadow_accounts_are_distinct_addresses():
+    accounts = shadow_accounts(1000)
+    assert len(set(accounts)) == 1000
+    assert all(account.startswith('0x') and len(account) == 42 for account in accounts)
+    assert shadow_accounts(10) == accounts[:10]
@@ -1,9 +1,17 @@
+import os
+
 from brownie import *
-import random
-import numpy as np
 from bisect import bisect_left
 
 from helpers import *
+from shadow_ledger import ShadowLedger, compute_nominal_CR
+from account_registry import AccountRegistry
+from exogenous_paths import ExogenousPaths
+from hint_engine import HintEngine
+from inattention_bands import InattentionBands
+from rolling_window import RollingSum
+from sim_random import SimRandom
+from tx_pipeline import TxPipeline
 
 #global variables
 day = 24
@@ -22,6 +30,56 @@ ZSUSD_GAS_COMPENSATION = 200.0
 MIN_NET_DEBT = 1800.0
 MAX_FEE = Wei(1e18)
 
+#random streams (SIMULATION_SEED is set per run by run_simulations.py)
+seed = int(os.environ.get('SIMULATION_SEED', 2019))
+rng = SimRandom(seed)
+#reproduce the original per-step seeded exogenous series
+legacy_exogenous = False
+
+#output (SIMULATION_CSV is set per run by run_simulations.py)
+simulation_csv = os.environ.get('SIMULATION_CSV', 'tests/simulation.csv')
+#results (see results_sink.py): besides the csv, a columnar copy with the step timings (results_format
+#'parquet' or 'arrow', needs pyarrow) and a binary log, written out every results_flush_every steps.
+#The state of the system is printed every log_every steps
+results_format = None
+results_binary_log = False
+results_flush_every = day
+log_every = day
+
+#shadow ledger (see shadow_ledger.py): 'off' runs on the deployed contracts only, 'offline' runs on
+#the shadow only, 'verify' runs on both and cross-checks them every shadow_verify_every steps
+shadow_mode = 'off'
+shadow_verify_every = day
+#number of accounts of a run on the shadow only, as the development network's in brownie-config.yaml
+shadow_account_count = 1000
+
+#checkpoints (see checkpoint.py): saved to checkpoint_path every checkpoint_every steps (0: never).
+#Unless shadow_mode is 'offline' they need a node that outlives the run, not one brownie launches.
+#set resume_checkpoint to the path of a checkpoint to continue a run, or start a what-if branch, from it
+checkpoint_every = 0
+checkpoint_path = os.path.splitext(simulation_csv)[0] + '.checkpoint'
+resume_checkpoint = None
+
+#hints (see hint_engine.py): worked out locally from the trove events, or asked from HintHelpers
+#and SortedTroves as before. The shadow ledger (shadow_mode 'offline') always answers them itself
+local_hints = True
+hint_engine = HintEngine()
+
+#state sync (see event_sync.py): ZSUSD balances and supply, stability pool totals, the number of
+#troves and the system's coll and debt (so the TCR and recovery mode checks) are kept from the
+#events of each transaction instead of read back from the chain
+event_sync = True
+
+#pipelined transactions (see tx_pipeline.py): the transactions of close_troves, adjust_troves and
+#stability_update are sent without waiting for each receipt, and settled at the end of each.
+#Only for dev chains that mine each transaction as it arrives
+pipeline_txs = True
+tx_pipeline = TxPipeline()
+
+#inattention bands (see inattention_bands.py): with local hints, adjust_troves only looks at the
+#troves whose inattention band the ether price left, kept from the hint engine's trove updates
+inattention_bands = InattentionBands(hint_engine)
+
 """# Ether price (exogenous)
 
 Ether is the collateral for ZSUSD. The ether price $P_t^e$ follows 
@@ -34,7 +92,6 @@ where $\zeta_t^e \sim N(0, $ sd_ether$)$ represents ether price shock and $\sigm
 
 #ether price
 price_ether_initial = 2000
-price_ether = [price_ether_initial]
 sd_ether=0.02
 #drift_ether = 0.001
 # 4 stages:
@@ -50,6 +107,7 @@ period3 = 6 * month
 drift_ether3 = 0.0013
 period4 = period
 drift_ether4 = -0.0002
+ether_regimes = [(period1, drift_ether1), (period2, drift_ether2), (period3, drift_ether3), (period4, drift_ether4)]
 
 """# ZERO price
 In the first month, the price of ZERO follows
@@ -64,7 +122,6 @@ The ZERO price from the second month on is endogenously determined.
 
 #ZERO price & airdrop
 price_ZERO_initial = 0.4
-price_ZERO = [price_ZERO_initial]
 sd_ZERO=0.005
 drift_ZERO = 0.0035
 supply_ZERO=[0]
@@ -158,7 +215,6 @@ theta = 0.001
 
 #natural rate
 natural_rate_initial = 0.2
-natural_rate = [natural_rate_initial]
 sd_natural_rate = 0.002
 
 """# Trove pool
@@ -298,51 +354,28 @@ where:
 Ether Price
 """
 
+exogenous_paths = ExogenousPaths(rng, legacy=legacy_exogenous)
+
+#the series are kept as lists of Python floats: a numpy float64 does not convert to Wei
+
 #ether price
-for i in range(1, period1):
-    random.seed(2019375+10000*i)
-    shock_ether = random.normalvariate(0, sd_ether)
-    price_ether.append(price_ether[i-1] * (1 + shock_ether) * (1 + drift_ether1))
-print(" - ETH period 1 -")
-print(f"Min ETH price: {min(price_ether[1:period1])}")
-print(f"Max ETH price: {max(price_ether[1:period1])}")
-for i in range(period1, period2):
-    random.seed(2019375+10000*i)
-    shock_ether = random.normalvariate(0, sd_ether)
-    price_ether.append(price_ether[i-1] * (1 + shock_ether) * (1 + drift_ether2))
-print(" - ETH period 2 -")
-print(f"Min ETH price: {min(price_ether[period1:period2])}")
-print(f"Max ETH price: {max(price_ether[period1:period2])}")
-for i in range(period2, period3):
-    random.seed(2019375+10000*i)
-    shock_ether = random.normalvariate(0, sd_ether)
-    price_ether.append(price_ether[i-1] * (1 + shock_ether) * (1 + drift_ether3))
-print(" - ETH period 3 -")
-print(f"Min ETH price: {min(price_ether[period2:period3])}")
-print(f"Max ETH price: {max(price_ether[period2:period3])}")
-for i in range(period3, period4):
-    random.seed(2019375+10000*i)
-    shock_ether = random.normalvariate(0, sd_ether)
-    price_ether.append(price_ether[i-1] * (1 + shock_ether) * (1 + drift_ether4))
-print(" - ETH period 4 -")
-print(f"Min ETH price: {min(price_ether[period3:period4])}")
-print(f"Max ETH price: {max(price_ether[period3:period4])}")
+price_ether = exogenous_paths.ether_price(price_ether_initial, sd_ether, ether_regimes, period).tolist()
+regime_start = 1
+for n, (regime_end, _) in enumerate(ether_regimes, 1):
+    print(f" - ETH period {n} -")
+    print(f"Min ETH price: {min(price_ether[regime_start:regime_end])}")
+    print(f"Max ETH price: {max(price_ether[regime_start:regime_end])}")
+    regime_start = regime_end
 
 """Natural Rate"""
 
 #natural rate
-for i in range(1, period):
-    random.seed(201597+10*i)
-    shock_natural = random.normalvariate(0,sd_natural_rate)
-    natural_rate.append(natural_rate[i-1]*(1+shock_natural))
+natural_rate = exogenous_paths.natural_rate(natural_rate_initial, sd_natural_rate, period).tolist()
 
 """ZERO Price - First Month"""
 
 #ZERO price
-for i in range(1, month):
-    random.seed(2+13*i)
-    shock_ZERO = random.normalvariate(0,sd_ZERO)  
-    price_ZERO.append(price_ZERO[i-1]*(1+shock_ZERO)*(1+drift_ZERO))
+price_ZERO = exogenous_paths.price_ZERO(price_ZERO_initial, sd_ZERO, drift_ZERO, month).tolist()
 
 """# Troves
 
@@ -354,38 +387,37 @@ def is_recovery_mode(contracts, price_ether_current):
     return contracts.troveManager.checkRecoveryMode(price)
 
 def pending_liquidations(contracts, price_ether_current):
-    last_trove = contracts.sortedTroves.getLast()
-    last_ICR = contracts.troveManager.getCurrentICR(last_trove, Wei(price_ether_current * 1e18))
+    # the troves that one call to `liquidateTroves` can reach, and the next one, in one round-trip
+    price = Wei(price_ether_current * 1e18)
+    troves, [recovery_mode, stability_pool_balance] = read_troves(contracts, -1, NUM_LIQUIDATIONS + 1, [
+        (contracts.troveManager, 'checkRecoveryMode', (price,)),
+        (contracts.stabilityPool, 'getTotalZSUSDDeposits', ()),
+    ])
 
-    if last_trove == ZERO_ADDRESS:
+    if len(troves) == 0:
         return False
+    last_ICR = troves[0].ICR(price)
     if last_ICR >= Wei(15e17):
         return False
     if last_ICR < Wei(11e17):
         return True
-    if not is_recovery_mode(contracts, price_ether_current):
+    if not recovery_mode:
         return False
 
-    stability_pool_balance = contracts.stabilityPool.getTotalZSUSDDeposits()
-    trove = last_trove
     for i in range(NUM_LIQUIDATIONS):
-        debt = contracts.troveManager.getEntireDebtAndColl(trove)[0]
-        if stability_pool_balance >= debt:
+        if stability_pool_balance >= troves[i].debt:
             return True
-        trove = contracts.sortedTroves.getPrev(trove)
-        ICR = contracts.troveManager.getCurrentICR(trove, Wei(price_ether_current * 1e18))
-        if ICR >= Wei(15e17):
+        if i + 1 == len(troves) or troves[i + 1].ICR(price) >= Wei(15e17):
             return False
 
     return False
 
 def remove_account(accounts, active_accounts, inactive_accounts, address):
-    try:
-        active_index = next(i for i, a in enumerate(active_accounts) if accounts[a['index']] == address)
-        inactive_accounts.append(active_accounts[active_index]['index'])
-        active_accounts.pop(active_index)
-    except StopIteration: # TODO
+    account_index = active_accounts.remove(address)
+    if account_index is None: # TODO
         print(f"\n ***Error: {address} not found in active accounts!")
+    else:
+        inactive_accounts.append(account_index)
 
 def remove_accounts_from_events(accounts, active_accounts, inactive_accounts, events, field):
     for event in events:
@@ -404,8 +436,20 @@ def quantity_ZERO_airdrop(index):
         return 0
     return 32e6 * (F ** (index-1) - F ** index)
 
+def new_simulation_data():
+    return {
+        "airdrop_gain": [0] * n_sim,
+        "liquidation_gain": [0] * n_sim,
+        "issuance_fee": [0] * n_sim,
+        "redemption_fee": [0] * n_sim,
+        # trailing month sums, fed once per step
+        "stability_gain_month": RollingSum(month),
+        "fee_month": RollingSum(month),
+    }
+
 def liquidate_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, price_ZERO_current, data, index):
     if len(active_accounts) == 0:
+        data['stability_gain_month'].push(0)
         return [0, 0]
 
     stability_pool_previous = contracts.stabilityPool.getTotalZSUSDDeposits() / 1e18
@@ -442,6 +486,7 @@ def liquidate_troves(accounts, contracts, active_accounts, inactive_accounts, pr
     data['airdrop_gain'][index] = airdrop_gain
 
     return_stability = calculate_stability_return(contracts, price_ZSUSD, data, index)
+    data['stability_gain_month'].push(liquidation_gain + airdrop_gain)
 
     return [ether_liquidated, return_stability]
 
@@ -452,15 +497,10 @@ def calculate_stability_return(contracts, price_ZSUSD, data, index):
     elif stability_pool_previous == 0:
         return_stability = initial_return * 2
     elif index < month:
-        return_stability = (year/index) * \
-            (sum(data['liquidation_gain'][0:index]) +
-             sum(data['airdrop_gain'][0:index])
-             ) / (price_ZSUSD * stability_pool_previous)
+        # the month window still holds every step since the start
+        return_stability = (year/index) * data['stability_gain_month'].sum / (price_ZSUSD * stability_pool_previous)
     else:
-        return_stability = (year/month) * \
-            (sum(data['liquidation_gain'][index - month:index]) +
-             sum(data['airdrop_gain'][index - month:index])
-             ) / (price_ZSUSD * stability_pool_previous)
+        return_stability = (year/month) * data['stability_gain_month'].sum / (price_ZSUSD * stability_pool_previous)
 
     return return_stability
 
@@ -468,6 +508,16 @@ def isNewTCRAboveCCR(contracts, collChange, isCollIncrease, debtChange, isDebtIn
     newTCR = contracts.borrowerOperations.getNewTCRFromTroveChange(collChange, isCollIncrease, debtChange, isDebtIncrease, price)
     return newTCR >= Wei(1.5 * 1e18)
 
+# Sends a transaction through the pipeline, or waits for it where the pipeline is not used
+def send(contracts, method, *args):
+    if pipeline_txs and not isinstance(contracts, ShadowLedger):
+        return tx_pipeline.send(method, *args)
+    return method(*args)
+
+def settle(contracts):
+    if pipeline_txs and not isinstance(contracts, ShadowLedger):
+        tx_pipeline.settle()
+
 """Close Troves"""
 
 def close_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, index):
@@ -477,20 +527,19 @@ def close_troves(accounts, contracts, active_accounts, inactive_accounts, price_
     if is_recovery_mode(contracts, price_ether_current):
         return [0]
 
-    np.random.seed(208+index)
-    shock_closetroves = np.random.normal(0,sd_closetroves)
+    stream = rng.stream("close_troves.number", index)
+    shock_closetroves = stream.normal(0,sd_closetroves)
     n_troves = contracts.sortedTroves.getSize()
 
     if index <= 240:
-        number_closetroves = np.random.uniform(0,1)
+        number_closetroves = stream.uniform(0,1)
     elif price_ZSUSD >=1:
         number_closetroves = max(0, n_steady * (1+shock_closetroves))
     else:
         number_closetroves = max(0, n_steady * (1+shock_closetroves)) + beta*(1-price_ZSUSD)*n_troves
 
     number_closetroves = min(int(round(number_closetroves)), len(active_accounts) - 1)
-    random.seed(293+100*index)
-    drops = list(random.sample(range(len(active_accounts)), number_closetroves))
+    drops = list(rng.stream("close_troves.drops", index).choice(len(active_accounts), number_closetroves, replace=False))
     for i in range(0, len(drops)):
         account_index = active_accounts[drops[i]]['index']
         account = accounts[account_index]
@@ -500,12 +549,13 @@ def close_troves(accounts, contracts, active_accounts, inactive_accounts, price_
         pending = get_zsusd_to_repay(accounts, contracts, active_accounts, inactive_accounts, account, debt)
         if pending == 0:
             if isNewTCRAboveCCR(contracts, coll, False, debt, False, floatToWei(price_ether_current)):
-                contracts.borrowerOperations.closeTrove({ 'from': account })
+                send(contracts, contracts.borrowerOperations.closeTrove, { 'from': account })
                 inactive_accounts.append(account_index)
                 active_accounts.pop(drops[i])
         if is_recovery_mode(contracts, price_ether_current):
             break
 
+    settle(contracts)
     return [number_closetroves]
 
 """Adjust Troves"""
@@ -517,7 +567,7 @@ def transfer_from_to(contracts, from_account, to_account, amount):
         return amount
     if from_account == to_account:
         return amount
-    contracts.zsusdToken.transfer(to_account, transfer_amount, { 'from': from_account })
+    send(contracts, contracts.zsusdToken.transfer, to_account, transfer_amount, { 'from': from_account })
     pending = amount - transfer_amount
 
     return pending
@@ -529,23 +579,31 @@ def get_zsusd_to_repay(accounts, contracts, active_accounts, inactive_accounts,
         # first try to withdraw from SP
         initial_deposit = contracts.stabilityPool.deposits(account)[0]
         if initial_deposit > 0:
-            contracts.stabilityPool.withdrawFromSP(pending, { 'from': account, 'gas_limit': 8000000, 'allow_revert': True })
+            send(contracts, contracts.stabilityPool.withdrawFromSP, pending, { 'from': account, 'gas_limit': 8000000, 'allow_revert': True })
             # it can only withdraw up to the deposit, so we check the balance again
             zsusdBalance = contracts.zsusdToken.balanceOf(account)
             pending = debt - zsusdBalance
         # try with whale
         pending = transfer_from_to(contracts, accounts[0], account, pending)
-        # try with active accounts, which are more likely to hold ZSUSD
-        for a in active_accounts:
-            if pending <= 0:
+        # then with the largest known holders
+        skipped = []
+        while pending > 0:
+            holder = active_accounts.pop_largest_holder()
+            if holder is None:
                 break
-            a_address = accounts[a['index']]
-            pending = transfer_from_to(contracts, a_address, account, pending)
-        for i in inactive_accounts:
-            if pending <= 0:
-                break
-            i_address = accounts[i]
-            pending = transfer_from_to(contracts, i_address, account, pending)
+            holder_index, known_balance = holder
+            holder_address = accounts[holder_index]
+            if holder_index == 0 or holder_address == account:
+                skipped.append(holder)
+                continue
+            balance = contracts.zsusdToken.balanceOf(holder_address)
+            transfer_amount = min(balance, pending)
+            if transfer_amount > 0:
+                send(contracts, contracts.zsusdToken.transfer, account, transfer_amount, { 'from': holder_address })
+                pending = pending - transfer_amount
+            active_accounts.note_balance(holder_index, balance - transfer_amount)
+        for holder_index, known_balance in skipped:
+            active_accounts.note_balance(holder_index, known_balance)
 
         if pending > 0:
             print(f"\n ***Error: not enough ZSUSD to repay! {debt / 1e18} ZSUSD for {account}")
@@ -554,28 +612,36 @@ def get_zsusd_to_repay(accounts, contracts, active_accounts, inactive_accounts,
 
     return 0
 
+def uses_local_hints(contracts):
+    return local_hints and not isinstance(contracts, ShadowLedger)
+
 def get_hints(contracts, coll, debt):
-    NICR = contracts.hintHelpers.computeNominalCR(floatToWei(coll), floatToWei(debt))
+    NICR = Wei(compute_nominal_CR(floatToWei(coll), floatToWei(debt)))
+    if uses_local_hints(contracts):
+        return hint_engine.insert_hints(contracts, NICR)
     approxHint = contracts.hintHelpers.getApproxHint(NICR, 100, 0)
     #print("approx hint", approxHint)
     return contracts.sortedTroves.findInsertPosition(NICR, approxHint[0], approxHint[0])
 
-def get_hints_from_amounts(accounts, contracts, active_accounts, coll, debt, price_ether_current):
+# `borrower` is the owner of the trove to open or re-insert
+def get_hints_from_amounts(accounts, contracts, active_accounts, coll, debt, price_ether_current, borrower=None):
     ICR = coll * price_ether_current / debt
-    NICR = contracts.hintHelpers.computeNominalCR(floatToWei(coll), floatToWei(debt))
-    return get_hints_from_ICR(accounts, contracts, active_accounts, ICR, NICR)
+    # as HintHelpers.computeNominalCR
+    NICR = Wei(compute_nominal_CR(floatToWei(coll), floatToWei(debt)))
+    return get_hints_from_ICR(accounts, contracts, active_accounts, ICR, NICR, borrower)
 
 #def get_address_from_active_index(accounts, active_accounts, index):
 def index2address(accounts, active_accounts, index):
     return accounts[active_accounts[index]['index']]
 
-def get_hints_from_ICR(accounts, contracts, active_accounts, ICR, NICR):
+def get_hints_from_ICR(accounts, contracts, active_accounts, ICR, NICR, borrower=None):
     l = len(active_accounts)
+    if uses_local_hints(contracts):
+        return [*hint_engine.insert_hints(contracts, NICR, borrower), bisect_left(active_accounts.keys, ICR)]
     if l == 0:
         return [ZERO_ADDRESS, ZERO_ADDRESS, 0]
     else:
-        keys = [a['CR_initial'] for a in active_accounts]
-        i = bisect_left(keys, ICR)
+        i = bisect_left(active_accounts.keys, ICR)
         #return [index2address(accounts, active_accounts, min(i, l-1)), index2address(accounts, active_accounts, max(i-1, 0)), i]
         hints = contracts.sortedTroves.findInsertPosition(
             NICR,
@@ -586,29 +652,43 @@ def get_hints_from_ICR(accounts, contracts, active_accounts, ICR, NICR):
 
 
 def adjust_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, index):
-    random.seed(57984-3*index)
-    ratio = random.uniform(0,1)
+    ratio = rng.stream("adjust_troves.ratio", index).uniform(0,1)
+    p = rng.stream("adjust_troves.p", index).random(len(active_accounts))
     coll_added_float = 0
     issuance_ZSUSD_adjust = 0
+    # adjusting a trove leaves the others as they are, so they can all be read upfront
+    if uses_local_hints(contracts):
+        positions = inattention_bands.exits(contracts, accounts, active_accounts, price_ether_current)
+        troves = {}
+        for i in positions:
+            owner = str(accounts[active_accounts[i]['index']])
+            if owner in hint_engine.troves:
+                debt, coll = hint_engine.entire_debt_and_coll(owner)
+                troves[owner] = TroveData(owner, Wei(debt), Wei(coll), Wei(hint_engine.troves[owner][2]))
+    else:
+        positions = range(len(active_accounts))
+        troves = {str(trove.owner): trove for trove in read_troves(contracts)[0]}
 
-    for i, working_trove in enumerate(active_accounts):
+    for i in positions:
+        working_trove = active_accounts[i]
         account = accounts[working_trove['index']]
-        currentICR = contracts.troveManager.getCurrentICR(account, floatToWei(price_ether_current)) / 1e18
-        amounts = contracts.troveManager.getEntireDebtAndColl(account)
-        coll = amounts['coll'] / 1e18
-        debt = amounts['debt'] / 1e18
+        # a trove closed behind the harness' back reads as empty, as from TroveManager
+        trove = troves.get(str(account), TroveData(account, Wei(0), Wei(0), Wei(0)))
+        currentICR = trove.ICR(floatToWei(price_ether_current)) / 1e18
+        coll = trove.coll / 1e18
+        debt = trove.debt / 1e18
 
-        random.seed(187*index + 3*i)
-        p = random.uniform(0,1)
-        check = (currentICR - working_trove['CR_initial']) / (working_trove['CR_initial'] * working_trove['Rational_inattention'])
+        # float: the CR_initial of an account saved by an earlier version may be a numpy float64
+        CR_initial = float(working_trove['CR_initial'])
+        check = (currentICR - CR_initial) / (CR_initial * working_trove['Rational_inattention'])
 
         if check >= -1 and check <= 2:
             continue
 
         #A part of the troves are adjusted by adjusting debt
-        if p >= ratio:
-            debt_new = price_ether_current * coll / working_trove['CR_initial']
-            hints = get_hints_from_amounts(accounts, contracts, active_accounts, coll, debt_new, price_ether_current)
+        if p[i] >= ratio:
+            debt_new = price_ether_current * coll / CR_initial
+            hints = get_hints_from_amounts(accounts, contracts, active_accounts, coll, debt_new, price_ether_current, account)
             if debt_new < MIN_NET_DEBT:
                 continue
             if check < -1:
@@ -616,30 +696,33 @@ def adjust_troves(accounts, contracts, active_accounts, inactive_accounts, price
                 repay_amount = floatToWei(debt - debt_new)
                 pending = get_zsusd_to_repay(accounts, contracts, active_accounts, inactive_accounts, account, repay_amount)
                 if pending == 0:
-                    contracts.borrowerOperations.repayZSUSD(repay_amount, hints[0], hints[1], { 'from': account })
+                    send(contracts, contracts.borrowerOperations.repayZSUSD, repay_amount, hints[0], hints[1], { 'from': account })
+                    active_accounts.add_balance(working_trove['index'], -repay_amount)
             elif check > 2 and not is_recovery_mode(contracts, price_ether_current):
                 # withdraw ZSUSD
                 withdraw_amount = debt_new - debt
                 withdraw_amount_wei = floatToWei(withdraw_amount)
                 if isNewTCRAboveCCR(contracts, 0, False, withdraw_amount_wei, True, floatToWei(price_ether_current)):
-                    contracts.borrowerOperations.withdrawZSUSD(MAX_FEE, withdraw_amount_wei, hints[0], hints[1], { 'from': account })
+                    send(contracts, contracts.borrowerOperations.withdrawZSUSD, MAX_FEE, withdraw_amount_wei, hints[0], hints[1], { 'from': account })
+                    active_accounts.add_balance(working_trove['index'], withdraw_amount_wei)
                     rate_issuance = contracts.troveManager.getBorrowingRateWithDecay() / 1e18
                     issuance_ZSUSD_adjust = issuance_ZSUSD_adjust + rate_issuance * withdraw_amount
         #Another part of the troves are adjusted by adjusting collaterals
-        elif p < ratio:
-            coll_new = working_trove['CR_initial'] * debt / price_ether_current
-            hints = get_hints_from_amounts(accounts, contracts, active_accounts, coll_new, debt, price_ether_current)
+        elif p[i] < ratio:
+            coll_new = CR_initial * debt / price_ether_current
+            hints = get_hints_from_amounts(accounts, contracts, active_accounts, coll_new, debt, price_ether_current, account)
             if check < -1:
                 # add coll
                 coll_added_float = coll_new - coll
                 coll_added = floatToWei(coll_added_float)
-                contracts.borrowerOperations.addColl(hints[0], hints[1], { 'from': account, 'value': coll_added })
+                send(contracts, contracts.borrowerOperations.addColl, hints[0], hints[1], { 'from': account, 'value': coll_added })
             elif check > 2 and not is_recovery_mode(contracts, price_ether_current):
                 # withdraw ETH
                 coll_withdrawn = floatToWei(coll - coll_new)
                 if isNewTCRAboveCCR(contracts, coll_withdrawn, False, 0, False, floatToWei(price_ether_current)):
-                    contracts.borrowerOperations.withdrawColl(coll_withdrawn, hints[0], hints[1], { 'from': account })
+                    send(contracts, contracts.borrowerOperations.withdrawColl, coll_withdrawn, hints[0], hints[1], { 'from': account })
 
+    settle(contracts)
     return [coll_added_float, issuance_ZSUSD_adjust]
 
 """Open Troves"""
@@ -651,7 +734,7 @@ def open_trove(accounts, contracts, active_accounts, inactive_accounts, supply_t
         return
 
     #hints = get_hints_from_ICR(accounts, active_accounts, CR_ratio)
-    hints = get_hints_from_amounts(accounts, contracts, active_accounts, quantity_ether, supply_trove, price_ether_current)
+    hints = get_hints_from_amounts(accounts, contracts, active_accounts, quantity_ether, supply_trove, price_ether_current, accounts[inactive_accounts[0]])
     coll = floatToWei(quantity_ether)
     debtChange = floatToWei(supply_trove) + ZSUSD_GAS_COMPENSATION
     zsusd = get_zsusd_amount_from_net_debt(contracts, floatToWei(supply_trove))
@@ -659,15 +742,15 @@ def open_trove(accounts, contracts, active_accounts, inactive_accounts, supply_t
         contracts.borrowerOperations.openTrove(MAX_FEE, zsusd, hints[0], hints[1],
                                                { 'from': accounts[inactive_accounts[0]], 'value': coll })
         new_account = {"index": inactive_accounts[0], "CR_initial": CR_ratio, "Rational_inattention": rational_inattention}
-        active_accounts.insert(hints[2], new_account)
+        active_accounts.insert(hints[2], new_account, accounts[inactive_accounts[0]])
+        active_accounts.add_balance(inactive_accounts[0], zsusd)
         inactive_accounts.pop(0)
         return True
 
     return False
 
 def open_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, index):
-    random.seed(2019*index)
-    shock_opentroves = random.normalvariate(0,sd_opentroves)
+    shock_opentroves = rng.stream("open_troves.number", index).normal(0,sd_opentroves)
     n_troves = len(active_accounts)
     rate_issuance = contracts.troveManager.getBorrowingRateWithDecay() / 1e18
     coll_added = 0
@@ -683,15 +766,15 @@ def open_troves(accounts, contracts, active_accounts, inactive_accounts, price_e
 
     number_opentroves = min(int(round(float(number_opentroves))), len(inactive_accounts))
 
-    for i in range(0, number_opentroves):
-        np.random.seed(2033 + index + i*i)
-        CR_ratio = target_cr_a + target_cr_b * np.random.chisquare(df=target_cr_chi_square_df)
-
-        np.random.seed(20 + 10 * i + index)
-        quantity_ether = np.random.gamma(collateral_gamma_k, scale=collateral_gamma_theta)
+    # as lists of Python floats: a numpy float64 does not convert to Wei
+    CR_ratios = (target_cr_a + target_cr_b * rng.stream("open_troves.cr", index).chisquare(target_cr_chi_square_df, number_opentroves)).tolist()
+    quantities_ether = rng.stream("open_troves.ether_quantity", index).gamma(collateral_gamma_k, collateral_gamma_theta, number_opentroves).tolist()
+    rational_inattentions = rng.stream("open_troves.inattention", index).gamma(rational_inattention_gamma_k, rational_inattention_gamma_theta, number_opentroves).tolist()
 
-        np.random.seed(209870- index + i*i)
-        rational_inattention = np.random.gamma(rational_inattention_gamma_k, scale=rational_inattention_gamma_theta)
+    for i in range(0, number_opentroves):
+        CR_ratio = CR_ratios[i]
+        quantity_ether = quantities_ether[i]
+        rational_inattention = rational_inattentions[i]
         supply_trove = price_ether_current * quantity_ether / CR_ratio
         if supply_trove < MIN_NET_DEBT:
             supply_trove = MIN_NET_DEBT
@@ -713,8 +796,7 @@ def stability_update(accounts, contracts, active_accounts, return_stability, ind
     supply = contracts.zsusdToken.totalSupply() / 1e18
     stability_pool_previous = contracts.stabilityPool.getTotalZSUSDDeposits() / 1e18
 
-    np.random.seed(27+3*index)
-    shock_stability = np.random.normal(0,sd_stability)
+    shock_stability = rng.stream("stability_update", index).normal(0,sd_stability)
     natural_rate_current = natural_rate[index]
     if stability_pool_previous == 0:
         stability_pool = stability_initial
@@ -732,17 +814,21 @@ def stability_update(accounts, contracts, active_accounts, return_stability, ind
         i = 0
         while remaining > 0 and i < len(active_accounts):
           account = index2address(accounts, active_accounts, i)
-          balance = contracts.zsusdToken.balanceOf(account) / 1e18
+          balance_wei = contracts.zsusdToken.balanceOf(account)
+          balance = balance_wei / 1e18
           deposit = min(balance, remaining)
           if deposit > 0:
-              contracts.stabilityPool.provideToSP(floatToWei(deposit), ZERO_ADDRESS, { 'from': account, 'gas_limit': 8000000, 'allow_revert': True })
+              send(contracts, contracts.stabilityPool.provideToSP, floatToWei(deposit), ZERO_ADDRESS, { 'from': account, 'gas_limit': 8000000, 'allow_revert': True })
               remaining = remaining - deposit
+              active_accounts.note_balance(active_accounts[i]['index'], balance_wei - floatToWei(deposit))
           i = i + 1
     else:
         current_deposit = contracts.stabilityPool.getCompoundedZSUSDDeposit(accounts[0])
         if current_deposit > 0:
             new_withdraw = min(floatToWei(stability_pool_previous - stability_pool), current_deposit)
-            contracts.stabilityPool.withdrawFromSP(new_withdraw, { 'from': accounts[0] })
+            send(contracts, contracts.stabilityPool.withdrawFromSP, new_withdraw, { 'from': accounts[0] })
+
+    settle(contracts)
 
 
 """ZSUSD Price, liquidity pool, and redemption
@@ -834,13 +920,23 @@ Redemption fee revenue amounts to
 sd_redemption = 0.001
 redemption_start = 0.8
 
+# [firstRedemptionHint, partialRedemptionHintNICR, truncatedZSUSDamount, upperHint, lowerHint]
+def get_redemption_hints(contracts, zsusd_amount, price_ether_current):
+    if uses_local_hints(contracts):
+        # the price goes to the contract as brownie converts it
+        return hint_engine.redemption_hints(contracts, zsusd_amount, Wei(price_ether_current), 70)
+    [firstRedemptionHint, partialRedemptionHintNICR, truncatedZSUSDamount] = contracts.hintHelpers.getRedemptionHints(zsusd_amount, price_ether_current, 70)
+    if truncatedZSUSDamount == Wei(0):
+        return [firstRedemptionHint, partialRedemptionHintNICR, truncatedZSUSDamount, ZERO_ADDRESS, ZERO_ADDRESS]
+    approxHint = contracts.hintHelpers.getApproxHint(partialRedemptionHintNICR, 2000, 0)
+    hints = contracts.sortedTroves.findInsertPosition(partialRedemptionHintNICR, approxHint[0], approxHint[0])
+    return [firstRedemptionHint, partialRedemptionHintNICR, truncatedZSUSDamount, hints[0], hints[1]]
+
 def redeem_trove(accounts, contracts, i, price_ether_current):
     zsusd_balance = contracts.zsusdToken.balanceOf(accounts[i])
-    [firstRedemptionHint, partialRedemptionHintNICR, truncatedZSUSDamount] = contracts.hintHelpers.getRedemptionHints(zsusd_balance, price_ether_current, 70)
+    [firstRedemptionHint, partialRedemptionHintNICR, truncatedZSUSDamount, *hints] = get_redemption_hints(contracts, zsusd_balance, price_ether_current)
     if truncatedZSUSDamount == Wei(0):
         return None
-    approxHint = contracts.hintHelpers.getApproxHint(partialRedemptionHintNICR, 2000, 0)
-    hints = contracts.sortedTroves.findInsertPosition(partialRedemptionHintNICR, approxHint[0], approxHint[0])
     try:
         tx = contracts.troveManager.redeemCollateral(
             truncatedZSUSDamount,
@@ -862,10 +958,6 @@ def redeem_trove(accounts, contracts, i, price_ether_current):
         print(f"ZSUSD bal: {zsusd_balance / 1e18}")
         print(f"truncated: {truncatedZSUSDamount / 1e18}")
         print(f"Redemption rate: {contracts.troveManager.getRedemptionRateWithDecay() * 100 / 1e18} %")
-        print(f"approx: {approxHint[0]}")
-        print(f"diff: {approxHint[1]}")
-        print(f"diff: {approxHint[1] / 1e18}")
-        print(f"seed: {approxHint[2]}")
         print(f"amount: {truncatedZSUSDamount}")
         print(f"first: {firstRedemptionHint}")
         print(f"hint: {hints[0]}")
@@ -889,8 +981,7 @@ def price_stabilizer(accounts, contracts, active_accounts, inactive_accounts, pr
     liquidity_pool = supply - stability_pool
 
     # next iteration step for liquidity pool
-    np.random.seed(20*index)
-    shock_liquidity = np.random.normal(0,sd_liquidity)
+    shock_liquidity = rng.stream("price_stabilizer.liquidity", index).normal(0,sd_liquidity)
 
     liquidity_pool_next = liquidity_pool * drift_liquidity * (1+shock_liquidity)
 
@@ -918,8 +1009,7 @@ def price_stabilizer(accounts, contracts, active_accounts, inactive_accounts, pr
 
     #Floor Arbitrageurs
     if price_ZSUSD_current < 1 - rate_redemption:
-        np.random.seed(30*index)
-        shock_redemption = np.random.normal(0, sd_redemption)
+        shock_redemption = rng.stream("price_stabilizer.redemption", index).normal(0, sd_redemption)
         redemption_ratio = max(1, redemption_start * (1+shock_redemption))
 
         supply_target = stability_pool + \
@@ -948,7 +1038,7 @@ def price_stabilizer(accounts, contracts, active_accounts, inactive_accounts, pr
                     accounts,
                     active_accounts,
                     inactive_accounts,
-                    filter(lambda e: e['coll'] == 0, tx.events['TroveUpdated']),
+                    filter(lambda e: e['_coll'] == 0, tx.events['TroveUpdated']),
                     '_borrower'
                   )
                   remaining = remaining - redemption
@@ -964,18 +1054,16 @@ def price_stabilizer(accounts, contracts, active_accounts, inactive_accounts, pr
 
 def ZERO_market(index, data):
     #quantity_ZERO = (ZERO_total_supply/3)*(1-0.5**(index/period))
-    np.random.seed(2+3*index)
     if index <= month:
         price_ZERO_current = price_ZERO[index-1]
-        annualized_earning = (index/month)**0.5 * np.random.normal(200000000,500000)
+        annualized_earning = (index/month)**0.5 * rng.stream("ZERO_market", index).normal(200000000,500000)
     else:
-        revenue_issuance = sum(data['issuance_fee'][index - month:index])
-        revenue_redemption = sum(data['redemption_fee'][index - month:index])
-        annualized_earning = 365 * (revenue_issuance+revenue_redemption) / 30
+        annualized_earning = 365 * data['fee_month'].sum / 30
         #discounting factor to factor in the risk in early days
         discount=index/period
         price_ZERO_current = discount * PE_ratio * annualized_earning / ZERO_total_supply
 
     #MC_ZERO_current = price_ZERO_current * quantity_ZERO
+    data['fee_month'].push(data['issuance_fee'][index] + data['redemption_fee'][index])
 
     return [price_ZERO_current, annualized_earning]
@@ -1,13 +1,16 @@
 import pytest
 
-import csv
+import time
 
 from brownie import *
 from accounts import *
 from helpers import *
 from simulation_helpers import *
-
-class Contracts: pass
+from shadow_ledger import ShadowLedger, MirroredContracts, shadow_accounts
+from checkpoint import save_checkpoint, load_checkpoint, require_persistent_chain
+from results_sink import open_results
+from account_registry import AccountRegistry
+from event_sync import SyncedContracts
 
 
 def setAddresses(contracts):
@@ -101,14 +104,47 @@ def setAddresses(contracts):
         { 'from': accounts[0] }
     )
 
+    # batched reads
+    contracts.multiTroveGetter.setAddresses(
+        contracts.troveManager.address,
+        contracts.sortedTroves.address,
+        { 'from': accounts[0] }
+    )
+
 @pytest.fixture
 def add_accounts():
-    if network.show_active() != 'development':
+    # the local dev chains (run_simulations.py runs one per worker) come with their own accounts
+    if shadow_mode != 'offline' and not network.show_active().startswith('development'):
         print("Importing accounts...")
         import_accounts(accounts)
 
+# (contracts, index, state) of the checkpoint the run resumes from, if any
+@pytest.fixture
+def checkpoint():
+    if resume_checkpoint is None:
+        return None
+    return load_checkpoint(resume_checkpoint, globals())
+
+# the accounts the simulation runs with: those of the chain, or on the shadow ledger alone
+# addresses of its own
+@pytest.fixture
+def simulation_accounts():
+    if shadow_mode == 'offline':
+        return shadow_accounts(shadow_account_count)
+    return accounts
+
+def synced(contracts):
+    return SyncedContracts(contracts) if event_sync else contracts
+
 @pytest.fixture
-def contracts():
+def contracts(checkpoint):
+    if checkpoint is not None:
+        return checkpoint[0] if isinstance(checkpoint[0], ShadowLedger) else synced(checkpoint[0])
+    if shadow_mode == 'offline':
+        return ShadowLedger()
+    if checkpoint_every:
+        require_persistent_chain()
+
     contracts = Contracts()
 
     contracts.priceFeedTestnet = PriceFeedTestnet.deploy({ 'from': accounts[0] })
@@ -139,10 +175,16 @@ def contracts():
         accounts[0],  # multisigAddress
         { 'from': accounts[0] }
     )
+    # batched reads
+    contracts.multiTroveGetter = MultiTroveGetter.deploy({ 'from': accounts[0] })
+    contracts.multicall = Multicall.deploy({ 'from': accounts[0] })
 
     setAddresses(contracts)
 
-    return contracts
+    if shadow_mode == 'verify':
+        shadow = ShadowLedger(timestamp=chain.time(), deployment_time=contracts.zeroToken.getDeploymentStartTime())
+        return synced(MirroredContracts(contracts, shadow))
+    return synced(contracts)
 
 @pytest.fixture
 def print_expectations():
@@ -187,41 +229,64 @@ def _test_test(contracts):
 * redemption & redemption fee
 * ZERO pool return determined
 """
-def test_run_simulation(add_accounts, contracts, print_expectations):
+def test_run_simulation(add_accounts, simulation_accounts, contracts, checkpoint, print_expectations):
+    accounts = simulation_accounts
     ZSUSD_GAS_COMPENSATION = contracts.troveManager.ZSUSD_GAS_COMPENSATION() / 1e18
     MIN_NET_DEBT = contracts.troveManager.MIN_NET_DEBT() / 1e18
 
-    contracts.priceFeedTestnet.setPrice(floatToWei(price_ether[0]), { 'from': accounts[0] })
-    # whale
-    whale_coll = 30000.0
-    contracts.borrowerOperations.openTrove(MAX_FEE, Wei(10e24), ZERO_ADDRESS, ZERO_ADDRESS,
-                                           { 'from': accounts[0], 'value': floatToWei(whale_coll) })
-    contracts.stabilityPool.provideToSP(floatToWei(stability_initial), ZERO_ADDRESS, { 'from': accounts[0] })
-
-    active_accounts = []
-    inactive_accounts = [*range(1, len(accounts))]
-
-    price_ZSUSD = 1
-    price_ZERO_current = price_ZERO_initial
-
-    data = {"airdrop_gain": [0] * n_sim, "liquidation_gain": [0] * n_sim, "issuance_fee": [0] * n_sim, "redemption_fee": [0] * n_sim}
-    total_zsusd_redempted = 0
-    total_coll_added = whale_coll
-    total_coll_liquidated = 0
+    if checkpoint is not None:
+        _, start_index, state = checkpoint
+        (active_accounts, inactive_accounts, price_ZSUSD, price_ZERO_current, data, total_zsusd_redempted,
+         total_coll_added, total_coll_liquidated, rows) = state
+        print(f"Resuming from step {start_index}")
+    else:
+        contracts.priceFeedTestnet.setPrice(floatToWei(price_ether[0]), { 'from': accounts[0] })
+        # whale
+        whale_coll = 30000.0
+        contracts.borrowerOperations.openTrove(MAX_FEE, Wei(10e24), ZERO_ADDRESS, ZERO_ADDRESS,
+                                               { 'from': accounts[0], 'value': floatToWei(whale_coll) })
+        contracts.stabilityPool.provideToSP(floatToWei(stability_initial), ZERO_ADDRESS, { 'from': accounts[0] })
+
+        active_accounts = AccountRegistry()
+        inactive_accounts = [*range(1, len(accounts))]
+
+        price_ZSUSD = 1
+        price_ZERO_current = price_ZERO_initial
+
+        data = new_simulation_data()
+        total_zsusd_redempted = 0
+        total_coll_added = whale_coll
+        total_coll_liquidated = 0
+        # csv rows so far, kept in the checkpoints so that a resumed run writes the whole file
+        rows = []
+        start_index = 1
 
     print(f"Accounts: {len(accounts)}")
-    print(f"Network: {network.show_active()}")
+    print(f"Network: {'none, shadow ledger only' if shadow_mode == 'offline' else network.show_active()}")
 
     logGlobalState(contracts)
 
-    with open('tests/simulation.csv', 'w', newline='') as csvfile:
-        datawriter = csv.writer(csvfile, delimiter=',')
-        datawriter.writerow(['iteration', 'ETH_price', 'price_ZSUSD', 'price_ZERO', 'num_troves', 'total_coll', 'total_debt', 'TCR', 'recovery_mode', 'last_ICR', 'SP_ZSUSD', 'SP_ETH', 'total_coll_added', 'total_coll_liquidated', 'total_zsusd_redempted'])
+    with open_results(simulation_csv, results_format, results_binary_log, results_flush_every) as results:
+        # rows of the steps before a checkpoint the run resumes from, without their timings
+        for row in rows:
+            results.write(row)
+
+        # seconds since the previous call, as timings[name]
+        def timed(name):
+            nonlocal lap
+            now = time.perf_counter()
+            timings[name] = now - lap
+            lap = now
 
         #Simulation Process
-        for index in range(1, n_sim):
-            print('\n  --> Iteration', index)
-            print('  -------------------\n')
+        for index in range(start_index, n_sim):
+            verbose = index % log_every == 0
+            timings = {}
+            step_start = lap = time.perf_counter()
+
+            if verbose:
+                print('\n  --> Iteration', index)
+                print('  -------------------\n')
             #exogenous ether price input
             price_ether_current = price_ether[index]
             contracts.priceFeedTestnet.setPrice(floatToWei(price_ether_current), { 'from': accounts[0] })
@@ -230,26 +295,33 @@ def test_run_simulation(add_accounts, contracts, print_expectations):
             result_liquidation = liquidate_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, price_ZERO_current, data, index)
             total_coll_liquidated = total_coll_liquidated + result_liquidation[0]
             return_stability = result_liquidation[1]
+            timed('time_liquidation')
 
             #close troves
             result_close = close_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, index)
+            timed('time_close')
 
             #adjust troves
             [coll_added_adjust, issuance_ZSUSD_adjust] = adjust_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, index)
+            timed('time_adjust')
 
             #open troves
             [coll_added_open, issuance_ZSUSD_open] = open_troves(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, index)
             total_coll_added = total_coll_added + coll_added_adjust + coll_added_open
             #active_accounts.sort(key=lambda a : a.get('CR_initial'))
+            timed('time_open')
 
             #Stability Pool
             stability_update(accounts, contracts, active_accounts, return_stability, index)
+            timed('time_stability')
 
             #Calculating Price, Liquidity Pool, and Redemption
             [price_ZSUSD, redemption_pool, redemption_fee, issuance_ZSUSD_stabilizer] = price_stabilizer(accounts, contracts, active_accounts, inactive_accounts, price_ether_current, price_ZSUSD, index)
             total_zsusd_redempted = total_zsusd_redempted + redemption_pool
-            print('ZSUSD price', price_ZSUSD)
-            print('ZERO price', price_ZERO_current)
+            timed('time_stabilizer')
+            if verbose:
+                print('ZSUSD price', price_ZSUSD)
+                print('ZERO price', price_ZERO_current)
 
             issuance_fee = price_ZSUSD * (issuance_ZSUSD_adjust + issuance_ZSUSD_open + issuance_ZSUSD_stabilizer)
             data['issuance_fee'][index] = issuance_fee
@@ -261,13 +333,27 @@ def test_run_simulation(add_accounts, contracts, print_expectations):
             #annualized_earning = result_ZERO[1]
             #MC_ZERO_current = result_ZERO[2]
 
-            [ETH_price, num_troves, total_coll, total_debt, TCR, recovery_mode, last_ICR, SP_ZSUSD, SP_ETH] = logGlobalState(contracts)
-            print('Total redempted ', total_zsusd_redempted)
-            print('Total ETH added ', total_coll_added)
-            print('Total ETH liquid', total_coll_liquidated)
-            print(f'Ratio ETH liquid {100 * total_coll_liquidated / total_coll_added}%')
-            print(' ----------------------\n')
+            [ETH_price, num_troves, total_coll, total_debt, TCR, recovery_mode, last_ICR, SP_ZSUSD, SP_ETH] = logGlobalState(contracts, verbose)
+            if verbose:
+                print('Total redempted ', total_zsusd_redempted)
+                print('Total ETH added ', total_coll_added)
+                print('Total ETH liquid', total_coll_liquidated)
+                print(f'Ratio ETH liquid {100 * total_coll_liquidated / total_coll_added}%')
+                print(' ----------------------\n')
 
-            datawriter.writerow([index, ETH_price, price_ZSUSD, price_ZERO_current, num_troves, total_coll, total_debt, TCR, recovery_mode, last_ICR, SP_ZSUSD, SP_ETH, total_coll_added, total_coll_liquidated, total_zsusd_redempted])
+            row = [index, ETH_price, price_ZSUSD, price_ZERO_current, num_troves, total_coll, total_debt, TCR, recovery_mode, last_ICR, SP_ZSUSD, SP_ETH, total_coll_added, total_coll_liquidated, total_zsusd_redempted]
+            timings['time_step'] = time.perf_counter() - step_start
+            results.write(row, timings)
+            rows.append(row)
 
             assert price_ZSUSD > 0
+
+            if shadow_mode == 'verify' and index % shadow_verify_every == 0:
+                contracts.verify(accounts)
+
+            if checkpoint_every and index % checkpoint_every == 0:
+                state = (active_accounts, inactive_accounts, price_ZSUSD, price_ZERO_current, data, total_zsusd_redempted,
+                         total_coll_added, total_coll_liquidated, rows)
+                # the results on disk go as far as the checkpoint
+                results.flush()
+                save_checkpoint(checkpoint_path, contracts, index + 1, state)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+import sweep
+
+# The memo of sweep (model/sweep.py): a sweep evaluates only the points, or the metrics of a
+# point, that no earlier sweep on the same model and ETH price path scored, and scores them
+# as evaluating each point on its own does.
+
+METRICS = ['peg_deviation', 'base_fee_volatility']
+
+# a cache that notes the points it is given scores of
+class RecordingCache(dict):
+    def __init__(self):
+        super().__init__()
+        self.written = []
+
+    def __setitem__(self, key, scores):
+        self.written.append(key)
+        super().__setitem__(key, scores)
+
+@pytest.fixture(scope='module')
+def ETH_prices():
+    return sweep.default_ETH_prices('model_v2', n_steps=40)
+
+def keys_of(points, ETH_prices):
+    return [sweep.point_key('model_v2', point, ETH_prices) for point in points]
+
+def test_overlapping_sweep_evaluates_only_new_points(ETH_prices):
+    points = sweep.latin_hypercube(6, D=(0, 1), T=(0.5, 5), lookback=(1, 20))
+    keys = keys_of(points, ETH_prices)
+    cache = RecordingCache()
+    sweep.sweep('model_v2', points[:4], METRICS, ETH_prices, workers=2, cache=cache)
+    assert sorted(cache.written) == sorted(keys[:4])
+
+    cache.written = []
+    table = sweep.sweep('model_v2', points[2:], METRICS, ETH_prices, workers=2, cache=cache)
+    assert sorted(cache.written) == sorted(keys[4:])
+    for _, row in table.iterrows():
+        point = {'D': row['D'], 'T': row['T'], 'lookback': int(row['lookback'])}
+        scores = sweep.evaluate('model_v2', point, ETH_prices, METRICS)
+        np.testing.assert_array_equal(row[METRICS].to_numpy(dtype=float), [scores[metric] for metric in METRICS])
+
+def test_duplicate_points_are_evaluated_once(ETH_prices):
+    points = sweep.grid(D=[0.5, 0.5, 0.3], T=[2.0], lookback=[5])
+    cache = RecordingCache()
+    table = sweep.sweep('model_v2', points, METRICS, ETH_prices, workers=1, cache=cache)
+    assert len(cache.written) == 2
+    assert len(table) == 3
+
+def test_new_metric_evaluates_cached_points_again(ETH_prices):
+    points = sweep.grid(D=[0.2, 0.8], T=[1.0], lookback=[3])
+    cache = RecordingCache()
+    sweep.sweep('model_v2', points, METRICS[:1], ETH_prices, workers=1, cache=cache)
+    first = {key: dict(scores) for key, scores in cache.items()}
+    cache.written = []
+    sweep.sweep('model_v2', points, METRICS, ETH_prices, workers=1, cache=cache)
+    assert sorted(cache.written) == sorted(keys_of(points, ETH_prices))
+    # the scores of the first sweep are kept alongside
+    for key, scores in cache.items():
+        assert set(scores) == set(METRICS)
+        assert scores[METRICS[0]] == first[key][METRICS[0]]
+
+def test_another_price_path_is_another_point(ETH_prices):
+    point = {'D': 0.5, 'T': 1.0, 'lookback': 5}
+    assert sweep.point_key('model_v2', point, ETH_prices) != sweep.point_key('model_v2', point, ETH_prices[:-1])
+    assert sweep.point_key('model_v2', point, ETH_prices) != sweep.point_key('model', point, ETH_prices)
+    # and the order the parameters are given in does not matter
+    assert sweep.point_key('model_v2', point, ETH_prices) == \
+        sweep.point_key('model_v2', dict(reversed(list(point.items()))), ETH_prices)
+
+def test_unknown_metric_or_parameter(ETH_prices):
+    with pytest.raises(ValueError, match='unknown metrics'):
+        sweep.sweep('model_v2', [{'D': 0.5}], ['peg'], ETH_prices, cache={})
+    with pytest.raises(ValueError, match='no parameter'):
+        sweep.evaluate('model_v2', {'E': 0.5}, ETH_prices, METRICS)
+
+def test_latin_hypercube_covers_every_stratum():
+    points = sweep.latin_hypercube(10, seed=3, D=(0, 1), lookback=(1, 10))
+    assert sorted(int(point['D'] * 10) for point in points) == list(range(10))
+    assert sorted(point['lookback'] for point in points) == list(range(1, 11))
@@ -0,0 +1,275 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from trove_book import COLUMNS, RESYNC_EVERY, TroveBook
+
+# The macro model's TroveBook (macroModel/trove_book.py) against the pandas DataFrame it
+# replaced: the same operations on both must leave the same troves, in the same order.
+
+def random_troves(rng, n, ether_price=2000.0):
+    cr_initial = rng.uniform(1.2, 3.0, n)
+    supply = rng.uniform(2000, 20000, n)
+    return pd.DataFrame({
+        'Ether_Price': np.full(n, ether_price),
+        'Ether_Quantity': cr_initial * supply / ether_price,
+        'CR_initial': cr_initial,
+        'Supply': supply,
+        'Rational_inattention': rng.uniform(0.05, 0.3, n),
+        'CR_current': cr_initial,
+    })
+
+def book_of(frame, capacity=4, **options):
+    book = TroveBook(capacity=capacity, **options)
+    book.extend(*(frame[name].to_numpy() for name in COLUMNS))
+    return book
+
+def assert_same(book, frame):
+    pd.testing.assert_frame_equal(book.to_frame(), frame[list(COLUMNS)].reset_index(drop=True))
+
+def test_empty_book():
+    book = TroveBook()
+    assert len(book) == 0
+    book.extend(*([] for _ in COLUMNS))
+    book.discard([])
+    book.keep([])
+    book.sort_by('CR_current')
+    book.compact()
+    assert len(book) == 0
+    assert book['Supply'].size == 0
+    assert_same(book, random_troves(np.random.default_rng(0), 0))
+
+def test_append_grows_past_capacity():
+    frame = random_troves(np.random.default_rng(1), 9)
+    book = TroveBook(capacity=1)
+    for row in frame.itertuples(index=False):
+        book.append(*row)
+    assert_same(book, frame)
+
+def test_extend_broadcasts_scalars():
+    frame = random_troves(np.random.default_rng(2), 5)
+    book = TroveBook()
+    # CR_current defaults to CR_initial, as a trove opens at its initial ratio
+    book.extend(2000.0, *(frame[name].to_numpy() for name in COLUMNS[1:-1]))
+    assert_same(book, frame)
+
+def test_tombstones_until_compaction():
+    frame = random_troves(np.random.default_rng(3), 10)
+    book = book_of(frame)
+    book.discard([1, 4])
+    assert len(book) == 8
+    # positions refer to the live troves: this is the trove first at position 3
+    book.discard([2])
+    book.keep(np.arange(len(book)) != 0)
+    assert len(book) == 6
+    assert_same(book, frame.drop([0, 1, 3, 4]))
+
+def test_appending_after_tombstones_keeps_order():
+    rng = np.random.default_rng(4)
+    frame = random_troves(rng, 6)
+    book = book_of(frame)
+    book.discard([0, 5])
+    rows = random_troves(rng, 3)
+    book.extend(*(rows[name].to_numpy() for name in COLUMNS))
+    book.append(*rows.iloc[0])
+    assert_same(book, pd.concat([frame.drop([0, 5]), rows, rows.iloc[[0]]]))
+
+def test_keep_matches_boolean_mask():
+    frame = random_troves(np.random.default_rng(5), 20)
+    book = book_of(frame)
+    book.keep(book['CR_current'] >= 2)
+    assert_same(book, frame[frame['CR_current'] >= 2])
+    book.keep(np.zeros(len(book), dtype=bool))
+    assert len(book) == 0
+
+@pytest.mark.parametrize('position', [0, 3, 9])
+def test_swap_remove_moves_the_last_trove(position):
+    frame = random_troves(np.random.default_rng(6), 10)
+    book = book_of(frame)
+    book.swap_remove(position)
+    order = [9 if i == position else i for i in range(9)]
+    assert_same(book, frame.iloc[order])
+
+def test_sort_by_matches_sort_values_with_ties():
+    frame = random_troves(np.random.default_rng(7), 40)
+    frame['CR_current'] = frame['CR_current'].round(1)
+    book = book_of(frame)
+    book.discard([5, 6])
+    book.sort_by('CR_current')
+    assert_same(book, frame.drop([5, 6]).sort_values(by='CR_current'))
+
+def test_column_views_skip_tombstones():
+    frame = random_troves(np.random.default_rng(8), 8)
+    book = book_of(frame)
+    book.discard([2])
+    np.testing.assert_array_equal(book['Supply'], frame['Supply'].drop(2).to_numpy())
+    book['Ether_Price'] = 1500.0
+    book['Supply'][0] = 1.0
+    frame = frame.drop(2)
+    frame['Ether_Price'] = 1500.0
+    frame.iloc[0, frame.columns.get_loc('Supply')] = 1.0
+    assert_same(book, frame)
+
+def test_lazy_CR_matches_full_recomputation():
+    rng = np.random.default_rng(7)
+    frame = random_troves(rng, 100)
+    book = book_of(frame)
+    for ether_price in (1500.0, 2500.0, 900.0):
+        book['Ether_Price'] = ether_price
+        book.invalidate_CR()
+        frame['Ether_Price'] = ether_price
+        frame['CR_current'] = frame['Ether_Price'] * frame['Ether_Quantity'] / frame['Supply']
+        positions = rng.choice(len(frame), 10, replace=False)
+        np.testing.assert_array_equal(book.current_CR(positions), frame['CR_current'].to_numpy()[positions])
+        assert_same(book, frame)
+
+def test_lazy_CR_after_tombstones():
+    frame = random_troves(np.random.default_rng(9), 10)
+    book = book_of(frame)
+    book.discard([0, 4])
+    book['Ether_Price'] = 1000.0
+    book.invalidate_CR()
+    frame = frame.drop([0, 4])
+    frame['Ether_Price'] = 1000.0
+    frame['CR_current'] = frame['Ether_Price'] * frame['Ether_Quantity'] / frame['Supply']
+    # positions among the live troves, not storage slots
+    np.testing.assert_array_equal(book.current_CR([0, 3]), frame['CR_current'].to_numpy()[[0, 3]])
+    assert_same(book, frame)
+
+# the redemption loop of macro_model.py before TroveBook.redeem
+def redeem_with_loop(troves, redemption_pool, price_ether_current):
+    troves = troves.sort_values(by='CR_current', ascending=True)
+    n_redempt = 0
+    quantity_working_trove = troves['Supply'][troves.index[0]]
+    redempted = quantity_working_trove
+    while redempted <= redemption_pool:
+        troves = troves.drop(troves.index[0])
+        quantity_working_trove = troves['Supply'][troves.index[0]]
+        redempted = redempted + quantity_working_trove
+        n_redempt = n_redempt + 1
+    redempted = redempted - quantity_working_trove
+    residual = redemption_pool - redempted
+    wk = troves.index[0]
+    troves.loc[wk, 'Supply'] = troves['Supply'][wk] - residual
+    troves.loc[wk, 'Ether_Quantity'] = troves['Ether_Quantity'][wk] - residual / price_ether_current
+    troves.loc[wk, 'CR_current'] = price_ether_current * troves['Ether_Quantity'][wk] / troves['Supply'][wk]
+    return troves, n_redempt
+
+def assert_redeems_as_loop(frame, amount, ether_price=2000.0, book=None):
+    book = book_of(frame) if book is None else book
+    n_redempt = book.redeem(amount, ether_price)
+    expected, expected_n_redempt = redeem_with_loop(frame, amount, ether_price)
+    assert n_redempt == expected_n_redempt
+    assert_same(book, expected)
+    return n_redempt
+
+def test_redeem_within_the_first_trove():
+    frame = random_troves(np.random.default_rng(20), 10)
+    assert assert_redeems_as_loop(frame, 0.0) == 0
+    first = frame['Supply'][frame['CR_current'].idxmin()]
+    assert assert_redeems_as_loop(frame, first / 2) == 0
+
+def test_redeem_exactly_the_first_troves():
+    frame = random_troves(np.random.default_rng(21), 10)
+    supplies = np.cumsum(frame.sort_values(by='CR_current')['Supply'].to_numpy())
+    # an amount that covers a trove exactly takes it out, and nothing from the next
+    assert assert_redeems_as_loop(frame, float(supplies[2])) == 3
+    assert assert_redeems_as_loop(frame, float(np.nextafter(supplies[2], 0))) == 2
+
+def test_redeem_among_ties():
+    frame = random_troves(np.random.default_rng(22), 30)
+    frame['CR_current'] = frame['CR_current'].round(1)
+    assert assert_redeems_as_loop(frame, float(frame['Supply'].sum() / 3)) > 0
+
+def test_redeem_after_tombstones():
+    frame = random_troves(np.random.default_rng(23), 20)
+    book = book_of(frame)
+    book.discard([0, 7, 19])
+    assert_redeems_as_loop(frame.drop([0, 7, 19]), float(frame['Supply'].sum() / 4), book=book)
+
+@pytest.mark.parametrize('extra', [0.0, 1.0])
+def test_redeem_the_whole_book_raises(extra):
+    frame = random_troves(np.random.default_rng(24), 5)
+    # as the loop did, even redeeming exactly all of it: it looks for a trove past the last
+    amount = float(np.cumsum(frame.sort_values(by='CR_current')['Supply'].to_numpy())[-1]) + extra
+    with pytest.raises(IndexError):
+        redeem_with_loop(frame, amount, 2000.0)
+    with pytest.raises(IndexError):
+        book_of(frame).redeem(amount, 2000.0)
+    with pytest.raises(IndexError):
+        TroveBook().redeem(1.0, 2000.0)
+
+def assert_totals(book):
+    for name in ('Supply', 'Ether_Quantity'):
+        assert book.total(name) == pytest.approx(math.fsum(book[name]), rel=1e-12)
+
+def test_totals_without_running_totals_sum_the_column():
+    rng = np.random.default_rng(12)
+    book = book_of(random_troves(rng, 50))
+    assert not book._counted and not book._totals
+    book.discard([3, 7])
+    book['Supply'][:10] *= 1.5
+    for name in ('Supply', 'Ether_Quantity'):
+        assert book.total(name) == book[name].sum()
+
+def test_totals_of_an_empty_book():
+    book = TroveBook(running_totals=True, check_totals=True)
+    assert book.total('Supply') == 0.0 and book.total('Ether_Quantity') == 0.0
+    book.extend(2000.0, [1.0, 2.0], 1.5, [3000.0, 3000.0], 0.1)
+    book.discard([0, 1])
+    assert_totals(book)
+    assert book.total('Supply') == 0.0
+
+def test_totals_follow_every_change():
+    rng = np.random.default_rng(10)
+    frame = random_troves(rng, 50)
+    book = TroveBook(capacity=4, running_totals=True, check_totals=True)
+    book.extend(*(frame[name].to_numpy() for name in COLUMNS))
+    assert_totals(book)
+    # a trove discarded twice, in the same call and again later, is taken out once
+    book.discard([3, 3, 7])
+    book.discard([])
+    assert_totals(book)
+    book.keep(np.arange(len(book)) % 5 != 0)
+    book.swap_remove(0)
+    assert_totals(book)
+    book['Supply'][:10] *= 1.5
+    book.touch(np.arange(10))
+    # touching a trove that did not change leaves the totals as they are
+    book.touch(np.arange(5))
+    assert_totals(book)
+    book['Ether_Quantity'] = book['Ether_Quantity'] * 0.9
+    assert_totals(book)
+    book.extend(*(random_troves(rng, 5)[name].to_numpy() for name in COLUMNS))
+    book.redeem(book['Supply'][:3].sum() + 1.0, 2000.0)
+    assert_totals(book)
+    assert book.TCR(1500.0) == pytest.approx(1500.0 * math.fsum(book['Ether_Quantity']) / math.fsum(book['Supply']))
+
+def test_totals_are_summed_again_from_the_columns():
+    book = TroveBook(running_totals=True)
+    # cancelling values that a running float rounds away
+    book.extend(2000.0, 1.0, 1.5, [1e16, 1.0, 1.0], 0.1)
+    book.discard([0])
+    assert book.total('Supply') == 0.0 and book['Supply'].sum() == 2.0
+    # once enough values have changed, the drift is gone
+    supply = book['Supply']
+    for i in range(RESYNC_EVERY):
+        supply[0] = 1.0 + i % 2
+        book.touch([0])
+    assert book.total('Supply') == book['Supply'].sum()
+
+def test_non_finite_values_leave_the_total_once_taken_out():
+    book = TroveBook(running_totals=True, check_totals=True)
+    book.extend(2000.0, 1.0, 1.5, [1.0, np.inf, 2.0, np.nan], 0.1)
+    assert math.isnan(book.total('Supply'))
+    book.discard([3])
+    assert book.total('Supply') == np.inf
+    book.discard([1])
+    assert book.total('Supply') == 3.0
+    with np.errstate(invalid='ignore'):
+        book.extend(2000.0, 1.0, 1.5, [np.inf, -np.inf], 0.1)
+        assert math.isnan(book.total('Supply'))
+    book.discard([2])
+    assert book.total('Supply') == -np.inf
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor
+
+# Transactions sent one after the other without waiting for their receipts, which are gathered
+# together at the end (settle) instead of polled for one by one.
+#
+#   pipeline = TxPipeline()
+#   pipeline.send(contracts.borrowerOperations.repayZSUSD, amount, upper, lower, { 'from': account })
+#   ...
+#   pipeline.settle()  # waits for every receipt, raises if a transaction reverted
+#
+# Each account's nonce is read once and then counted up, so its transactions go in the order
+# they are sent. They are in brownie's `history` from the moment they are sent, and an
+# EventFollower (see event_sync.py) waits for a transaction's receipt before it applies its
+# events, so the views kept from the events stay in the order of the transactions.
+#
+# Only for dev chains that mine each transaction as it arrives (ganache's default): the views
+# read from the chain between two sends must see the first one.
+
+class TransactionReverted(Exception):
+    pass
+
+class TxPipeline:
+    def __init__(self, workers=8):
+        self.workers = workers  # receipts gathered at the same time
+        self.nonces = {}  # address -> nonce of its next transaction
+        self.pending = []  # (transaction, whether it may revert), in the order sent
+
+    # Sends `method(*args)`, whose last argument is the transaction dict
+    def send(self, method, *args):
+        *args, params = args
+        account = params['from']
+        nonce = self.nonces.get(str(account))
+        if nonce is None:
+            nonce = account.nonce
+        try:
+            tx = method(*args, {**params, 'nonce': nonce, 'required_confs': 0})
+        except Exception:
+            # not sent (e.g. its gas estimate reverted): the nonce is still free
+            self.nonces[str(account)] = nonce
+            raise
+        self.nonces[str(account)] = nonce + 1
+        self.pending.append((tx, params.get('allow_revert', False)))
+        return tx
+
+    # Waits for the receipts of all the transactions sent, and forgets the nonces
+    def settle(self):
+        pending, self.pending = self.pending, []
+        self.nonces = {}
+        if not pending:
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(lambda item: item[0].wait(1), pending))
+        for tx, allow_revert in pending:
+            if tx.status == 0 and not allow_revert:
+                raise TransactionReverted(f'{tx.fn_name} from {tx.sender} reverted: {tx.revert_msg}')